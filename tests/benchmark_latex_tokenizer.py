@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""Compare the LaTeX tokenizer against the previous, character-by-character implementation.
+
+Checks that both produce the same tokens and reports their speed::
+
+    python -m tests.benchmark_latex_tokenizer [file.tex ...]
+
+Without arguments, a generated document is used.
+"""
+from __future__ import unicode_literals
+
+import sys
+import timeit
+
+from v7.latex.latex.tokenizer import Token, TokenStream, _compute_position
+
+
+class ReferenceTokenizer:
+    """The tokenizer as it was before it used regular expressions."""
+
+    def _is_whitespace(self, char):
+        """Check for whitespace."""
+        return ord(char) <= 32
+
+    def _is_line_break(self, char):
+        """Check for line breaks."""
+        return ord(char) == 10 or ord(char) == 13
+
+    def _is_command_char(self, char):
+        """Check for a command character."""
+        return (char >= 'A' and char <= 'Z') or (char >= 'a' and char <= 'z') or (char == '@')
+
+    def _eat_whitespace(self):
+        """Skip whitespace and return number of contained line breaks."""
+        number_of_line_breaks = 0
+        last_line_break = None
+        while self._position < len(self._input):
+            if not self._is_whitespace(self._input[self._position]):
+                break
+            if self._is_line_break(self._input[self._position]):
+                if last_line_break is None or last_line_break == self._input[self._position]:
+                    number_of_line_breaks += 1
+                last_line_break = self._input[self._position]
+            else:
+                last_line_break = None
+            self._position += 1
+        return number_of_line_breaks
+
+    def _eat_comment(self):
+        """Skip comment's content."""
+        start = self._position
+        last_line_break = None
+        had_line_break = False
+        while self._position < len(self._input):
+            if had_line_break and not self._is_whitespace(self._input[self._position]):
+                break
+            if self._is_line_break(self._input[self._position]):
+                if last_line_break is None or last_line_break == self._input[self._position]:
+                    if had_line_break:
+                        break
+                last_line_break = self._input[self._position]
+                had_line_break = True
+            else:
+                last_line_break = None
+            self._position += 1
+        return self._input[start:self._position]
+
+    def _read_text(self, strict):
+        """Read text."""
+        start = self._position
+        while self._position < len(self._input):
+            char = self._input[self._position]
+            if self._is_whitespace(char):
+                break
+            if char == "~" or char == "{" or char == "}" or char == "$" or char == "[" or char == "]" or char == "$" or char == "\\" or char == "&":
+                break
+            if strict and not self._is_command_char(char):
+                break
+            self._position += 1
+        return self._input[start:self._position]
+
+    def _find_next(self):
+        """Find next token."""
+        self._token = None
+        self._token_value = None
+        self._token_begin_index = None
+        self._token_end_index = None
+        if (self._position >= len(self._input)):
+            return
+        self._token_begin_index = self._position
+        char = self._input[self._position]
+        if self._is_whitespace(char):
+            number_of_line_breaks = self._eat_whitespace()
+            if number_of_line_breaks > 1:
+                self._token = Token.DoubleNewLine
+            else:
+                self._token = Token.Whitespace
+        elif char == "~":
+            self._token = Token.NonbreakableWhitespace
+            self._position += 1
+        elif char == '&':
+            self._token = Token.TableColumnDelimiter
+            self._position += 1
+        elif char == "{":
+            self._token = Token.CurlyBraketOpen
+            self._position += 1
+        elif char == "}":
+            self._token = Token.CurlyBraketClose
+            self._position += 1
+        elif char == "[":
+            self._token = Token.SquareBraketOpen
+            self._position += 1
+        elif char == "]":
+            self._token = Token.SquareBraketClose
+            self._position += 1
+        elif char == "$":
+            self._token = Token.InlineFormulaDelimiter
+            self._position += 1
+            if self._position < len(self._input) and self._input[self._position] == "$":
+                self._token = Token.DisplayFormulaDelimiter
+                self._position += 1
+        elif char == "\\":
+            self._position += 1
+            if self._position == len(self._input):
+                raise "Reached end of text after '\\'"
+            self._token = Token.Command
+            cmd = self._read_text(True)
+            if len(cmd) == 0:
+                ch = self._input[self._position]
+                if ch == '(' or ch == ')' or ch == '[' or ch == ']':
+                    self._token_value = ch
+                elif ch == '\\':
+                    self._token = Token.ForcedLineBreak
+                else:
+                    self._token = Token.EscapedText
+                    self._token_value = ch
+                self._position += 1
+            else:
+                self._token_value = cmd
+        elif char == '%':
+            self._token = Token.Comment
+            self._position += 1
+            self._token_value = self._eat_comment()
+        else:
+            self._token = Token.Text
+            self._token_value = self._read_text(False)
+        self._token_end_index = self._position
+
+    def __init__(self, input):
+        """Initialize tokenizer with input unicode string ``input``."""
+        self._input = input
+        self._position = 0
+        self._find_next()
+
+    def has_token(self):
+        """Whether a token is available."""
+        return self._token is not None
+
+    def token_type(self):
+        """Return type of current token."""
+        return self._token
+
+    def token_value(self):
+        """Return value of current token."""
+        # only if token_type() returns Token.Text or Token.Command
+        return self._token_value
+
+    def token_begin_index(self):
+        """Return beginning of token in input string."""
+        return self._token_begin_index
+
+    def token_end_index(self):
+        """Return end of token in input string."""
+        return self._token_end_index
+
+    def next(self):
+        """Proceed to next token."""
+        if self._token is not None:
+            self._find_next()
+
+    def get_substring(self, start_index, end_index):
+        """Return substring of input string."""
+        return self._input[start_index:end_index]
+
+    def get_position(self, index):
+        """Retrieve position as (line, column) pair in input string."""
+        return _compute_position(self._input, index)
+
+
+class ReferenceTokenStream:
+    """The token stream as it was before it used a ring buffer."""
+
+    def _fill_ahead(self, count):
+        """Fill ahead buffer."""
+        if len(self.__ahead) < count:
+            for i in range(len(self.__ahead), count):
+                if self.__tokenizer.has_token():
+                    self.__ahead.append((self.__tokenizer.token_type(), self.__tokenizer.token_value()))
+                    self.__ahead_indices.append((self.__tokenizer.token_begin_index(), self.__tokenizer.token_end_index()))
+                    self.__tokenizer.next()
+                else:
+                    self.__ahead.append((None, None))
+                    self.__ahead_indices.append((None, None))
+
+    def __init__(self, input):
+        """Create TokenStream from input unicode string. Creates Tokenizer."""
+        self.__tokenizer = ReferenceTokenizer(input)
+        self.__ahead = list()
+        self.__ahead_indices = list()
+
+    def current(self):
+        """Get current token. Return pair (type, value)."""
+        self._fill_ahead(1)
+        return self.__ahead[0]
+
+    def current_indices(self):
+        """Get current token indices in input string."""
+        self._fill_ahead(1)
+        return self.__ahead_indices[0]
+
+    def current_type(self):
+        """Get current token type."""
+        self._fill_ahead(1)
+        return self.__ahead[0][0]
+
+    def current_value(self):
+        """Get current token value."""
+        self._fill_ahead(1)
+        return self.__ahead[0][1]
+
+    def has_current(self):
+        """Return True if current token is available."""
+        self._fill_ahead(1)
+        return self.__ahead[0][0] is not None
+
+    def skip_current(self, count=1):
+        """Skip number of tokens."""
+        assert count >= 0
+        self._fill_ahead(count)
+        self.__ahead = self.__ahead[count:]
+        self.__ahead_indices = self.__ahead_indices[count:]
+
+    def peek(self, index):
+        """Peek ahead in token stream. Return pair (type, value)."""
+        assert index >= 0
+        self._fill_ahead(index + 1)
+        return self.__ahead[index]
+
+    def peek_indices(self, index):
+        """Peek ahead in token stream. Return indices of token in input string."""
+        assert index >= 0
+        self._fill_ahead(index + 1)
+        return self.__ahead_indices[index]
+
+    def peek_type(self, index):
+        """Peek ahead in token stream. Return token's type."""
+        assert index >= 0
+        self._fill_ahead(index + 1)
+        return self.__ahead[index][0]
+
+    def peek_value(self, index):
+        """Peek ahead in token stream. Return token's value."""
+        assert index >= 0
+        self._fill_ahead(index + 1)
+        return self.__ahead[index][1]
+
+    def can_peek(self, index):
+        """Check whether token at current index + ``index`` can be peeked at, i.e. whether it exists."""
+        assert index >= 0
+        self._fill_ahead(index + 1)
+        return self.__ahead[index][0] is not None
+
+    def get_substring(self, start_index, end_index):
+        """Return substring of input string."""
+        return self.__tokenizer.get_substring(start_index, end_index)
+
+    def get_position(self, index):
+        """Retrieve position as (line, column) pair in input string."""
+        return self.__tokenizer.get_position(index)
+
+    def set_value(self, index, new_value):
+        """Set value of token at current index + ``index`` to ``new_value``.
+
+        Use with care!
+        """
+        assert index >= 0
+        self._fill_ahead(index + 1)
+        self.__ahead[index] = (self.__ahead[index][0], new_value)
+
+
+def tokenize(stream_class, input):
+    """Read all tokens the way the parser does, peeking ahead a bit before skipping."""
+    stream = stream_class(input)
+    tokens = []
+    while True:
+        token = stream.peek(0)
+        if token[0] is None:
+            return tokens
+        stream.peek(3)
+        tokens.append(token)
+        stream.skip_current()
+
+
+def sample_document(sections=200):
+    """Generate a LaTeX document with the usual mix of text, commands, formulae and comments."""
+    section = (
+        "\\section{Section about $x^2$}\\label{sec:%d}\r\n"
+        "Some text with \\emph{emphasis}, a formula $\\sum_{n=1}^\\infty a_n$~and\n"
+        "a display formula $$\\int_0^1 f(x) \\, dx$$ %% a comment\n"
+        "   \\begin{tabular}{ll} a & b \\\\ c & d \\end{tabular}\n"
+        "\n"
+        "\\[ \\alpha \\] and \\( \\beta \\) with 50\\%% of \\textbf{bold} text.\n\n"
+    )
+    return ''.join(section % i for i in range(sections))
+
+
+def main(files):
+    if files:
+        documents = []
+        for file_name in files:
+            with open(file_name, 'r', encoding='utf-8') as f:
+                documents.append((file_name, f.read()))
+    else:
+        documents = [('generated document', sample_document())]
+    for name, document in documents:
+        reference = tokenize(ReferenceTokenStream, document)
+        tokens = tokenize(TokenStream, document)
+        if tokens != reference:
+            for i, (a, b) in enumerate(zip(reference, tokens)):
+                if a != b:
+                    break
+            print('{0}: tokens differ at token #{1}: {2} != {3}'.format(name, i, a, b))
+            return 1
+        old = min(timeit.repeat(lambda: tokenize(ReferenceTokenStream, document), number=1, repeat=5))
+        new = min(timeit.repeat(lambda: tokenize(TokenStream, document), number=1, repeat=5))
+        print('{0}: {1} characters, {2} tokens, identical'.format(name, len(document), len(tokens)))
+        print('  reference: {0:.3f}s, current: {1:.3f}s, speedup {2:.1f}x'.format(old, new, old / new))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Check that the markmin Renderer gives the same html as markmin2html did, and report its speed.
+
+The markmin plugin is for python 2, so this is a script rather than a test::
+
+    python2 tests/benchmark_markmin2html.py [edits]
+
+The sample document is rendered and compared with the html the previous
+implementation produced for it (in tests/data/markmin2html).  Then the
+sample is edited a line at a time, and after every edit the output of a
+reused (memoizing) Renderer is compared with the previous implementation,
+a copy of which is kept in tests/data/markmin2html/markmin2html_previous.py.
+The timings compare the two as well.
+"""
+from __future__ import print_function
+
+import imp
+import os
+import random
+import sys
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA = os.path.join(HERE, 'data', 'markmin2html')
+sys.path.insert(0, os.path.join(HERE, os.pardir, 'v8', 'markmin', 'markmin'))
+
+from markmin2html import Renderer, markmin2html  # noqa: E402
+
+previous = imp.load_source('markmin2html_previous', os.path.join(DATA, 'markmin2html_previous.py'))
+
+
+def read(name):
+    with open(os.path.join(DATA, name), 'rb') as f:
+        return f.read()
+
+
+def edit(lines, rng):
+    """Insert, delete, duplicate or replace a random line."""
+    lines = list(lines)
+    i = rng.randrange(len(lines))
+    action = rng.choice(('insert', 'delete', 'duplicate', 'replace'))
+    if action == 'insert':
+        lines.insert(i, rng.choice(('', '- item', '+ item', '-----', 'a | b', '``', '[[', ']]', "''", '**')))
+    elif action == 'delete' and len(lines) > 1:
+        del lines[i]
+    elif action == 'duplicate':
+        lines.insert(i, lines[rng.randrange(len(lines))])
+    else:
+        lines[i] = lines[rng.randrange(len(lines))]
+    return lines
+
+
+def main(edits=500):
+    sample = read('sample.markmin')
+    failures = 0
+
+    for pretty_print, name in ((True, 'sample.html'), (False, 'sample-compact.html')):
+        expected = read(name)
+        renderer = Renderer(pretty_print=pretty_print)
+        results = [
+            previous.markmin2html(sample, pretty_print=pretty_print),
+            markmin2html(sample, pretty_print=pretty_print),
+            renderer.render(sample),
+            renderer.render(sample),  # from the memo
+        ]
+        if any(html != expected for html in results):
+            print('DIFFERENT: %s' % name)
+            failures += 1
+
+    rng = random.Random(0)
+    renderer = Renderer(pretty_print=True, memo_size=256)
+    lines = sample.split('\n')
+    for i in range(edits):
+        lines = edit(lines, rng)
+        text = '\n'.join(lines)
+        if renderer.render(text) != previous.markmin2html(text, pretty_print=True):
+            print('DIFFERENT after edit %d' % i)
+            failures += 1
+
+    document = '\n\n'.join([sample] * 10)
+    lines = document.split('\n')
+    edited = [
+        '\n'.join(lines[:i] + [lines[i] + ' edited'] + lines[i + 1:])
+        for i in range(0, len(lines), 97)
+    ]
+    renderer = Renderer(pretty_print=True)
+    renderer.render(document)
+
+    def render_edited():
+        for text in edited:
+            renderer.render(text)
+
+    number = 3
+    plain = min(timeit.repeat(lambda: previous.markmin2html(document, pretty_print=True), number=number, repeat=3)) / number
+    memo = min(timeit.repeat(render_edited, number=number, repeat=3)) / (number * len(edited))
+    print('%d bytes, previous markmin2html(): %.1f ms, Renderer after a one line edit: %.1f ms (%.1fx)' % (
+        len(document), plain * 1000, memo * 1000, plain / memo))
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*map(int, sys.argv[1:])))
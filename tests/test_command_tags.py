@@ -20,8 +20,8 @@ except ImportError:
     freeze_time = lambda x: lambda y: y
 
 from v7.tags.tags import (
-    _AutoTag, add_tags, list_tags, merge_tags, remove_tags, search_tags,
-    sort_tags
+    _AutoTag, add_tags, auto_tag_posts, list_tags, merge_tags, remove_tags,
+    search_tags, sort_tags
 )
 from nikola.utils import _reload
 
@@ -132,6 +132,44 @@ class TestCommandTagsHelpers(TestCommandTagsBase):
         tags = [tag for tag in nltk_tags if tag_pattern.search(tag)]
         assert len(tags) == 5
 
+    def test_auto_tag_cache(self, monkeypatch):
+        post = os.path.join('posts', os.listdir('posts')[0])
+        tags = _AutoTag(self._site, use_nltk=False).tag(post)
+
+        counted = []
+        count_words = _AutoTag._count_words
+
+        def _count_words(tagger, post):
+            counted.append(post.source_path)
+            return count_words(tagger, post)
+
+        monkeypatch.setattr(_AutoTag, '_count_words', _count_words)
+
+        # Nothing changed, everything comes from the cache.
+        assert _AutoTag(self._site, use_nltk=False).tag(post) == tags
+        assert counted == []
+
+        # Only the edited post is tokenized again.
+        with open(post, 'a') as f:
+            f.write('\n\nzebra zebra zebra zebra zebra zebra\n')
+        self._force_scan()
+        assert 'zebra' in _AutoTag(self._site, use_nltk=False).tag(post)
+        assert counted == [post]
+
+    def test_auto_tag_posts(self):
+        self._run_command(['new_post', '-t', 'Untagged'])
+        self._force_scan()
+        untagged = [post.source_path for post in self._site.timeline if not post.tags]
+        index = untagged.index(os.path.join('posts', 'untagged.rst'))
+
+        new_tags = auto_tag_posts(self._site, untagged_only=True, dry_run=True, processes=2)
+        assert len(new_tags) == len(untagged)
+        assert len(new_tags[index]) > 0
+        assert self._parse_new_tags(untagged[index]) == []
+
+        auto_tag_posts(self._site, untagged_only=True)
+        assert set(self._parse_new_tags(untagged[index])) == set(new_tags[index])
+
     def test_list(self):
         assert list_tags(self._site) == sorted(DEMO_TAGS)
 
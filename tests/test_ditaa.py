@@ -40,6 +40,63 @@ def test_ditaa_url(do_test):
         ]
 
 
+def test_ditaa_cache(do_test, tmp_site_path):
+    def run(cmdline, **kwargs):
+        with open(cmdline[2], 'w') as f:
+            f.write('<svg/>')
+        return subprocess.CompletedProcess(cmdline, 0)
+
+    data = """\
+        .. ditaa::
+           :cmdline: --svg
+           :filename: {checksum}.svg
+
+           +---+
+           | A |
+           +---+
+    """
+
+    with patch.object(subprocess, 'run', side_effect=run) as runner:
+        html = do_test(data)
+        assert runner.call_count == 1
+
+        # The output is restored from the cache without running ditaa
+        output = tmp_site_path / 'files' / 'diagrams' / html.split('/diagrams/')[1].split('"')[0]
+        output.unlink()
+        assert do_test(data) == html
+        assert runner.call_count == 1
+        assert output.read_text() == '<svg/>'
+
+        # Other options make another diagram
+        do_test(data.replace('--svg', '--svg --scale 2'))
+        assert runner.call_count == 2
+
+
+def test_ditaa_concurrent_errors(do_test):
+    def run(cmdline, **kwargs):
+        with open(cmdline[1]) as f:
+            failed = 'bad' in f.read()
+        return subprocess.CompletedProcess(cmdline, 1 if failed else 0, b'', b'it is bad' if failed else b'')
+
+    with patch.object(subprocess, 'run', side_effect=run) as runner:
+        html = do_test("""\
+            .. ditaa::
+
+               good
+
+            .. ditaa::
+
+               bad
+
+            .. ditaa::
+
+               also good
+        """)
+        assert runner.call_count == 3
+        assert html.count('<img') == 2
+        assert 'it is bad' in html
+
+
 @fixture
 def do_test(basic_compile_test):
     def f(data: str) -> str:
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import pytest
+
+from v7.latex.latex.tokenizer import Token, TokenStream
+
+
+def _tokens(input):
+    stream = TokenStream(input)
+    result = []
+    while stream.has_current():
+        result.append(stream.current() + stream.current_indices())
+        stream.skip_current()
+    return result
+
+
+@pytest.mark.parametrize('input, expected', [
+    ('a~b', [(Token.Text, 'a', 0, 1), (Token.NonbreakableWhitespace, None, 1, 2), (Token.Text, 'b', 2, 3)]),
+    ('50% off', [(Token.Text, '50%', 0, 3), (Token.Whitespace, None, 3, 4), (Token.Text, 'off', 4, 7)]),
+    ('$x$ $$y$$', [
+        (Token.InlineFormulaDelimiter, None, 0, 1), (Token.Text, 'x', 1, 2), (Token.InlineFormulaDelimiter, None, 2, 3),
+        (Token.Whitespace, None, 3, 4),
+        (Token.DisplayFormulaDelimiter, None, 4, 6), (Token.Text, 'y', 6, 7), (Token.DisplayFormulaDelimiter, None, 7, 9),
+    ]),
+    ('\\emph{x}\\\\\\[\\&', [
+        (Token.Command, 'emph', 0, 5), (Token.CurlyBraketOpen, None, 5, 6), (Token.Text, 'x', 6, 7),
+        (Token.CurlyBraketClose, None, 7, 8), (Token.ForcedLineBreak, None, 8, 10), (Token.Command, '[', 10, 12),
+        (Token.EscapedText, '&', 12, 14),
+    ]),
+    ('\\make@title2', [(Token.Command, 'make@title', 0, 11), (Token.Text, '2', 11, 12)]),
+])
+def test_tokens(input, expected):
+    assert _tokens(input) == expected
+
+
+@pytest.mark.parametrize('whitespace, token', [
+    ('\n', Token.Whitespace),
+    ('\r\n', Token.Whitespace),
+    ('\n\r', Token.Whitespace),
+    ('\n \t\n', Token.DoubleNewLine),
+    ('\r\n\r\n', Token.Whitespace),
+    ('\r\r', Token.DoubleNewLine),
+])
+def test_line_breaks(whitespace, token):
+    assert _tokens('a' + whitespace + 'b')[1][0] == token
+
+
+@pytest.mark.parametrize('input, comment', [
+    ('%c', 'c'),
+    ('%c\n  x', 'c\n  '),
+    ('%c\r\n  x', 'c\r\n  '),
+    ('%c\n\nx', 'c\n'),
+])
+def test_comments(input, comment):
+    assert _tokens(input)[0][:2] == (Token.Comment, comment)
+
+
+def test_peek_and_skip():
+    stream = TokenStream('a b c')
+    assert stream.peek(4) == (Token.Text, 'c')
+    assert not stream.can_peek(5)
+    stream.set_value(2, 'x')
+    stream.skip_current(2)
+    assert stream.current() == (Token.Text, 'x')
+    assert stream.peek_indices(2) == (4, 5)
+    stream.skip_current(3)
+    assert not stream.has_current()
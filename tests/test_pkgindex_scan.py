@@ -0,0 +1,82 @@
+import os
+
+from pytest import fixture
+
+from v8.pkgindex_scan.pkgindex_scan import ScanCache
+
+
+def test_scan_cache_metadata(tmp_path, package):
+    cache_path = str(tmp_path / 'cache.json')
+    calls = []
+
+    def compute(post):
+        calls.append(post.source_path)
+        post.add_dependency(str(package / 'pkg.plugin'))
+        post.add_dependency(str(package / 'conf.py.sample'))
+        return {'version': (package / 'pkg.plugin').read_text(), 'allver': range(7, 9)}
+
+    def scan(config=None):
+        cache = ScanCache(cache_path, config or {'extension': '.plugin'})
+        post = FakePost(str(package / 'README.md'))
+        metadata = cache.get(post, lambda: compute(post))
+        # Translations read the metadata again
+        assert cache.get(post, lambda: compute(post)) == metadata
+        cache.save()
+        return metadata, post.deps
+
+    metadata, deps = scan()
+    assert metadata == {'version': '1.0', 'allver': [7, 8]}
+    assert len(calls) == 1
+
+    # Taken from the cache, with the same dependencies
+    assert scan() == ({'version': '1.0', 'allver': [7, 8]}, deps)
+    assert len(calls) == 1
+
+    # Descriptors are compared by content, other files by mtime and size
+    os.utime(str(package / 'pkg.plugin'), (0, 0))
+    scan()
+    assert len(calls) == 1
+    (package / 'pkg.plugin').write_text('1.1')
+    assert scan()[0]['version'] == '1.1'
+    assert len(calls) == 2
+    (package / 'conf.py.sample').write_text('# Changed\n')
+    scan()
+    assert len(calls) == 3
+
+    # So is a change of the configuration
+    scan({'extension': '.theme'})
+    assert len(calls) == 4
+
+
+def test_scan_cache_list_dir(tmp_path, package):
+    cache_path = str(tmp_path / 'cache.json')
+    (package.parent / 'notes.txt').write_text('')
+
+    cache = ScanCache(cache_path, {})
+    assert cache.list_dir(str(package.parent)) == [str(package)]
+    cache.save()
+
+    (package.parent / 'other').mkdir()
+    cache = ScanCache(cache_path, {})
+    assert sorted(cache.list_dir(str(package.parent))) == [str(package.parent / 'other'), str(package)]
+
+
+class FakePost:
+    folder_relative = 'v8'
+
+    def __init__(self, source_path):
+        self.source_path = source_path
+        self.deps = []
+
+    def add_dependency(self, dependency, add='both', lang=None):
+        self.deps.append((dependency, add, lang))
+
+
+@fixture
+def package(tmp_path):
+    package = tmp_path / 'v8' / 'pkg'
+    package.mkdir(parents=True)
+    (package / 'pkg.plugin').write_text('1.0')
+    (package / 'conf.py.sample').write_text('# Sample\n')
+    (package / 'README.md').write_text('Package\n')
+    return package
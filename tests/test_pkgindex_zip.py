@@ -0,0 +1,85 @@
+import os
+import zipfile
+import zlib
+from unittest.mock import patch
+
+from pytest import fixture
+
+from v8.pkgindex_zip import pkgindex_zip
+from v8.pkgindex_zip.pkgindex_zip import make_zip, make_zips, zip_signature
+
+
+def test_make_zip(tmp_path, package):
+    destination = str(tmp_path / 'out' / 'pkg.zip')
+    make_zip(package, destination)
+
+    with zipfile.ZipFile(destination) as z:
+        assert z.testzip() is None
+        assert z.namelist() == ['pkg/README.md', 'pkg/pkg.py', 'pkg/sub/data-ü.txt']
+        assert z.read('pkg/pkg.py') == b'print("hello")\n' * 100
+        assert z.read('pkg/sub/data-ü.txt') == b''
+        assert {info.date_time for info in z.infolist()} == {(1980, 1, 1, 0, 0, 0)}
+
+    # The same files make the same zip, no matter their order or times
+    with open(destination, 'rb') as fh:
+        data = fh.read()
+    for filename, arcname in package:
+        os.utime(filename, (1234567890, 1234567890))
+    other = str(tmp_path / 'other.zip')
+    make_zip(package[::-1], other)
+    with open(other, 'rb') as fh:
+        assert fh.read() == data
+
+
+def test_make_zip_reuses_members(tmp_path, package):
+    destination = str(tmp_path / 'pkg.zip')
+    hashes = make_zip(package, destination)
+    assert sorted(hashes) == ['pkg/README.md', 'pkg/pkg.py', 'pkg/sub/data-ü.txt']
+    with open(package[0][0], 'a') as fh:
+        fh.write('More text\n')
+
+    with patch.object(zlib, 'compressobj', wraps=zlib.compressobj) as compressobj:
+        new_hashes = make_zip(package, destination, hashes)
+        assert compressobj.call_count == 1
+    assert new_hashes['pkg/README.md'] != hashes['pkg/README.md']
+    assert new_hashes['pkg/pkg.py'] == hashes['pkg/pkg.py']
+
+    # Members are only reused when their digest is known
+    with patch.object(zlib, 'compressobj', wraps=zlib.compressobj) as compressobj:
+        make_zip(package, destination)
+        assert compressobj.call_count == 3
+
+    with zipfile.ZipFile(destination) as z:
+        assert z.testzip() is None
+        assert z.read('pkg/README.md') == b'Hello\nMore text\n'
+        assert z.read('pkg/pkg.py') == b'print("hello")\n' * 100
+
+
+def test_make_zips(tmp_path, package):
+    manifest = str(tmp_path / 'cache' / 'manifest.json')
+    zips = [(package, str(tmp_path / name), zip_signature(package)) for name in ('a.zip', 'b.zip')]
+    make_zips(zips, manifest, processes=2)
+    assert os.path.exists(zips[0][1]) and os.path.exists(zips[1][1])
+
+    # Only missing or changed zips are made again, reusing the members of the old one
+    hashes = make_zip(package, str(tmp_path / 'c.zip'))
+    os.unlink(zips[1][1])
+    with patch.object(pkgindex_zip, 'make_zip', return_value=hashes) as make:
+        make_zips(zips, manifest)
+        make.assert_called_once_with(package, zips[1][1], hashes)
+
+
+@fixture
+def package(tmp_path):
+    root = tmp_path / 'src'
+    files = []
+    for path, content in (
+        ('pkg/README.md', 'Hello\n'),
+        ('pkg/pkg.py', 'print("hello")\n' * 100),
+        ('pkg/sub/data-ü.txt', ''),
+    ):
+        filename = root / path
+        filename.parent.mkdir(parents=True, exist_ok=True)
+        filename.write_text(content, encoding='utf-8')
+        files.append((str(filename), path.replace('/', os.sep)))
+    return files
@@ -1,13 +1,17 @@
 import os
+import sys
 from textwrap import dedent
 from typing import Dict
 
+from pytest import mark
+
 from tests import execute_plugin_tasks
-from v8.plantuml.plantuml import PlantUmlTask
+from v8.plantuml.plantuml import PlantUmlManager, PlantUmlTask
 
 
 # Note this test is also sufficient to prove that rendering binary image files will work
-def test_render_file_success(tmp_site_path):
+@mark.parametrize('persistent', [False, True])
+def test_render_file_success(tmp_site_path, persistent):
     (tmp_site_path / 'pages' / 'test.puml').write_text(dedent('''\
         @startuml
         title filename="%filename()"
@@ -32,6 +36,7 @@ def test_render_file_success(tmp_site_path):
                 '-tutxt',
             ]),
         ),
+        'PLANTUML_PERSISTENT': persistent,
     })
 
     execute_plugin_tasks(plugin)
@@ -47,7 +52,8 @@ def test_render_file_success(tmp_site_path):
     ]
 
 
-def test_render_file_error(tmp_site_path):
+@mark.parametrize('persistent', [False, True])
+def test_render_file_error(tmp_site_path, persistent):
     (tmp_site_path / 'pages' / 'test.puml').write_text(dedent('''\
         @startuml
         A -> B
@@ -60,6 +66,7 @@ def test_render_file_error(tmp_site_path):
             ('pages/*.puml', '', '.txt', ['-tutxt']),
         ),
         'PLANTUML_CONTINUE_AFTER_FAILURE': True,
+        'PLANTUML_PERSISTENT': persistent,
     })
 
     execute_plugin_tasks(plugin)
@@ -76,6 +83,59 @@ def test_render_file_error(tmp_site_path):
     ]
 
 
+# Pretends to be PlantUML in -pipe mode: renders a diagram as its upper-cased source, writes an error report to stderr
+# for lines saying "bad", and JVM-style warnings to stderr when it starts and for lines saying "warn"
+FAKE_PLANTUML = dedent('''\
+    import sys
+    args = sys.argv[1:]
+    delimiter = args[args.index('-pipedelimitor') + 1] if '-pipedelimitor' in args else None
+    sys.stderr.write('Picked up JAVA_TOOL_OPTIONS: -Dfile.encoding=UTF-8\\n')
+    sys.stderr.flush()
+    diagram = []
+    for line in sys.stdin:
+        diagram.append(line)
+        if not line.startswith('@end'):
+            continue
+        if any('warn' in l for l in diagram):
+            sys.stderr.write('Warning: font "Foo" not found\\n')
+        if any('bad' in l for l in diagram):
+            sys.stderr.write('ERROR\\n3\\nSyntax Error?\\n')
+            sys.stderr.flush()
+        sys.stdout.write(''.join(diagram).upper())
+        if delimiter:
+            sys.stdout.write(delimiter + '\\n')
+        sys.stdout.flush()
+        diagram = []
+''')
+
+
+def test_persistent_errors(tmp_path):
+    script = tmp_path / 'fake_plantuml.py'
+    script.write_text(FAKE_PLANTUML)
+    manager = PlantUmlManager(FakeSite({
+        'PLANTUML_EXEC': [sys.executable, str(script)],
+        'PLANTUML_PERSISTENT': True,
+    }))
+    try:
+        # Warnings are not errors
+        assert manager.render(b'@startuml\nwarn\n@enduml', ['-filename', 'a.puml']) == (b'@STARTUML\nWARN\n@ENDUML\n', None)
+        assert manager.render(b'@startuml\nbad\n@enduml', ['-filename', 'b.puml']) == (
+            b'@STARTUML\nBAD\n@ENDUML\n', 'PlantUML error: ERROR\n3\nSyntax Error?'
+        )
+        # The error report is not mixed into the next diagram
+        assert manager.render(b'@startuml\ngood\n@enduml', ['-filename', 'c.puml']) == (b'@STARTUML\nGOOD\n@ENDUML\n', None)
+        assert len(manager._processes) == 1
+    finally:
+        manager.close()
+
+
+def test_persistent_needs_filename(tmp_path):
+    manager = PlantUmlManager(FakeSite({'PLANTUML_PERSISTENT': True}))
+    for source in (b'@startuml\ntitle %filename()\n@enduml', b'@startuml\n!include foo.iuml\n@enduml'):
+        assert manager._render_persistent(source, ['-filename', 'a.puml']) is None
+    assert manager._processes == {}
+
+
 def test_gen_tasks(tmp_site_path):
     (tmp_site_path / 'pages' / 'b').mkdir(parents=True)
     (tmp_site_path / 'other' / 'diagrams' / 'd').mkdir(parents=True)
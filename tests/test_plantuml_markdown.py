@@ -1,5 +1,7 @@
 import os
+import subprocess
 import sys
+from unittest.mock import patch
 
 import pytest
 from pytest import fixture
@@ -113,6 +115,41 @@ def test_plantuml_syntax_error(do_compile_test):
         assert 'Syntax Error?' in text
 
 
+def test_cache(do_compile_test, tmp_site_path):
+    (tmp_site_path / 'style.iuml').write_text('skinparam shadowing false')
+    data = """\
+        ```plantuml
+        !include style.iuml
+        A -> B
+        ```
+        """
+
+    with patch.object(subprocess, 'run') as runner:
+        runner.return_value = subprocess.CompletedProcess([], 0, b'<svg>cached</svg>', b'')
+        assert '<svg>cached</svg>' in do_compile_test(data).raw_html
+        assert '<svg>cached</svg>' in do_compile_test(data).raw_html
+        assert runner.call_count == 1
+
+        # A changed include invalidates the cached output
+        os.utime(str(tmp_site_path / 'style.iuml'), (0, 0))
+        do_compile_test(data)
+        assert runner.call_count == 2
+
+
+def test_cache_ignores_errors(do_compile_test):
+    data = """\
+        ```plantuml
+        this line is bad
+        ```
+        """
+
+    with patch.object(subprocess, 'run') as runner:
+        runner.return_value = subprocess.CompletedProcess([], 1, b'<svg>error</svg>', b'Syntax Error?')
+        do_compile_test(data, plantuml_continue_after_failure=True)
+        do_compile_test(data, plantuml_continue_after_failure=True)
+        assert runner.call_count == 2
+
+
 @pytest.mark.parametrize('line, expected', [
     (
             '```plantuml',
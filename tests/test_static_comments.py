@@ -0,0 +1,116 @@
+import os
+from textwrap import dedent
+
+from pytest import fixture
+
+from nikola import Nikola
+
+from . import V8_PLUGIN_PATH
+
+
+def test_comments(site_factory):
+    site = site_factory()
+    comments = {post.source_path: post.comments for post in site.timeline}
+
+    first = comments[os.path.join('posts', 'first.html')]
+    assert [(c.id, c.parent_id, c.author, c.content.strip()) for c in first] == [
+        ('1', None, 'alice', '<p>First comment</p>'),
+        ('2', '1', 'bob', '<p>A reply</p>'),
+    ]
+    # Unapproved comments and comments of posts with a similar name are left out
+    assert [c.id for c in comments[os.path.join('posts', 'first.ext.html')]] == ['3']
+    assert comments[os.path.join('posts', 'second.html')] == []
+
+
+def test_comment_cache(site_factory):
+    def scan():
+        # A new site, as in the next build
+        site = site_factory(scan=False)
+        plugin = site.plugin_manager.getPluginByName('static_comments', 'SignalHandler').plugin_object
+        parsed = []
+        parse_comment = plugin._parse_comment
+
+        def _parse_comment(filename):
+            parsed.append(os.path.basename(filename))
+            return parse_comment(filename)
+
+        plugin._parse_comment = _parse_comment
+        site.scan_posts()
+        return site, sorted(parsed)
+
+    assert scan()[1] == ['first.1.wpcomment', 'first.2.wpcomment', 'first.ext.3.wpcomment', 'first.ext.4.wpcomment']
+    assert scan()[1] == []
+
+    # Only changed comment files are parsed again
+    write_comment('first.2', author='carol', parent_id='1', text='<p>An edited reply</p>', date='2017-01-07 10:00:00')
+    os.utime(os.path.join('posts', 'first.2.wpcomment'), (0, 0))
+    site, parsed = scan()
+    assert parsed == ['first.2.wpcomment']
+    first = [post for post in site.timeline if post.source_path == os.path.join('posts', 'first.html')][0]
+    assert [(c.author, c._owner, c.content.strip()) for c in first.comments] == [
+        ('alice', first, '<p>First comment</p>'),
+        ('carol', first, '<p>An edited reply</p>'),
+    ]
+
+
+def test_compiled_content_cache(site_factory, monkeypatch):
+    write_comment('second.1', author='alice', text='*Emphasis*', date='2017-01-06 11:23:55', compiler='rest')
+
+    for compiled in ([os.path.join('posts', 'second.1.wpcomment')], []):
+        site = site_factory()
+        plugin = site.plugin_manager.getPluginByName('static_comments', 'SignalHandler').plugin_object
+        compile_content = plugin._compile_content
+        calls = []
+
+        def _compile_content(compiler_name, content, filename):
+            calls.append(filename)
+            return compile_content(compiler_name, content, filename)
+
+        monkeypatch.setattr(plugin, '_compile_content', _compile_content)
+        comment = [post for post in site.timeline if post.source_path == os.path.join('posts', 'second.html')][0].comments[0]
+        digest = plugin._hash_post_comments(comment._owner)
+
+        # Only compiled once the content is used, and then taken from the cache
+        assert calls == []
+        assert '<em>Emphasis</em>' in comment.content
+        assert calls == compiled
+        assert plugin._hash_post_comments(comment._owner) == digest
+
+
+def write_comment(name, author, text, date, parent_id='None', approved='True', compiler='html'):
+    with open(os.path.join('posts', name + '.wpcomment'), 'w', encoding='utf-8') as f:
+        f.write(dedent('''\
+            .. id: {id}
+            .. approved: {approved}
+            .. author: {author}
+            .. date_utc: {date}
+            .. parent_id: {parent_id}
+            .. compiler: {compiler}
+
+            {text}
+        ''').format(id=name.rpartition('.')[2], approved=approved, author=author, date=date, parent_id=parent_id, text=text, compiler=compiler))
+
+
+@fixture
+def site_factory(tmp_site_path):
+    os.mkdir('posts')
+    for name in ('first', 'first.ext', 'second'):
+        with open(os.path.join('posts', name + '.html'), 'w', encoding='utf-8') as f:
+            f.write('<!--\n.. title: {0}\n.. date: 2017-01-01 00:00:00 UTC\n-->\n\n<p>Text</p>\n'.format(name))
+    write_comment('first.1', author='alice', text='<p>First comment</p>', date='2017-01-06 11:23:55')
+    write_comment('first.2', author='bob', parent_id='1', text='<p>A reply</p>', date='2017-01-06 12:00:00')
+    write_comment('first.ext.3', author='alice', text='<p>Other post</p>', date='2017-01-06 11:23:55')
+    write_comment('first.ext.4', author='spammer', text='<p>Spam</p>', date='2017-01-06 11:23:55', approved='False')
+
+    def f(scan=True):
+        site = Nikola(
+            EXTRA_PLUGINS_DIRS=[str(V8_PLUGIN_PATH / 'static_comments')],
+            POSTS=(('posts/*.html', 'posts', 'post.tmpl'), ('posts/*.rst', 'posts', 'post.tmpl')),
+            PAGES=(),
+        )
+        site.init_plugins()
+        if scan:
+            site.scan_posts()
+        return site
+
+    return f
@@ -0,0 +1,186 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from pytest import fixture
+
+from v8.webmentions.webmentions import ENDPOINTS_KEY, WebMentions
+
+
+def test_send_webmentions(server, plugin):
+    plugin.analyse_posts({"deployed": [
+        FakePost("https://example.org/one/", [server.url("/a"), server.url("/none"), "https://example.org/two/"]),
+        FakePost("https://example.org/two/", [server.url("/a"), server.url("/b")]),
+    ]})
+
+    assert sorted(server.mentions) == [
+        ("https://example.org/one/", server.url("/a")),
+        ("https://example.org/two/", server.url("/a")),
+        ("https://example.org/two/", server.url("/b")),
+    ]
+    # Every page is only looked at once
+    assert sorted(server.discovered) == ["/a", "/b", "/none"]
+
+    # Links to our own site and pages without an endpoint count as handled too
+    assert sorted(plugin.site.state.data["webmention-info-https://example.org/one/"]) == [
+        server.url("/a"), server.url("/none"), "https://example.org/two/"
+    ]
+    endpoints = plugin.site.state.data[ENDPOINTS_KEY]
+    assert endpoints[server.url("/a")]["endpoint"] == server.url("/endpoint")
+    assert endpoints[server.url("/b")]["endpoint"] == server.url("/endpoint")
+    assert endpoints[server.url("/none")]["endpoint"] is False
+
+
+def test_endpoint_cache(server, plugin):
+    plugin.analyse_posts({"deployed": [FakePost("https://example.org/one/", [server.url("/a"), server.url("/none")])]})
+    server.discovered.clear()
+
+    plugin.analyse_posts({"deployed": [FakePost("https://example.org/two/", [server.url("/a"), server.url("/none")])]})
+    assert server.discovered == []
+    assert ("https://example.org/two/", server.url("/a")) in server.mentions
+
+    # Expired endpoints are discovered again
+    for entry in plugin.site.state.data[ENDPOINTS_KEY].values():
+        entry["time"] -= plugin.endpoint_ttl
+    plugin.analyse_posts({"deployed": [FakePost("https://example.org/three/", [server.url("/a"), server.url("/none")])]})
+    assert sorted(server.discovered) == ["/a", "/none"]
+
+
+def test_endpoint_cache_disabled(server, plugin):
+    plugin.endpoint_ttl = 0
+    plugin.analyse_posts({"deployed": [FakePost("https://example.org/one/", [server.url("/a")])]})
+
+    assert server.mentions == [("https://example.org/one/", server.url("/a"))]
+    assert ENDPOINTS_KEY not in plugin.site.state.data
+
+
+def test_per_host_limit(server, plugin):
+    server.delay = 0.05
+    links = [server.url("/page{0}".format(i)) for i in range(12)]
+    plugin.analyse_posts({"deployed": [FakePost("https://example.org/one/", links)]})
+
+    assert len(server.mentions) == len(links)
+    assert server.max_active <= plugin.per_host
+    assert server.max_active > 1
+
+
+def test_unreachable(server, plugin):
+    plugin.analyse_posts({"deployed": [FakePost("https://example.org/one/", ["http://127.0.0.1:1/", server.url("/a")])]})
+
+    assert server.mentions == [("https://example.org/one/", server.url("/a"))]
+    # Links that failed are retried on the next deploy
+    assert plugin.site.state.data["webmention-info-https://example.org/one/"] == [server.url("/a")]
+
+
+class FakeState:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key, value):
+        self.data[key] = value
+
+
+class FakeSite:
+    def __init__(self):
+        self.config = {"SITE_URL": "https://example.org/"}
+        self.state = FakeState()
+
+
+class FakePost:
+    is_draft = False
+    post_status = "published"
+
+    def __init__(self, link, links):
+        self.link = link
+        self.links = links
+
+    def title(self):
+        return self.link
+
+    def permalink(self, absolute=False):
+        return self.link
+
+    def text(self):
+        return "<div>{0}</div>".format("".join('<p><a href="{0}">link</a></p>'.format(u) for u in self.links))
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Pages link to a relative endpoint (in a header or the html), except /none"""
+
+    def do_HEAD(self):
+        with self.server.lock:
+            self.server.discovered.append(self.path)
+        self.server.track(self.path)
+        self.send_response(200)
+        if self.path.startswith("/page") or self.path == "/b":
+            self.send_header("Link", '<https://example.org/style.css>; rel="stylesheet", </endpoint>; rel="webmention"')
+        self.end_headers()
+
+    def do_GET(self):
+        self.server.track(self.path)
+        if self.path == "/a":
+            body = b'<html><head><link rel="webmention" href="/endpoint"></head></html>'
+        else:
+            body = b'<html><head></head></html>'
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.server.track(self.path)
+        data = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        with self.server.lock:
+            self.server.mentions.append((data["source"][0], data["target"][0]))
+        self.send_response(202)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.lock = threading.Lock()
+        self.delay = 0
+        self.active = 0
+        self.max_active = 0
+        self.mentions = []
+        self.discovered = []
+
+    def url(self, path):
+        return "http://127.0.0.1:{0}{1}".format(self.server_address[1], path)
+
+    def track(self, path):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+
+
+@fixture
+def server():
+    server = Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@fixture
+def plugin():
+    plugin = WebMentions()
+    plugin.set_site(FakeSite())
+    return plugin
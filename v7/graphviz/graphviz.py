@@ -24,7 +24,9 @@
 # OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import atexit
 import hashlib
+import io
 import os
 from subprocess import Popen, PIPE
 
@@ -49,9 +51,68 @@ class Plugin(RestExtension):
         Graphviz.output_folder = self.site.config.get('GRAPHVIZ_OUTPUT', 'output/assets/graphviz')
         Graphviz.graph_path = self.site.config.get('GRAPHVIZ_GRAPH_PATH', '/assets/graphviz/')
         Graphviz.dot_path = self.site.config.get('GRAPHVIZ_DOT', 'dot')
+        if self.site.config.get('GRAPHVIZ_CACHE', True):
+            Graphviz.cache = RenderCache(os.path.join(self.site.config['CACHE_FOLDER'], 'graphviz'))
+            atexit.register(Graphviz.cache.report)
         return super(Plugin, self).set_site(site)
 
 
+class RenderCache(object):
+    """Rendered SVGs, stored under a digest of the DOT source and the dot binary used."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, dot_path):
+        """Return the version string printed by ``dot -V``, or None if dot cannot be run."""
+        if dot_path not in self.versions:
+            try:
+                p = Popen([dot_path, '-V'], stdout=PIPE, stderr=PIPE)
+                out, err = p.communicate()
+                self.versions[dot_path] = (out + err).decode('utf8', 'replace').strip() if p.returncode == 0 else None
+            except OSError:
+                self.versions[dot_path] = None
+        return self.versions[dot_path]
+
+    def key(self, dot_path, data):
+        """Return the cache key for rendering data, or None if it cannot be cached."""
+        version = self.version(dot_path)
+        if version is None:
+            return None
+        digest = hashlib.sha256()
+        for part in (dot_path, version, data):
+            digest.update(part.encode('utf8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached SVG for key, or None."""
+        try:
+            with io.open(os.path.join(self.folder, key + '.svg'), 'rb') as inf:
+                svg_data = inf.read()
+        except IOError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return svg_data
+
+    def put(self, key, svg_data):
+        """Store an SVG in the cache."""
+        makedirs(self.folder)
+        f_path = os.path.join(self.folder, key + '.svg')
+        with io.open(f_path + '.tmp', 'wb') as outf:
+            outf.write(svg_data)
+        os.replace(f_path + '.tmp', f_path)
+
+    def report(self):
+        """Log how many graphs came from the cache."""
+        if self.hits or self.misses:
+            LOGGER.info("Graphviz: {0} graphs taken from the cache, {1} rendered.".format(self.hits, self.misses))
+
+
 class Graphviz(Directive):
     """ Restructured text extension for inserting graphs as SVG
 
@@ -64,6 +125,7 @@ class Graphviz(Directive):
                }
    """
 
+    cache = None
     has_content = True
     required_arguments = 0
     optional_arguments = 1
@@ -88,13 +150,18 @@ class Graphviz(Directive):
             data = '\n'.join(self.content)
         node_list = []
         try:
-            p = Popen([self.dot_path, '-Tsvg'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-            svg_data, errors = p.communicate(input=data.encode('utf8'))
-            code = p.wait()
-            if code:  # Some error
-                document = self.state.document
-                return [document.reporter.error(
-                        'Error processing graph: {0}'.format(errors), line=self.lineno)]
+            key = self.cache.key(self.dot_path, data) if self.cache is not None else None
+            svg_data = self.cache.get(key) if key is not None else None
+            if svg_data is None:
+                p = Popen([self.dot_path, '-Tsvg'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
+                svg_data, errors = p.communicate(input=data.encode('utf8'))
+                code = p.wait()
+                if code:  # Some error
+                    document = self.state.document
+                    return [document.reporter.error(
+                            'Error processing graph: {0}'.format(errors), line=self.lineno)]
+                if key is not None:
+                    self.cache.put(key, svg_data)
             if self.embed_graph:  # SVG embedded in the HTML
                 if 'inline' in self.options:
                     svg_data = '<span class="graphviz">{0}</span>'.format(svg_data.decode('utf8'))
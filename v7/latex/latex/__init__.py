@@ -28,10 +28,12 @@
 
 from __future__ import unicode_literals
 
+import hashlib
 import os
 import io
 import nikola.plugin_categories
 import nikola.utils
+import pickle
 import re
 import json
 
@@ -40,6 +42,15 @@ from . import parser, htmlify
 LOGGER = nikola.utils.get_logger('compile_latex', nikola.utils.STDERR_HANDLER)
 
 
+def _get_parser_version():
+    """Compute digest of the parser's code, so that cached parse trees are dropped when it changes."""
+    digest = hashlib.sha256()
+    for module in ('tokenizer.py', 'parser.py', 'tree.py'):
+        with io.open(os.path.join(os.path.dirname(__file__), module), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+
 class LaTeXContext(object):
     """Represent a context for LaTeX post compilation.
 
@@ -155,7 +166,9 @@ class CompileLaTeX(nikola.plugin_categories.PageCompiler):
         super(CompileLaTeX, self).__init__()
         self.__beautify = True
         self.__parsing_environment = parser.ParsingEnvironment()
+        self.__parsing_environment_fingerprint = None
         self.__link_providers = {}
+        self.__parse_cache_folder = None
 
     def set_site(self, site):
         """Set Nikola site object."""
@@ -189,6 +202,9 @@ class CompileLaTeX(nikola.plugin_categories.PageCompiler):
         for plugin in self.__all_plugins:
             plugin.initialize(self, self.__parsing_environment)
 
+        if site.config.get('LATEX_PARSE_CACHE', True):
+            self.__parse_cache_folder = os.path.join(site.config['CACHE_FOLDER'], 'latex', 'parse')
+
     def _get_dep_filename(self, post, lang):
         """Retrieve dependency filename."""
         return post.translated_base_path(lang) + '.ltxdep'
@@ -251,9 +267,44 @@ class CompileLaTeX(nikola.plugin_categories.PageCompiler):
         """Retrieve parsing environment. See ``parser.ParsingEnvironment`` for documentation."""
         return self.__parsing_environment
 
+    def _get_parse_cache_key(self, data):
+        """Compute key describing everything the parse tree of data depends on."""
+        if self.__parsing_environment_fingerprint is None:
+            self.__parsing_environment_fingerprint = '{0}:{1}'.format(_get_parser_version(), self.__parsing_environment.get_fingerprint())
+        digest = hashlib.sha256(data.encode('utf-8')).hexdigest()
+        return '{0}:{1}'.format(self.__parsing_environment_fingerprint, digest)
+
+    def _parse(self, data, source_path=None):
+        """Parse data from string, or load the parse tree from the cache.
+
+        The parse tree only depends on the input and on the parsing environment,
+        so it is cached per source file. Everything language- or output-dependent
+        (theorem names, link providers, formula rendering) happens in HTMLify.
+        """
+        if self.__parse_cache_folder is None or source_path is None:
+            return parser.parse(data, self.__parsing_environment, filename=source_path)
+        cache_file = os.path.join(self.__parse_cache_folder, hashlib.sha1(source_path.encode('utf-8')).hexdigest() + '.pickle')
+        key = self._get_parse_cache_key(data)
+        try:
+            with io.open(cache_file, 'rb') as file:
+                cached_key, cached_tree = pickle.load(file)
+            if cached_key == key:
+                return cached_tree
+        except Exception:
+            pass
+        tree = parser.parse(data, self.__parsing_environment, filename=source_path)
+        try:
+            nikola.utils.makedirs(self.__parse_cache_folder)
+            with io.open(cache_file + '.tmp', 'wb') as file:
+                pickle.dump((key, tree), file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_file + '.tmp', cache_file)
+        except Exception as e:
+            LOGGER.warn("Cannot write parse tree cache for {0}: {1}".format(source_path, e))
+        return tree
+
     def _format_data(self, data, latex_context):
         """Parse and HTMLify data from string, given LaTeX context."""
-        tree = parser.parse(data, self.__parsing_environment, filename=latex_context.name)
+        tree = self._parse(data, latex_context.name)
         result = htmlify.HTMLify(tree, self.__formula_renderer, latex_context, beautify=self.__beautify, outer_indent=0)
         for plugin in self.__all_plugins:
             result = plugin.modify_html_output(result, latex_context)
@@ -30,6 +30,8 @@ from __future__ import unicode_literals
 
 from . import tree, tokenizer
 
+import hashlib
+import json
 import nikola.utils
 import re
 
@@ -267,6 +269,21 @@ class ParsingEnvironment(object):
         for replacement in _replacement_commands.keys():
             self.register_command_WS(replacement, 0)
 
+    def get_fingerprint(self):
+        """Return a digest of the registered commands, environments and languages.
+
+        Two environments with the same fingerprint parse every input the same way.
+        """
+        def describe(info):
+            return [info.argument_count, info.eat_trailing_whitespace, list(info.default_arguments), info.accept_unknown_commands, sorted(info.url_mode)]
+
+        data = {
+            'commands': {name: describe(info) for name, info in self.commands.items()},
+            'environments': {name: describe(info) for name, info in self.environments.items()},
+            'languages': self.languages,
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
     def register_command(self, command_name, argument_count, *default_arguments, accept_unknown_commands=False, url_mode=set()):
         """Register a new command.
 
@@ -28,6 +28,10 @@
 
 from __future__ import unicode_literals
 
+import collections
+import itertools
+import re
+
 import nikola.utils
 
 from enum import Enum
@@ -74,70 +78,72 @@ def _compute_position(input, index):
     return (line, col)
 
 
-class Tokenizer:
-    """A simple tokenizer."""
-
-    def _is_whitespace(self, char):
-        """Check for whitespace."""
-        return ord(char) <= 32
-
-    def _is_line_break(self, char):
-        """Check for line breaks."""
-        return ord(char) == 10 or ord(char) == 13
+# The tokens which can be recognized by a regular expression. Whitespace is
+# everything up to and including ' '. Text ends at whitespace or at a character
+# with a special meaning; a comment can start a token, but cannot end a text.
+_TOKEN = re.compile(
+    '(?P<whitespace>[\\x00-\\x20]+)'
+    '|(?P<text>[^\\x00-\\x20~{}$\\[\\]\\\\&%][^\\x00-\\x20~{}$\\[\\]\\\\&]*)'
+    '|\\\\(?P<command>[A-Za-z@]+)'
+    '|(?P<single>[~&{}\\[\\]])'
+    '|(?P<display>\\$\\$)'
+    '|(?P<inline>\\$)'
+)
+_LINE_BREAK = re.compile('[\\n\\r]')
+
+_SINGLE_CHAR_TOKENS = {
+    '~': Token.NonbreakableWhitespace,
+    '&': Token.TableColumnDelimiter,
+    '{': Token.CurlyBraketOpen,
+    '}': Token.CurlyBraketClose,
+    '[': Token.SquareBraketOpen,
+    ']': Token.SquareBraketClose,
+}
+
+
+def _count_line_breaks(whitespace):
+    """Count line breaks in whitespace, treating '\\r\\n' and '\\n\\r' as one line break."""
+    if '\r' not in whitespace:
+        return whitespace.count('\n')
+    number_of_line_breaks = 0
+    last_line_break = None
+    for c in whitespace:
+        if c == '\n' or c == '\r':
+            if last_line_break is None or last_line_break == c:
+                number_of_line_breaks += 1
+            last_line_break = c
+        else:
+            last_line_break = None
+    return number_of_line_breaks
 
-    def _is_command_char(self, char):
-        """Check for a command character."""
-        return (char >= 'A' and char <= 'Z') or (char >= 'a' and char <= 'z') or (char == '@')
 
-    def _eat_whitespace(self):
-        """Skip whitespace and return number of contained line breaks."""
-        number_of_line_breaks = 0
-        last_line_break = None
-        while self._position < len(self._input):
-            if not self._is_whitespace(self._input[self._position]):
-                break
-            if self._is_line_break(self._input[self._position]):
-                if last_line_break is None or last_line_break == self._input[self._position]:
-                    number_of_line_breaks += 1
-                last_line_break = self._input[self._position]
-            else:
-                last_line_break = None
-            self._position += 1
-        return number_of_line_breaks
+class Tokenizer:
+    """A simple tokenizer."""
 
     def _eat_comment(self):
         """Skip comment's content."""
         start = self._position
-        last_line_break = None
-        had_line_break = False
+        # Everything up to the first line break belongs to the comment
+        match = _LINE_BREAK.search(self._input, self._position)
+        if match is None:
+            self._position = len(self._input)
+            return self._input[start:]
+        last_line_break = match.group()
+        self._position = match.end()
+        # So does the whitespace at the beginning of the next line
         while self._position < len(self._input):
-            if had_line_break and not self._is_whitespace(self._input[self._position]):
+            char = self._input[self._position]
+            if char > ' ':
                 break
-            if self._is_line_break(self._input[self._position]):
-                if last_line_break is None or last_line_break == self._input[self._position]:
-                    if had_line_break:
-                        break
-                last_line_break = self._input[self._position]
-                had_line_break = True
+            if char == '\n' or char == '\r':
+                if last_line_break is None or last_line_break == char:
+                    break
+                last_line_break = char
             else:
                 last_line_break = None
             self._position += 1
         return self._input[start:self._position]
 
-    def _read_text(self, strict):
-        """Read text."""
-        start = self._position
-        while self._position < len(self._input):
-            char = self._input[self._position]
-            if self._is_whitespace(char):
-                break
-            if char == "~" or char == "{" or char == "}" or char == "$" or char == "[" or char == "]" or char == "$" or char == "\\" or char == "&":
-                break
-            if strict and not self._is_command_char(char):
-                break
-            self._position += 1
-        return self._input[start:self._position]
-
     def _find_next(self):
         """Find next token."""
         self._token = None
@@ -147,62 +153,46 @@ class Tokenizer:
         if (self._position >= len(self._input)):
             return
         self._token_begin_index = self._position
-        char = self._input[self._position]
-        if self._is_whitespace(char):
-            number_of_line_breaks = self._eat_whitespace()
-            if number_of_line_breaks > 1:
-                self._token = Token.DoubleNewLine
-            else:
-                self._token = Token.Whitespace
-        elif char == "~":
-            self._token = Token.NonbreakableWhitespace
-            self._position += 1
-        elif char == '&':
-            self._token = Token.TableColumnDelimiter
-            self._position += 1
-        elif char == "{":
-            self._token = Token.CurlyBraketOpen
-            self._position += 1
-        elif char == "}":
-            self._token = Token.CurlyBraketClose
-            self._position += 1
-        elif char == "[":
-            self._token = Token.SquareBraketOpen
-            self._position += 1
-        elif char == "]":
-            self._token = Token.SquareBraketClose
-            self._position += 1
-        elif char == "$":
-            self._token = Token.InlineFormulaDelimiter
-            self._position += 1
-            if self._position < len(self._input) and self._input[self._position] == "$":
+        match = _TOKEN.match(self._input, self._position)
+        if match is not None:
+            kind = match.lastgroup
+            if kind == 'text':
+                self._token = Token.Text
+                self._token_value = match.group()
+            elif kind == 'whitespace':
+                if _count_line_breaks(match.group()) > 1:
+                    self._token = Token.DoubleNewLine
+                else:
+                    self._token = Token.Whitespace
+            elif kind == 'command':
+                self._token = Token.Command
+                self._token_value = match.group(kind)
+            elif kind == 'single':
+                self._token = _SINGLE_CHAR_TOKENS[match.group()]
+            elif kind == 'display':
                 self._token = Token.DisplayFormulaDelimiter
-                self._position += 1
-        elif char == "\\":
+            else:
+                self._token = Token.InlineFormulaDelimiter
+            self._position = match.end()
+        elif self._input[self._position] == '\\':
+            # '\' not followed by a letter
             self._position += 1
             if self._position == len(self._input):
                 raise "Reached end of text after '\\'"
             self._token = Token.Command
-            cmd = self._read_text(True)
-            if len(cmd) == 0:
-                ch = self._input[self._position]
-                if ch == '(' or ch == ')' or ch == '[' or ch == ']':
-                    self._token_value = ch
-                elif ch == '\\':
-                    self._token = Token.ForcedLineBreak
-                else:
-                    self._token = Token.EscapedText
-                    self._token_value = ch
-                self._position += 1
+            ch = self._input[self._position]
+            if ch == '(' or ch == ')' or ch == '[' or ch == ']':
+                self._token_value = ch
+            elif ch == '\\':
+                self._token = Token.ForcedLineBreak
             else:
-                self._token_value = cmd
-        elif char == '%':
+                self._token = Token.EscapedText
+                self._token_value = ch
+            self._position += 1
+        else:
             self._token = Token.Comment
             self._position += 1
             self._token_value = self._eat_comment()
-        else:
-            self._token = Token.Text
-            self._token_value = self._read_text(False)
         self._token_end_index = self._position
 
     def __init__(self, input):
@@ -237,6 +227,44 @@ class Tokenizer:
         if self._token is not None:
             self._find_next()
 
+    def tokens(self):
+        """Yield the remaining tokens as pairs ``((type, value), (begin_index, end_index))``.
+
+        This is faster than calling ``next()`` for every token. Afterwards,
+        the tokenizer has no token left.
+        """
+        input = self._input
+        length = len(input)
+        match_token = _TOKEN.match
+        while self._token is not None:
+            yield (self._token, self._token_value), (self._token_begin_index, self._token_end_index)
+            # Scan all tokens which can be recognized with _TOKEN right here
+            position = self._position
+            while position < length:
+                match = match_token(input, position)
+                if match is None:
+                    break
+                kind = match.lastgroup
+                end = match.end()
+                if kind == 'text':
+                    yield (Token.Text, match.group()), (position, end)
+                elif kind == 'whitespace':
+                    if _count_line_breaks(match.group()) > 1:
+                        yield (Token.DoubleNewLine, None), (position, end)
+                    else:
+                        yield (Token.Whitespace, None), (position, end)
+                elif kind == 'command':
+                    yield (Token.Command, match.group(kind)), (position, end)
+                elif kind == 'single':
+                    yield (_SINGLE_CHAR_TOKENS[match.group()], None), (position, end)
+                elif kind == 'display':
+                    yield (Token.DisplayFormulaDelimiter, None), (position, end)
+                else:
+                    yield (Token.InlineFormulaDelimiter, None), (position, end)
+                position = end
+            self._position = position
+            self._find_next()
+
     def get_substring(self, start_index, end_index):
         """Return substring of input string."""
         return self._input[start_index:end_index]
@@ -246,88 +274,115 @@ class Tokenizer:
         return _compute_position(self._input, index)
 
 
+# Marks the end of the token stream
+_END_OF_INPUT = ((None, None), (None, None))
+
+# How many tokens are read ahead at once
+_READ_AHEAD = 64
+
+
 class TokenStream:
     """Represent the output of a Tokenizer as a stream of tokens, allowing to peek ahead."""
 
     def _fill_ahead(self, count):
         """Fill ahead buffer."""
-        if len(self.__ahead) < count:
-            for i in range(len(self.__ahead), count):
-                if self.__tokenizer.has_token():
-                    self.__ahead.append((self.__tokenizer.token_type(), self.__tokenizer.token_value()))
-                    self.__ahead_indices.append((self.__tokenizer.token_begin_index(), self.__tokenizer.token_end_index()))
-                    self.__tokenizer.next()
-                else:
-                    self.__ahead.append((None, None))
-                    self.__ahead_indices.append((None, None))
+        ahead = self.__ahead
+        if len(ahead) >= count:
+            return
+        if self.__error is None:
+            try:
+                ahead.extend(itertools.islice(self.__tokens, max(count - len(ahead), _READ_AHEAD)))
+            except Exception as e:
+                # Raise the error only once the erroneous token is needed
+                self.__error = e
+        while len(ahead) < count:
+            if self.__error is not None:
+                raise self.__error
+            ahead.append(_END_OF_INPUT)
 
     def __init__(self, input):
         """Create TokenStream from input unicode string. Creates Tokenizer."""
         self.__tokenizer = Tokenizer(input)
-        self.__ahead = list()
-        self.__ahead_indices = list()
+        self.__tokens = self.__tokenizer.tokens()
+        self.__error = None
+        # Ring buffer of pairs (token, indices) which have been read, but not yet skipped
+        self.__ahead = collections.deque()
 
     def current(self):
         """Get current token. Return pair (type, value)."""
-        self._fill_ahead(1)
-        return self.__ahead[0]
+        if not self.__ahead:
+            self._fill_ahead(1)
+        return self.__ahead[0][0]
 
     def current_indices(self):
         """Get current token indices in input string."""
-        self._fill_ahead(1)
-        return self.__ahead_indices[0]
+        if not self.__ahead:
+            self._fill_ahead(1)
+        return self.__ahead[0][1]
 
     def current_type(self):
         """Get current token type."""
-        self._fill_ahead(1)
-        return self.__ahead[0][0]
+        if not self.__ahead:
+            self._fill_ahead(1)
+        return self.__ahead[0][0][0]
 
     def current_value(self):
         """Get current token value."""
-        self._fill_ahead(1)
-        return self.__ahead[0][1]
+        if not self.__ahead:
+            self._fill_ahead(1)
+        return self.__ahead[0][0][1]
 
     def has_current(self):
         """Return True if current token is available."""
-        self._fill_ahead(1)
-        return self.__ahead[0][0] is not None
+        if not self.__ahead:
+            self._fill_ahead(1)
+        return self.__ahead[0][0][0] is not None
 
     def skip_current(self, count=1):
         """Skip number of tokens."""
         assert count >= 0
+        ahead = self.__ahead
+        if count == 1 and ahead:
+            ahead.popleft()
+            return
         self._fill_ahead(count)
-        self.__ahead = self.__ahead[count:]
-        self.__ahead_indices = self.__ahead_indices[count:]
+        for i in range(count):
+            ahead.popleft()
 
     def peek(self, index):
         """Peek ahead in token stream. Return pair (type, value)."""
         assert index >= 0
-        self._fill_ahead(index + 1)
-        return self.__ahead[index]
+        if len(self.__ahead) <= index:
+            self._fill_ahead(index + 1)
+        return self.__ahead[index][0]
 
     def peek_indices(self, index):
         """Peek ahead in token stream. Return indices of token in input string."""
         assert index >= 0
-        self._fill_ahead(index + 1)
-        return self.__ahead_indices[index]
+        if len(self.__ahead) <= index:
+            self._fill_ahead(index + 1)
+        return self.__ahead[index][1]
 
     def peek_type(self, index):
         """Peek ahead in token stream. Return token's type."""
         assert index >= 0
-        self._fill_ahead(index + 1)
-        return self.__ahead[index][0]
+        if len(self.__ahead) <= index:
+            self._fill_ahead(index + 1)
+        return self.__ahead[index][0][0]
 
     def peek_value(self, index):
         """Peek ahead in token stream. Return token's value."""
         assert index >= 0
-        self._fill_ahead(index + 1)
-        return self.__ahead[index][1]
+        if len(self.__ahead) <= index:
+            self._fill_ahead(index + 1)
+        return self.__ahead[index][0][1]
 
     def can_peek(self, index):
         """Check whether token at current index + ``index`` can be peeked at, i.e. whether it exists."""
         assert index >= 0
-        self._fill_ahead(index + 1)
-        return self.__ahead[index][0] is not None
+        if len(self.__ahead) <= index:
+            self._fill_ahead(index + 1)
+        return self.__ahead[index][0][0] is not None
 
     def get_substring(self, start_index, end_index):
         """Return substring of input string."""
@@ -344,7 +399,8 @@ class TokenStream:
         """
         assert index >= 0
         self._fill_ahead(index + 1)
-        self.__ahead[index] = (self.__ahead[index][0], new_value)
+        (type, value), indices = self.__ahead[index]
+        self.__ahead[index] = ((type, new_value), indices)
 
 
 def recombine_tokens(tokens):
@@ -29,6 +29,8 @@
 from nikola.plugin_categories import Task
 from nikola import utils
 
+import atexit
+import contextlib
 import gzip
 import hashlib
 import io
@@ -37,8 +39,11 @@ import tempfile
 import shutil
 import subprocess
 import base64
+import concurrent.futures
 import json
+import sqlite3
 import threading
+import time
 import xml.etree.ElementTree
 
 from PIL import Image
@@ -100,6 +105,8 @@ _ENGINES = {
                 'error': 'Cannot convert DVI file to PS file!'
             },
         ],
+        # dvips -E only works for single pages
+        'batch': False,
     }, {
         'types': {'inline', 'display', 'tikzpicture'},
         'texfile': {
@@ -237,8 +244,32 @@ def _ensure_dir_existence(dir):
         return os.path.isdir(dir)
 
 
+@contextlib.contextmanager
+def _transaction(connection):
+    """Run the enclosed statements in one transaction, locking the database for writing right away."""
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+# The formula images older versions cached as files next to formulae.db.json
+_LEGACY_CACHE_EXTENSIONS = ('.png', '.svg', '.svgz')
+
+
 class FormulaCache(object):
-    """Does bookkeeping for formula file names and allows to store/retrieve cached formula files."""
+    """Does bookkeeping for formula file names and allows to store/retrieve cached formula files.
+
+    Both the file names and the formula images are kept in an SQLite database
+    in the cache directory. If a maximal size is set, the least recently used
+    images are evicted from it; the file names are kept forever, so that the
+    URLs of formulae never change. Reading from the cache does not write to
+    the database: the times of use are collected and written in one go by
+    ``flush()``, which happens when new content is stored and at exit.
+    """
 
     # The prefix put before formula file names
     __output_prefix = "/"
@@ -249,21 +280,30 @@ class FormulaCache(object):
     # Whether the output directory is known to exist
     __output_directory_exists = False
 
-    # The cache directory where to put the cached formula images and the formula filename database
+    # The cache directory where to put the formula database with the cached formula images
     __cache_directory = None
 
     # Whether the cache directory is known to exist
     __cache_directory_exists = False
 
+    # The maximal total size of the cached formula images in bytes, or None
+    __max_size = None
+
+    # Number of collected times of use after which they are written anyway
+    __max_pending_uses = 1000
+
     def __init__(self):
         """Create formula cache."""
         self.__internal_lock = threading.Lock()
-        self.__database = None
+        self.__connection = None
+        self.__connection_pid = None
+        self.__pending_uses = {}
 
     def set_cache_directory(self, cacheDirectory):
         """Set cache directory to given directory."""
         self.__cache_directory = cacheDirectory
         self.__cache_directory_exists = False
+        self.__connection = None
 
     def set_output_directory(self, output_directory):
         """Set output directory to given directory."""
@@ -301,106 +341,171 @@ class FormulaCache(object):
         text = "{engine}:{0},{1},{2},{3},{4}:{5}".format(typeStr, _convert_color_component(color[0]), _convert_color_component(color[1]), _convert_color_component(color[2]), int(100 * scale), formula.strip(), engine=engine)
         return text
 
+    def set_max_size(self, max_size):
+        """Set maximal total size in bytes of cached formula images; ``None`` or 0 for no limit."""
+        self.__max_size = max_size or None
+
     def __get_database_file(self):
-        """Get filename of formula filename database."""
+        """Get filename of formula database."""
+        return os.path.join(self.__cache_directory, "formulae.sqlite")
+
+    def __get_legacy_database_file(self):
+        """Get filename of the JSON formula filename database used by older versions."""
         return os.path.join(self.__cache_directory, "formulae.db.json")
 
-    def __create_empty_database(Self):
-        """Get empty formula filename database."""
-        return dict(), set()
+    def __connect(self):
+        """Return a connection to the formula database, opening it if necessary.
 
-    def __read_database(self):
-        """Read formula filename database. Always returns something valid."""
-        if self.__cache_directory is None:
-            return self.__create_empty_database()
-        if not self.__cache_directory_exists:
-            self.__cache_directory_exists = _ensure_dir_existence(self.__cache_directory)
+        Without a cache directory, an in-memory database is used, so that base
+        names are still consistent during one run.
+        """
+        # Connections cannot be shared with processes forked by doit
+        if self.__connection is not None and self.__connection_pid == os.getpid():
+            return self.__connection
+        connection = None
+        if self.__cache_directory is not None:
+            if not self.__cache_directory_exists:
+                self.__cache_directory_exists = _ensure_dir_existence(self.__cache_directory)
+            try:
+                connection = sqlite3.connect(self.__get_database_file(), timeout=60, isolation_level=None, check_same_thread=False)
+                connection.execute("PRAGMA journal_mode=WAL")
+                # WAL stays consistent without syncing every commit
+                connection.execute("PRAGMA synchronous=NORMAL")
+                self.__create_tables(connection)
+            except sqlite3.Error as e:
+                _LOGGER.warn("Error on opening formulae database: {0}".format(e))
+                connection = None
+        if connection is None:
+            connection = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+            self.__create_tables(connection)
+        self.__connection = connection
+        self.__connection_pid = os.getpid()
+        if self.__cache_directory is not None:
+            self.__import_legacy_database(connection)
+        return connection
+
+    def __create_tables(self, connection):
+        """Create the tables of the formula database if they do not exist yet."""
+        with _transaction(connection):
+            connection.execute("CREATE TABLE IF NOT EXISTS names (search_text TEXT PRIMARY KEY, base_name TEXT NOT NULL UNIQUE)")
+            connection.execute("CREATE TABLE IF NOT EXISTS contents (name TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS contents_lru ON contents (last_used, size)")
+
+    def __import_legacy_database(self, connection):
+        """Import ``formulae.db.json`` and the formula images cached next to it by older versions.
+
+        The name mapping is kept, so that formula URLs stay the same, and the
+        images are moved into the database, so that they are not rendered again.
+        """
+        legacy_file = self.__get_legacy_database_file()
+        if not os.path.exists(legacy_file):
+            return
         try:
-            with open(self.__get_database_file(), "rb") as file:
+            with open(legacy_file, "rb") as file:
                 result = json.loads(file.read().decode('utf-8'))
-            if not isinstance(result, list) or len(result) != 2 or not isinstance(result[0], dict) or not isinstance(result[1], list):
+            if not isinstance(result, list) or len(result) != 2 or not isinstance(result[0], dict):
                 raise Exception("Read database invalid!")
-            result[1] = set(result[1])
-            return result
+            image_files = []
+            with _transaction(connection):
+                connection.executemany("INSERT OR IGNORE INTO names (search_text, base_name) VALUES (?, ?)", result[0].items())
+                now = time.time()
+                for base_name in set(result[0].values()):
+                    for extension in _LEGACY_CACHE_EXTENSIONS:
+                        image_file = os.path.join(self.__cache_directory, base_name + extension)
+                        try:
+                            with open(image_file, "rb") as file:
+                                content = file.read()
+                        except IOError:
+                            continue
+                        connection.execute("INSERT OR IGNORE INTO contents (name, data, size, last_used) VALUES (?, ?, ?, ?)", (base_name + extension, sqlite3.Binary(content), len(content), now))
+                        image_files.append(image_file)
+                if self.__max_size is not None:
+                    self.__evict(connection, None)
+            os.rename(legacy_file, legacy_file + ".imported")
+            for image_file in image_files:
+                os.unlink(image_file)
         except Exception as e:
-            _LOGGER.warn("Error on reading formulae database: {0}".format(e))
-            return self.__create_empty_database()
-
-    def __write_database(self, db):
-        """Write formula filename database to cache."""
-        if self.__cache_directory is None:
-            return
-        if not self.__cache_directory_exists:
-            self.__cache_directory_exists = _ensure_dir_existence(self.__cache_directory)
-        try:
-            new_db = [db[0], sorted(list(db[1]))]
-            with open(self.__get_database_file(), "wb") as file:
-                file.write(json.dumps(new_db, sort_keys=True).encode('utf-8'))
-        except Exception as e:
-            _LOGGER.warn("Error on writing formulae database: {0}".format(e))
+            _LOGGER.warn("Error on importing formulae database: {0}".format(e))
+
+    def __assign_base_name(self, connection, searchText):
+        """Look up base name for search text, or assign a new one. Must be called in a transaction."""
+        row = connection.execute("SELECT base_name FROM names WHERE search_text = ?", (searchText, )).fetchone()
+        if row is not None:
+            return row[0]
+        base_name = hashlib.sha224(searchText.encode(encoding="UTF-8", errors="replace")).digest()
+        base_name = str(base64.b64encode(base_name, altchars=b"_."), "UTF-8")[:-2]  # substring gets rid of final '=='
+        suffix = ""
+        counter = -1
+        while connection.execute("SELECT 1 FROM names WHERE base_name = ?", (base_name + suffix, )).fetchone() is not None:
+            counter += 1
+            suffix = "-{0}".format(counter)
+        base_name += suffix
+        connection.execute("INSERT INTO names (search_text, base_name) VALUES (?, ?)", (searchText, base_name))
+        return base_name
 
     def get_base_name(self, formula_type, formula, color, scale, engine):
         """Get base name for formula with given formula type, color and scale."""
-        searchText = self.__get_search_text(formula_type, formula, color, scale, engine)
-        with self.__internal_lock:
-            if self.__database is None:
-                self.__database = self.__read_database()
-            if searchText in self.__database[0]:
-                return self.__database[0][searchText]
-            else:
-                base_name = hashlib.sha224(searchText.encode(encoding="UTF-8", errors="replace")).digest()
-                base_name = str(base64.b64encode(base_name, altchars=b"_."), "UTF-8")[:-2]  # substring gets rid of final '=='
-                suffix = ""
-                counter = -1
-                while base_name + suffix in self.__database[1]:
-                    counter += 1
-                    suffix = "-{0}".format(counter)
-                base_name += suffix
-                self.__database[1].add(base_name)
-                self.__database[0][searchText] = base_name
-                self.__write_database(self.__database)
-                return base_name
+        return self.get_base_names([(formula, color, scale, formula_type, engine)])[0]
 
     def get_base_names(self, formula_color_scale_formula_type_list):
         """Get base name for formula with given formula type, color, scale and engine."""
-        result = []
-        changed = False
+        search_texts = [self.__get_search_text(formula_type, formula, color, scale, engine) for (formula, color, scale, formula_type, engine) in formula_color_scale_formula_type_list]
         with self.__internal_lock:
-            if self.__database is None:
-                self.__database = self.__read_database()
-            for (formula, color, scale, formula_type, engine) in formula_color_scale_formula_type_list:
-                searchText = self.__get_search_text(formula_type, formula, color, scale, engine)
-                if searchText in self.__database[0]:
-                    result.append(self.__database[0][searchText])
-                else:
-                    base_name = hashlib.sha224(searchText.encode(encoding="UTF-8", errors="replace")).digest()
-                    base_name = str(base64.b64encode(base_name, altchars=b"_."), "UTF-8")[:-2]  # substring gets rid of final '=='
-                    suffix = ""
-                    counter = -1
-                    while base_name + suffix in self.__database[1]:
-                        counter += 1
-                        suffix = "-{0}".format(counter)
-                    base_name += suffix
-                    self.__database[1].add(base_name)
-                    self.__database[0][searchText] = base_name
-                    changed = True
-                    result.append(base_name)
-            if changed:
-                self.__write_database(self.__database)
-        return result
+            connection = self.__connect()
+            # One transaction for the whole list, which also keeps concurrent
+            # builds from assigning the same base name twice
+            with _transaction(connection):
+                return [self.__assign_base_name(connection, searchText) for searchText in search_texts]
 
     # Content cache
 
+    def has_content_in_cache(self, base_name):
+        """Check whether content for base_name is cached, without loading it."""
+        if self.__cache_directory is None:
+            return False
+        with self.__internal_lock:
+            try:
+                connection = self.__connect()
+                return connection.execute("SELECT 1 FROM contents WHERE name = ?", (base_name, )).fetchone() is not None
+            except sqlite3.Error as e:
+                _LOGGER.warn("Cannot look up {0} in formulae cache: {1}".format(base_name, e))
+                return False
+
     def get_content_from_cache(self, base_name):
         """Retrieve content from cache. Returns None if base_name wasn't cached."""
         if self.__cache_directory is None:
             return None
-        fn = os.path.join(self.__cache_directory, base_name)
-        try:
-            with open(fn, "rb") as file:
-                return file.read()
-        except Exception:
-            return None
+        with self.__internal_lock:
+            try:
+                connection = self.__connect()
+                row = connection.execute("SELECT data FROM contents WHERE name = ?", (base_name, )).fetchone()
+            except sqlite3.Error as e:
+                _LOGGER.warn("Cannot retrieve {0} from formulae cache: {1}".format(base_name, e))
+                return None
+            if row is None:
+                return None
+            self.__pending_uses[base_name] = time.time()
+            pending = len(self.__pending_uses)
+        if pending >= self.__max_pending_uses:
+            self.flush()
+        return bytes(row[0])
+
+    def flush(self):
+        """Write the collected times of use of cached contents to the database."""
+        with self.__internal_lock:
+            if not self.__pending_uses:
+                return
+            try:
+                connection = self.__connect()
+                with _transaction(connection):
+                    self.__write_pending_uses(connection)
+            except sqlite3.Error as e:
+                _LOGGER.warn("Cannot update formulae cache: {0}".format(e))
+
+    def __write_pending_uses(self, connection):
+        """Write the collected times of use. Must be called in a transaction."""
+        connection.executemany("UPDATE contents SET last_used = ? WHERE name = ?", [(last_used, name) for name, last_used in self.__pending_uses.items()])
+        self.__pending_uses = {}
 
     def put_content_into_cache(self, base_name, content):
         """Put the content in the cache under base_name.
@@ -410,29 +515,48 @@ class FormulaCache(object):
         """
         if self.__cache_directory is None:
             return False
-        if not self.__cache_directory_exists:
-            self.__cache_directory_exists = _ensure_dir_existence(self.__cache_directory)
-        fn = os.path.join(self.__cache_directory, base_name)
-        try:
-            with open(fn, "wb") as file:
-                file.write(content)
-                return True
-        except Exception as e:
-            _LOGGER.warn("Cannot store content into cache file {0}: {1}".format(fn, e))
+        with self.__internal_lock:
             try:
-                os.remove(fn)
-            except Exception:
-                pass
-            return False
+                connection = self.__connect()
+                with _transaction(connection):
+                    # Eviction needs to know which contents were used recently
+                    self.__write_pending_uses(connection)
+                    connection.execute("INSERT OR REPLACE INTO contents (name, data, size, last_used) VALUES (?, ?, ?, ?)", (base_name, sqlite3.Binary(content), len(content), time.time()))
+                    if self.__max_size is not None:
+                        self.__evict(connection, base_name)
+                return True
+            except sqlite3.Error as e:
+                _LOGGER.warn("Cannot store {0} into formulae cache: {1}".format(base_name, e))
+                return False
+
+    def __evict(self, connection, keep):
+        """Remove least recently used contents until the cache is small enough. Must be called in a transaction."""
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM contents").fetchone()[0]
+        if total <= self.__max_size:
+            return
+        evict = []
+        for name, size in connection.execute("SELECT name, size FROM contents ORDER BY last_used"):
+            if total <= self.__max_size:
+                break
+            if name != keep:
+                evict.append((name, ))
+                total -= size
+        connection.executemany("DELETE FROM contents WHERE name = ?", evict)
+        _LOGGER.debug("Evicted {0} formulae from cache".format(len(evict)))
 
 
 class LaTeXFormulaRenderer(object):
     """Abstracts the process of converting a formula to an image file."""
 
-    def __init__(self, additional_preamble={}):
-        """Create an LaTeXFormulaRenderer object. Additional preambles can be specified."""
+    def __init__(self, additional_preamble={}, timeout=None):
+        """Create an LaTeXFormulaRenderer object.
+
+        Additional preambles can be specified. If ``timeout`` is given, every
+        program run for rendering is stopped after that many seconds.
+        """
         super(LaTeXFormulaRenderer, self).__init__()
         self.__additional_preamble = additional_preamble
+        self.__timeout = timeout
         self.__engines = {}
         for engine, entries in _ENGINES.items():
             self.__engines[engine] = {}
@@ -507,19 +631,23 @@ class LaTeXFormulaRenderer(object):
         """Check whether the formula requires XY-Pic."""
         return formula.find(r'\xymatrix') >= 0
 
+    def _get_TeX_header_for(self, formula, color, formula_type, texfile_data):
+        """Compose header contents of the .tex file for the given formula."""
+        return self._get_LaTeX_header(
+            color,
+            self._needs_XY(formula),
+            isinstance(formula_type, (tuple, list)) and formula_type[0] == 'tikzpicture',
+            isinstance(formula_type, (tuple, list)) and formula_type[0] == 'pstricks',
+            formula_type == 'align',
+            texfile_data['programs']
+        )
+
     def _create_TeX_file(self, formula, color, formula_type, texfile_data):
         """Create .tex file for processing with latex (to create .dvi file)."""
         form_head, form_tail = self._get_form_head_tail(formula_type)
         return ''.join([
             texfile_data['head'],
-            self._get_LaTeX_header(
-                color,
-                self._needs_XY(formula),
-                isinstance(formula_type, (tuple, list)) and formula_type[0] == 'tikzpicture',
-                isinstance(formula_type, (tuple, list)) and formula_type[0] == 'pstricks',
-                formula_type == 'align',
-                texfile_data['programs']
-            ),
+            self._get_TeX_header_for(formula, color, formula_type, texfile_data),
             texfile_data['middle'],
             form_head,
             formula,
@@ -528,6 +656,27 @@ class LaTeXFormulaRenderer(object):
             texfile_data['tail'],
         ])
 
+    def _create_batch_TeX_file(self, formulae, color, texfile_data, header):
+        """Create .tex file with one page per formula.
+
+        ``formulae`` is a list of tuples ``(formula, formula_type)``.
+        """
+        head = texfile_data['head']
+        standalone = R'\documentclass{standalone}'
+        parts = []
+        if standalone in head:
+            # Let standalone put every formula on its own cropped page
+            head = head.replace(standalone, R'\documentclass[multi=nikolaformula]{standalone}')
+            header = R'\newenvironment{nikolaformula}{}{}' + '\n' + header
+            page_head, page_tail = R'\begin{nikolaformula}\color{mycolor}' + '\n', '\n' + R'\end{nikolaformula}' + '\n'
+        else:
+            # The pages are cropped by the conversion steps
+            page_head, page_tail = '', '\n' + R'\clearpage' + '\n'
+        for formula, formula_type in formulae:
+            form_head, form_tail = self._get_form_head_tail(formula_type)
+            parts.extend([page_head, form_head, formula, form_tail, page_tail])
+        return ''.join([head, header, texfile_data['middle']] + parts + [texfile_data['tail']])
+
     # -----------------------------------------------------------------------
     # Conversion to output format
 
@@ -538,6 +687,7 @@ class LaTeXFormulaRenderer(object):
 
         ``output_format`` can be one of ``png``, ``svg``, and ``svgz``.
         """
+        # See _get_batch_conversion_steps() for the multi-page version
         steps = []
         if output_format == 'png':
             # Convert to PNG
@@ -590,6 +740,70 @@ class LaTeXFormulaRenderer(object):
             raise Exception("Don't know how to convert from '{0}' to '{1}'!".format(input_format, output_format))
         return steps
 
+    def _get_batch_conversion_steps(self, input_format, output_format, scale):
+        """Create execution steps to convert a multi-page document into one file per page.
+
+        The last step writes the pages to ``{basename}-<page>.<output_format>``.
+        If the result still has to be compressed, ``True`` is returned as the
+        second value.
+        """
+        steps = []
+        compress = False
+        if output_format == 'png':
+            if input_format == 'pdf':
+                steps.append({
+                    'format': 'png',
+                    'call': ['convert', '-density', str(int(100 * scale)), '{input}', '{pages}'],
+                    'pages': '%d',
+                    'error': "Cannot convert PDF file to PNG files!"
+                })
+            elif input_format == 'dvi':
+                steps.append({
+                    'format': 'png',
+                    'call': ['dvipng', '{input}', '-bg', 'Transparent', '-T', 'tight', '-D', str(int(100 * scale)), '-z', '9', '-o', '{pages}'],
+                    'pages': '%d',
+                    'error': "Cannot convert DVI file to PNG files!"
+                })
+        elif output_format in ('svg', 'svgz'):
+            if input_format == 'pdf':
+                steps.append({
+                    'format': 'tmp.pdf',
+                    'call': ['gs', '-o', '{output}', '-dNoOutputFonts', '-SDEVICE=pdfwrite', '{input}'],
+                    'error': "Cannot convert text in PDF file to outlines!"
+                })
+                steps.append({
+                    'format': 'svg',
+                    'call': ['pdf2svg', '{input}', '{pages}', 'all'],
+                    'pages': '%d',
+                    'error': "Cannot convert PDF file to SVG files!"
+                })
+                compress = (output_format == 'svgz')
+            elif input_format == 'dvi':
+                options = ['-n', '-p', '1-']
+                if output_format == 'svgz':
+                    options.append('-z')
+                steps.append({
+                    'format': output_format,
+                    'call': ['dvisvgm'] + options + ['{input}', '-o', '{pages}'],
+                    'pages': '%p',
+                    'error': "Cannot convert DVI file to {0} files!".format(output_format.upper())
+                })
+        if len(steps) == 0:
+            raise NotImplementedError("Don't know how to convert multiple pages from '{0}' to '{1}'!".format(input_format, output_format))
+        return steps, compress
+
+    def _collect_pages(self, base_name, page_format, tempdir):
+        """Find the files written by a step with ``pages``, ordered by page number."""
+        prefix = base_name + '-'
+        suffix = '.' + page_format
+        pages = []
+        for file_name in os.listdir(tempdir):
+            if file_name.startswith(prefix) and file_name.endswith(suffix):
+                number = file_name[len(prefix):-len(suffix)]
+                if number.isdigit():
+                    pages.append((int(number), os.path.join(tempdir, file_name)))
+        return [file_name for _, file_name in sorted(pages)]
+
     # -----------------------------------------------------------------------
     # Main rendering function
 
@@ -603,6 +817,7 @@ class LaTeXFormulaRenderer(object):
         kw = {
             'input': input_file,
             'output': out_file,
+            'pages': os.path.join(tempdir, '{0}-{1}.{2}'.format(base_name, execution_step.get('pages', ''), out_format)),
             'basename': base_name,
             'tempdir': tempdir,
         }
@@ -610,12 +825,20 @@ class LaTeXFormulaRenderer(object):
         # Execute
         catch_output = execution_step.get('catch_output', False)
         _LOGGER.debug('Executing "{0}"...'.format(' '.join(commandline)))
-        if catch_output:
-            p = subprocess.Popen(commandline, shell=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output, error = p.communicate('')
-            ret_code = p.returncode
-        else:
-            ret_code = subprocess.call(commandline, shell=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if catch_output:
+                p = subprocess.Popen(commandline, shell=False, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                try:
+                    output, error = p.communicate(timeout=self.__timeout)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+                    p.communicate()
+                    raise
+                ret_code = p.returncode
+            else:
+                ret_code = subprocess.call(commandline, shell=False, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=self.__timeout)
+        except subprocess.TimeoutExpired:
+            raise LaTeXError("Timeout after {0} seconds while running '{1}'!".format(self.__timeout, ' '.join(commandline)))
         # Checking return value
         if ret_code != 0:
             try:
@@ -638,6 +861,79 @@ class LaTeXFormulaRenderer(object):
             raise LaTeXError(execution_step.get('error', message).format(**kw), ret_code)
         return out_format, out_file
 
+    def _get_engine_data(self, formula_type, engine):
+        """Return name of formula type and the engine entry which handles it."""
+        # Check engine
+        if engine not in self.__engines:
+            raise NotImplementedError("Unknown LaTeX engine '{0}'!".format(engine))
+        # Extract and check formula type
+        if isinstance(formula_type, (tuple, list)):
+            formula_type_name = formula_type[0]
+        else:
+            formula_type_name = formula_type
+        if formula_type_name not in self.__engines[engine]:
+            raise NotImplementedError("Formula type '{0}' not supported by engine '{1}'!".format(formula_type_name, engine))
+        return formula_type_name, self.__engines[engine][formula_type_name]
+
+    def get_batch_key(self, formula, formula_type, color, scale, engine='latex'):
+        """Return a key such that formulae with the same key can be rendered together by ``render_formulae``.
+
+        Returns ``None`` if the formula cannot be rendered in a batch.
+        """
+        try:
+            formula_type_name, engine_data = self._get_engine_data(formula_type, engine)
+        except NotImplementedError:
+            return None
+        if not engine_data.get('batch', True):
+            return None
+        texfile_data = engine_data['texfile']
+        header = self._get_TeX_header_for(formula, color, formula_type, texfile_data)
+        return (engine, tuple(sorted(engine_data['types'])), header, scale)
+
+    def render_formulae(self, formulae, color, scale, base_name, output_format, engine='latex'):
+        """Render several formulae with one run of LaTeX.
+
+        ``formulae`` is a list of tuples ``(formula, formula_type)``; all of
+        them together with ``color``, ``scale`` and ``engine`` must have the
+        same key according to ``get_batch_key``. Every formula is put on its
+        own page, and the pages are converted to images in one go.
+
+        Returns a list with the formulae as byte arrays. If one formula cannot
+        be rendered, the whole batch fails.
+        """
+        formula_type_name, engine_data = self._get_engine_data(formulae[0][1], engine)
+        texfile_data = engine_data['texfile']
+        header = self._get_TeX_header_for(formulae[0][0], color, formulae[0][1], texfile_data)
+        _LOGGER.info("Converting {0} formulae in batch {1} (w/{2})".format(len(formulae), base_name, engine))
+        tempdir = tempfile.mkdtemp()
+        try:
+            intermediate_file = os.path.join(tempdir, base_name + '.tex')
+            content = self._create_batch_TeX_file(formulae, color, texfile_data, header)
+            with open(intermediate_file, 'wb') as f:
+                f.write(content.encode('utf-8'))
+
+            steps = engine_data['steps']
+            conversion_steps, compress = self._get_batch_conversion_steps(steps[-1]['format'], output_format, scale)
+            for step in steps + conversion_steps:
+                intermediate_format, intermediate_file = self._execute_step(step, intermediate_file, base_name, tempdir)
+
+            pages = self._collect_pages(base_name, intermediate_format, tempdir)
+            if len(pages) != len(formulae):
+                raise LaTeXError("Expected {0} pages, but got {1}!".format(len(formulae), len(pages)))
+            result = []
+            for page in pages:
+                with open(page, "rb") as file:
+                    data = file.read()
+                if compress:
+                    buffer = io.BytesIO()
+                    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as file:
+                        file.write(data)
+                    data = buffer.getvalue()
+                result.append(data)
+            return result
+        finally:
+            shutil.rmtree(tempdir, True)
+
     def render_formula(self, formula, formula_type, color, scale, base_name, output_format, engine='latex'):
         """Render formula as image.
 
@@ -651,19 +947,9 @@ class LaTeXFormulaRenderer(object):
 
         Returns the formula as a byte array.
         """
-        # Check engine
-        if engine not in self.__engines:
-            raise NotImplementedError("Unknown LaTeX engine '{0}'!".format(engine))
-        # Extract and check formula type
-        if isinstance(formula_type, (tuple, list)):
-            formula_type_name = formula_type[0]
-        else:
-            formula_type_name = formula_type
-        if formula_type_name not in self.__engines[engine]:
-            raise NotImplementedError("Formula type '{0}' not supported by engine '{1}'!".format(formula_type_name, engine))
+        formula_type_name, engine_data = self._get_engine_data(formula_type, engine)
         # Process formula
         _LOGGER.info("Converting formula {0}({1} w/{2}): '{3}'".format(base_name, formula_type_name, engine, formula))
-        engine_data = self.__engines[engine][formula_type_name]
         tempdir = tempfile.mkdtemp()
         try:
             # First step: generate TeX file
@@ -819,11 +1105,16 @@ class LaTeXFormulaRendererPlugin(Task):
 
         self.__formula_cache = FormulaCache()
         self.__formula_cache.set_cache_directory(os.path.join(site.config['CACHE_FOLDER'], 'formulae'))
+        self.__formula_cache.set_max_size(site.config.get('LATEX_FORMULA_CACHE_MAX_SIZE', 64 * 1024 * 1024))
+        atexit.register(self.__formula_cache.flush)
         formula_folder = site.config.get('LATEX_FORMULA_FOLDER', 'formulae')
         self.__formula_cache.set_output_prefix(formula_folder)
         self.__formula_cache.set_output_directory(os.path.join(site.config['OUTPUT_FOLDER'], formula_folder.strip('/')))
         self.__formula_as_data_URIs = site.config.get('LATEX_FORMULA_AS_DATAURI', False)
         self.__output_format = site.config.get('LATEX_FORMULA_OUTPUT_FORMAT', 'png')
+        self.__batch_size = site.config.get('LATEX_FORMULA_BATCH_SIZE', 100)
+        self.__render_processes = site.config.get('LATEX_FORMULA_RENDER_PROCESSES', 0) or os.cpu_count() or 1
+        self.__render_timeout = site.config.get('LATEX_FORMULA_RENDER_TIMEOUT', 300)
         self.__formula_additional_preamble = site.config.get('LATEX_FORMULA_ADDITIONAL_PREAMBLE', {})
         if not isinstance(self.__formula_additional_preamble, dict):
             self.__formula_additional_preamble = {'': self.__formula_additional_preamble}
@@ -841,11 +1132,68 @@ class LaTeXFormulaRendererPlugin(Task):
         extension = ".{0}".format(self.__output_format)
         data = self.__formula_cache.get_content_from_cache(base_name + extension)
         if data is None:
-            renderer = LaTeXFormulaRenderer(self.__formula_additional_preamble)
+            renderer = LaTeXFormulaRenderer(self.__formula_additional_preamble, self.__render_timeout)
             data = renderer.render_formula(formula, formula_type, color, scale, _sanitizeName(base_name), self.__output_format, engine=engine)
             self.__formula_cache.put_content_into_cache(base_name + extension, data)
         return data
 
+    def _generate_formulae(self, formulae):
+        """Make sure all formulae are cached, rendering the missing ones in batches.
+
+        ``formulae`` is a list of tuples ``(base_name, formula, formula_type,
+        color, scale, engine)``. Formulae which can share a LaTeX run are
+        rendered together, in batches of at most ``LATEX_FORMULA_BATCH_SIZE``.
+        If a batch fails, its formulae are rendered one by one. Up to
+        ``LATEX_FORMULA_RENDER_PROCESSES`` batches are rendered at the same
+        time; formulae which cannot be rendered are skipped.
+        """
+        extension = ".{0}".format(self.__output_format)
+        renderer = LaTeXFormulaRenderer(self.__formula_additional_preamble, self.__render_timeout)
+        batches = {}
+        for base_name, formula, formula_type, color, scale, engine in formulae:
+            if self.__formula_cache.has_content_in_cache(base_name + extension):
+                continue
+            key = renderer.get_batch_key(formula, formula_type, color, scale, engine) if self.__batch_size > 1 else None
+            batches.setdefault(key, []).append((base_name, formula, formula_type, color, scale, engine))
+        jobs = []
+        for key, batch in batches.items():
+            if key is None:
+                jobs.extend([entry] for entry in batch)
+                continue
+            # Split large batches so that all workers have something to do
+            size = min(self.__batch_size, -(-len(batch) // self.__render_processes))
+            for start in range(0, len(batch), size):
+                jobs.append(batch[start:start + size])
+        if self.__render_processes > 1 and len(jobs) > 1:
+            # Rendering happens in external programs, so threads are enough
+            with concurrent.futures.ThreadPoolExecutor(self.__render_processes) as executor:
+                for job in jobs:
+                    executor.submit(self._generate_batch, renderer, job)
+        else:
+            for job in jobs:
+                self._generate_batch(renderer, job)
+
+    def _generate_batch(self, renderer, batch):
+        """Render a batch of formulae with the same batch key and put them into the cache."""
+        extension = ".{0}".format(self.__output_format)
+        if len(batch) > 1:
+            _, _, _, color, scale, engine = batch[0]
+            try:
+                datas = renderer.render_formulae(
+                    [(formula, formula_type) for _, formula, formula_type, _, _, _ in batch],
+                    color, scale, _sanitizeName(batch[0][0]), self.__output_format, engine=engine)
+                for (base_name, _, _, _, _, _), data in zip(batch, datas):
+                    self.__formula_cache.put_content_into_cache(base_name + extension, data)
+                return
+            except Exception as e:
+                _LOGGER.warn("Cannot render {0} formulae in one batch, rendering them one by one: {1}".format(len(batch), e))
+        for base_name, formula, formula_type, color, scale, engine in batch:
+            try:
+                self._generate_formula(base_name, formula, formula_type, color, scale, engine)
+            except Exception as e:
+                # The task for this formula will report the error
+                _LOGGER.warn("Cannot render formula {0}: {1}".format(base_name, e))
+
     def _write_formula(self, data, base_name, extension):
         """Write formula into output directory."""
         file_name = os.path.join(self.__formula_cache.get_output_directory(), base_name + extension)
@@ -922,8 +1270,16 @@ class LaTeXFormulaRendererPlugin(Task):
                 formulae.append(last)
             # Get base names for list of formulae
             base_names = self.__formula_cache.get_base_names(formulae)
-            # Generate tasks
+            # Render all formulae which are not yet cached with as few LaTeX runs as possible
             extension = ".{0}".format(self.__output_format)
+            batch_task_name = '{0}:batch'.format(self.name)
+            yield {
+                'basename': self.name,
+                'name': 'batch',
+                'actions': [(self._generate_formulae, [[(base_name, formula, formula_type, color, scale, engine) for base_name, (formula, color, scale, formula_type, engine) in zip(base_names, formulae)]])],
+                'uptodate': [utils.config_changed({0: base_names, 1: self.__output_format, 2: self.__batch_size}, batch_task_name)],
+            }
+            # Generate tasks
             generated = set()
             for base_name, (formula, color, scale, formula_type, engine) in zip(base_names, formulae):
                 destination = os.path.normpath(os.path.join(self.__formula_cache.get_output_directory(), base_name + extension))
@@ -934,6 +1290,7 @@ class LaTeXFormulaRendererPlugin(Task):
                         'name': destination,
                         'file_dep': [],
                         'targets': [destination],
+                        'task_dep': [batch_task_name],
                         'actions': [(self._copy_formula, [base_name, extension, formula, color, scale, formula_type, engine])],
                         'clean': True,
                         'uptodate': [utils.config_changed({0: formula, 1: color, 2: scale, 3: formula_type, 4: engine})]
@@ -37,6 +37,9 @@ try {
     process.exit(1);
 }
 
+// Announce the KaTeX version, rendered math is cached per version.
+console.log(JSON.stringify({"version": katex.version}));
+
 const rl = readline.createInterface({
     input: process.stdin,
 });
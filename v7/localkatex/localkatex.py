@@ -25,9 +25,14 @@
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 from __future__ import unicode_literals
+import atexit
+import io
 import subprocess
 import json
-import os.path
+import os
+import selectors
+import threading
+import time
 
 from nikola.plugin_categories import ShortcodePlugin
 from nikola import utils
@@ -35,18 +40,198 @@ from nikola import utils
 jspath = os.path.join(os.path.split(__file__)[0], 'localkatex.js')
 
 
+class KatexTimeout(Exception):
+    """The KaTeX worker did not reply in time."""
+
+
+class KatexWorker(object):
+    """A long-lived Node process rendering one JSON request per line.
+
+    Replies taking longer than ``timeout`` seconds make the worker be
+    killed; it is started again for the next request.
+    """
+
+    def __init__(self, timeout=30):
+        self.process = None
+        self.selector = None
+        self.buffer = b''
+        self.version = None
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def _start(self):
+        self.process = subprocess.Popen(['node', jspath], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.process.stdout, selectors.EVENT_READ)
+        self.buffer = b''
+        try:
+            hello = self._read()
+        except KatexTimeout:
+            hello = None
+        if hello is None or 'version' not in hello:
+            self.close()
+            raise Exception("Cannot import KaTeX. Did you run npm install?")
+        self.version = hello['version']
+
+    def _read(self):
+        """Read one reply; None if the worker exited, KatexTimeout if it took too long."""
+        deadline = time.monotonic() + self.timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.selector.select(remaining):
+                raise KatexTimeout()
+            data = os.read(self.process.stdout.fileno(), 65536)
+            if not data:
+                return None
+            self.buffer += data
+        line, _, self.buffer = self.buffer.partition(b'\n')
+        return json.loads(line.decode('utf-8'))
+
+    def start(self):
+        """Start the worker if it is not running, and return the KaTeX version."""
+        with self.lock:
+            if self.process is None:
+                self._start()
+            return self.version
+
+    def render(self, math, options):
+        """Render math, returning the worker's reply."""
+        request = (json.dumps({'math': math, 'options': options}) + '\n').encode('utf-8')
+        with self.lock:
+            # Restart the worker once if it went away.
+            for attempt in (0, 1):
+                if self.process is None:
+                    self._start()
+                try:
+                    self.process.stdin.write(request)
+                    self.process.stdin.flush()
+                    output = self._read()
+                except (IOError, OSError):
+                    output = None
+                except KatexTimeout:
+                    # Trying again would most likely take as long.
+                    self.close(kill=True)
+                    return {'input': math, 'output': 'KaTeX did not finish within {0} seconds'.format(self.timeout), 'success': False}
+                if output is not None:
+                    return output
+                self.close()
+            raise Exception("KaTeX worker exited unexpectedly")
+
+    def close(self, kill=False):
+        """Stop the worker, killing it right away if kill is set."""
+        if self.process is None:
+            return
+        if not kill:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except Exception:
+                kill = True
+        if kill:
+            self.process.kill()
+            self.process.wait()
+        for stream in (self.process.stdin, self.process.stdout):
+            try:
+                stream.close()
+            except (IOError, OSError):
+                pass
+        self.selector.close()
+        self.process = None
+        self.selector = None
+
+
+class RenderMemo(object):
+    """Rendered math by (math, options), kept in memory and in CACHE_FOLDER.
+
+    Entries are only valid for the KaTeX version they were rendered with.
+    The memo also records which entries each source file used, so that when
+    it is saved, the entries no longer used by the files rendered in this
+    build, or only used by files which are gone, are dropped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = None
+        self.entries = {}
+        self.new_entries = {}
+        self.used = {}
+
+    def load(self, version):
+        """Load the entries rendered with this KaTeX version."""
+        self.version = version
+        self.entries = self._read()['entries']
+        self.entries.update(self.new_entries)
+
+    def _read(self):
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as fd:
+                data = json.load(fd)
+        except (IOError, ValueError):
+            data = {}
+        if data.get('version') != self.version:
+            data = {}
+        return {'entries': data.get('entries', {}), 'sources': data.get('sources', {})}
+
+    @staticmethod
+    def key(math, options):
+        return json.dumps([math, options], sort_keys=True)
+
+    def get(self, key, source):
+        """Return the entry for key, used by the file source, or None."""
+        html = self.entries.get(key)
+        if html is not None:
+            self.used.setdefault(source, set()).add(key)
+        return html
+
+    def put(self, key, html, source):
+        self.entries[key] = html
+        self.new_entries[key] = html
+        self.used.setdefault(source, set()).add(key)
+
+    def save(self):
+        """Write new entries, merged with those other processes saved meanwhile."""
+        if not self.used:
+            return
+        data = self._read()
+        entries = data['entries']
+        entries.update(self.new_entries)
+        sources = dict(data['sources'])
+        for source, keys in self.used.items():
+            sources[source] = sorted(keys)
+        for source in list(sources):
+            if source and not os.path.exists(source):
+                del sources[source]
+        used = set(key for keys in sources.values() for key in keys)
+        entries = dict((key, html) for key, html in entries.items() if key in used)
+        if entries == data['entries'] and sources == data['sources']:
+            return
+        utils.makedirs(os.path.dirname(self.path))
+        with io.open(self.path + '.tmp', 'w', encoding='utf-8') as fd:
+            fd.write(json.dumps({'version': self.version, 'entries': entries, 'sources': sources}, ensure_ascii=False))
+        os.replace(self.path + '.tmp', self.path)
+        self.new_entries = {}
+        self.used = {}
+
+
 class LocalKatex(ShortcodePlugin):
     """Render math using KaTeX while building the site."""
 
     name = 'localkatex'
     _options_available = {'displayMode': bool, 'throwOnError': bool, 'errorColor': str, 'colorIsTextColor': bool}
     logger = None
+    worker = None
+    memo = None
 
     def set_site(self, site):
         """Set Nikola site."""
         site.register_shortcode('lmath', self.handler)
         site.register_shortcode('lmathd', self.handler_display)
         self.logger = utils.get_logger('localkatex')
+        self.worker = KatexWorker(site.config.get('LOCALKATEX_TIMEOUT', 30))
+        atexit.register(self.worker.close)
+        if site.config.get('LOCALKATEX_CACHE', True):
+            self.memo = RenderMemo(os.path.join(site.config['CACHE_FOLDER'], 'localkatex', 'memo.json'))
+            atexit.register(self.memo.save)
         return super(LocalKatex, self).set_site(site)
 
     @staticmethod
@@ -55,8 +240,6 @@ class LocalKatex(ShortcodePlugin):
 
     def handler(self, site, lang, post, data, **options):
         """Render math."""
-        p = subprocess.Popen(['node', jspath], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
-
         if 'display' in options:
             options['displayMode'] = options['display']
             del options['display']
@@ -67,17 +250,24 @@ class LocalKatex(ShortcodePlugin):
             elif k not in self._options_available:
                 raise ValueError("Unknown KaTeX option {0}={1}".format(k, v))
 
-        json_input = json.dumps({'math': data, 'options': options}).encode('utf-8')
-        stdout, stderr = p.communicate(json_input)
-        output = json.loads(stdout.decode('utf-8').strip())
+        if self.memo is not None:
+            version = self.worker.start()
+            if self.memo.version != version:
+                self.memo.load(version)
+            key = self.memo.key(data, options)
+            source = post.translated_source_path(lang) if post is not None else ''
+            html = self.memo.get(key, source)
+            if html is not None:
+                return html
+
+        output = self.worker.render(data, options)
         if output['success']:
+            if self.memo is not None:
+                self.memo.put(key, output['output'], source)
             return output['output']
         else:
-            if output['input'] is None and output['output'] is None:
-                raise Exception("Cannot import KaTeX. Did you run npm install?")
-            else:
-                self.logger.error("In expression {0}: {1}".format(data, output['output']))
-                return '<span class="problematic"><strong>In expression <code>{0}</code>:</strong> {1}</span>'.format(data, output['output'])
+            self.logger.error("In expression {0}: {1}".format(data, output['output']))
+            return '<span class="problematic"><strong>In expression <code>{0}</code>:</strong> {1}</span>'.format(data, output['output'])
 
     def handler_display(self, site, lang, post, data, **options):
         """Render math in display mode."""
@@ -26,11 +26,20 @@
 
 from __future__ import unicode_literals
 import codecs
+import glob
+import gzip
+import hashlib
+import io
 import json
 import os
 
+try:
+    import brotli
+except ImportError:
+    brotli = None  # NOQA
+
 from nikola.plugin_categories import LateTask
-from nikola.utils import apply_filters, config_changed, copy_tree, makedirs
+from nikola.utils import apply_filters, config_changed, copy_tree, makedirs, req_missing
 
 # This is what we need to produce:
 # var tipuesearch = {"pages": [
@@ -48,6 +57,130 @@ from nikola.utils import apply_filters, config_changed, copy_tree, makedirs
 # ]};
 
 
+# With LOCALSEARCH_OUTPUT = 'sharded', the index is instead split per
+# language into shards of compact JSON (each a list of pages like the ones
+# above), listed in a manifest that tipuesearch_shards.js loads:
+# {"version": 1, "default_language": "en", "languages": {"en": {"shards": [
+#     {"url": "tipuesearch/en.0.0123abcd.json", "pages": 120, "size": 98304}
+# ]}}}
+
+
+class fragments_changed(config_changed):
+    """Like config_changed, but the config is computed when the task is checked.
+
+    This lets the check look at the compiled posts, which may only be
+    written by tasks that run before this one.
+    """
+
+    def __init__(self, calc_config, identifier=None):
+        super(fragments_changed, self).__init__({}, identifier)
+        self.calc_config = calc_config
+
+    def _calc_digest(self):
+        self.config = self.calc_config()
+        return super(fragments_changed, self)._calc_digest()
+
+
+class FragmentCache(object):
+    """Index data of each post, cached on disk between builds.
+
+    Every entry is stored with a key describing what it was computed from
+    (title, tags, URL and the compiled post with its dependencies), so a
+    post only has to be stripped again when one of those changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fragments = {}
+        try:
+            with io.open(path, 'r', encoding='utf-8') as fd:
+                self.fragments = json.load(fd)
+        except (IOError, ValueError):
+            pass
+        self.used = set()
+        self.changed = False
+
+    def get(self, name, key, compute):
+        """Return the cached fragment for name, computing it if key changed."""
+        self.used.add(name)
+        entry = self.fragments.get(name)
+        if entry is None or entry['key'] != key:
+            entry = {'key': key, 'page': compute()}
+            self.fragments[name] = entry
+            self.changed = True
+        return entry['page']
+
+    def save(self):
+        """Write the cache, dropping fragments that were not used."""
+        for name in list(self.fragments):
+            if name not in self.used:
+                del self.fragments[name]
+                self.changed = True
+        if not self.changed:
+            return
+        makedirs(os.path.dirname(self.path))
+        with io.open(self.path + '.tmp', 'w', encoding='utf-8') as fd:
+            fd.write(json.dumps(self.fragments, ensure_ascii=False))
+        os.replace(self.path + '.tmp', self.path)
+
+
+def split_shards(pages, shard_size):
+    """Split serialized pages into shards of at most ``shard_size`` bytes.
+
+    ``pages`` is a list of JSON-encoded pages, which are measured in UTF-8
+    bytes.  A page bigger than ``shard_size`` gets a shard of its own.
+    """
+    shards = []
+    current = []
+    size = 2  # the enclosing brackets
+    for page in pages:
+        page_size = len(page.encode('utf-8')) + 1  # the separating comma
+        if current and size + page_size > shard_size:
+            shards.append(current)
+            current = []
+            size = 2
+        current.append(page)
+        size += page_size
+    if current:
+        shards.append(current)
+    return shards
+
+
+def write_if_changed(path, data):
+    """Write bytes to path, unless it already holds exactly those bytes."""
+    try:
+        with io.open(path, 'rb') as fd:
+            if fd.read() == data:
+                return
+    except IOError:
+        pass
+    with io.open(path, 'wb') as fd:
+        fd.write(data)
+
+
+def compressed_paths(path, compress):
+    """Return path along with the precompressed siblings write_compressed() makes."""
+    paths = [path]
+    if 'gz' in compress:
+        paths.append(path + '.gz')
+    if 'br' in compress and brotli is not None:
+        paths.append(path + '.br')
+    return paths
+
+
+def write_compressed(path, data, compress):
+    """Write data to path, along with precompressed siblings."""
+    write_if_changed(path, data)
+    if 'gz' in compress:
+        buf = io.BytesIO()
+        # A fixed mtime keeps the output identical for identical input.
+        with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as fd:
+            fd.write(data)
+        write_if_changed(path + '.gz', buf.getvalue())
+    if 'br' in compress and brotli is not None:
+        write_if_changed(path + '.br', brotli.compress(data))
+
+
 class Tipue(LateTask):
     """Render the blog posts as JSON data."""
 
@@ -60,44 +193,167 @@ class Tipue(LateTask):
             "translations": self.site.config['TRANSLATIONS'],
             "output_folder": self.site.config['OUTPUT_FOLDER'],
             "filters": self.site.config['FILTERS'],
-            "timeline": self.site.timeline,
+            "output": self.site.config.get('LOCALSEARCH_OUTPUT', 'single'),
+            "shard_size": self.site.config.get('LOCALSEARCH_SHARD_SIZE', 512 * 1024),
+            "compress": self.site.config.get('LOCALSEARCH_COMPRESS', ['gz']),
         }
 
         posts = self.site.timeline[:]
-        dst_path = os.path.join(kw["output_folder"], "assets", "js",
-                                "tipuesearch_content.js")
+        js_path = os.path.join(kw["output_folder"], "assets", "js")
+        if kw["output"] == "sharded":
+            dst_path = os.path.join(js_path, "tipuesearch_manifest.json")
+            if 'br' in kw["compress"] and brotli is None:
+                req_missing(['brotli'], 'precompress the search index with brotli', optional=True)
+        else:
+            dst_path = os.path.join(js_path, "tipuesearch_content.js")
+        shard_folder = os.path.join(js_path, "tipuesearch")
+
+        cache_folder = os.path.join(self.site.config['CACHE_FOLDER'], 'localsearch')
+
+        def indexed_posts():
+            # Don't index drafts (Issue #387)
+            return [
+                post for post in posts
+                if not (post.is_draft or post.is_private or post.publish_later)
+            ]
+
+        def fragment_key(post, lang):
+            """Describe everything the index data of a post depends on."""
+            stats = []
+            for dep in [post.translated_base_path(lang)] + post.fragment_deps(lang):
+                try:
+                    st = os.stat(dep)
+                    stats.append([dep, st.st_mtime, st.st_size])
+                except OSError:
+                    stats.append([dep, None, None])
+            key = json.dumps([
+                post.title(lang),
+                post.tags,
+                post.permalink(lang, absolute=True),
+                stats,
+            ], sort_keys=True)
+            return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+        def fragment_keys():
+            return dict(
+                (lang, [fragment_key(post, lang) for post in indexed_posts()])
+                for lang in kw["translations"]
+            )
+
+        def page_data(post, lang):
+            text = post.text(lang, strip_html=True)
+            text = text.replace('^', '')
+
+            data = {}
+            data["title"] = post.title(lang)
+            data["text"] = text
+            data["tags"] = ",".join(post.tags)
+            data["url"] = post.permalink(lang, absolute=True)
+            return data
+
+        def get_pages(lang):
+            fragments = FragmentCache(os.path.join(cache_folder, 'fragments.{0}.json'.format(lang)))
+            pages = []
+            for post in indexed_posts():
+                pages.append(fragments.get(
+                    post.source_path, fragment_key(post, lang),
+                    lambda post=post: page_data(post, lang)))
+            fragments.save()
+            return pages
 
         def save_data():
             pages = []
             for lang in kw["translations"]:
-                for post in posts:
-                    # Don't index drafts (Issue #387)
-                    if post.is_draft or post.is_private or post.publish_later:
-                        continue
-                    text = post.text(lang, strip_html=True)
-                    text = text.replace('^', '')
-
-                    data = {}
-                    data["title"] = post.title(lang)
-                    data["text"] = text
-                    data["tags"] = ",".join(post.tags)
-                    data["url"] = post.permalink(lang, absolute=True)
-                    pages.append(data)
+                pages.extend(get_pages(lang))
             output = json.dumps({"pages": pages}, indent=2)
             output = 'var tipuesearch = ' + output + ';'
             makedirs(os.path.dirname(dst_path))
             with codecs.open(dst_path, "wb+", "utf8") as fd:
                 fd.write(output)
 
-        task = {
-            "basename": str(self.name),
-            "name": dst_path,
-            "targets": [dst_path],
-            "actions": [(save_data, [])],
-            'uptodate': [config_changed(kw)],
-            'calc_dep': ['_scan_locs:sitemap']
-        }
-        yield apply_filters(task, kw['filters'])
+        def save_shards():
+            makedirs(shard_folder)
+            manifest = {
+                "version": 1,
+                "default_language": self.site.config['DEFAULT_LANG'],
+                "languages": {},
+            }
+            written = set()
+            for lang in kw["translations"]:
+                pages = [
+                    json.dumps(page, separators=(',', ':'), ensure_ascii=False)
+                    for page in get_pages(lang)
+                ]
+                shards = []
+                for i, shard in enumerate(split_shards(pages, kw["shard_size"])):
+                    data = ('[' + ','.join(shard) + ']').encode('utf-8')
+                    # Content-addressed names, so browsers can cache shards forever.
+                    name = '{0}.{1}.{2}.json'.format(lang, i, hashlib.md5(data).hexdigest()[:8])
+                    write_compressed(os.path.join(shard_folder, name), data, kw["compress"])
+                    written.add(name)
+                    shards.append({
+                        "url": "tipuesearch/" + name,
+                        "pages": len(shard),
+                        "size": len(data),
+                    })
+                manifest["languages"][lang] = {"shards": shards}
+
+            # Remove shards (and their compressed siblings) that are gone.
+            for path in glob.glob(os.path.join(shard_folder, '*.json*')):
+                name = os.path.basename(path)
+                for ext in ('.gz', '.br'):
+                    if name.endswith(ext):
+                        name = name[:-len(ext)]
+                if name not in written:
+                    os.unlink(path)
+
+            data = json.dumps(manifest, separators=(',', ':'), sort_keys=True).encode('utf-8')
+            write_compressed(dst_path, data, kw["compress"])
+
+        def shard_targets():
+            """List the manifest and the shards of the last build as targets.
+
+            Shard names depend on their content, which is only known once
+            the task runs, so they are taken from the last manifest.
+            """
+            targets = compressed_paths(dst_path, kw["compress"])
+            try:
+                with io.open(dst_path, 'rb') as fd:
+                    manifest = json.loads(fd.read().decode('utf-8'))
+                urls = [shard["url"] for language in manifest["languages"].values() for shard in language["shards"]]
+            except (IOError, ValueError, KeyError, TypeError, AttributeError):
+                return targets
+            for url in urls:
+                targets.extend(compressed_paths(os.path.join(shard_folder, url.rpartition('/')[2]), kw["compress"]))
+            return targets
+
+        def clean_shards():
+            for path in glob.glob(os.path.join(shard_folder, '*.json*')) + glob.glob(dst_path + '*'):
+                os.unlink(path)
+
+        if kw["output"] == "sharded":
+            task = {
+                "basename": str(self.name),
+                "name": dst_path,
+                "targets": shard_targets(),
+                "actions": [(save_shards, [])],
+                'uptodate': [config_changed(kw), fragments_changed(fragment_keys, 'localsearch')],
+                'calc_dep': ['_scan_locs:sitemap'],
+                'clean': [(clean_shards, [])],
+            }
+            # The shards are already compact, and the filters would only
+            # see the manifest anyway.
+            yield task
+        else:
+            task = {
+                "basename": str(self.name),
+                "name": dst_path,
+                "targets": [dst_path],
+                "actions": [(save_data, [])],
+                'uptodate': [config_changed(kw), fragments_changed(fragment_keys, 'localsearch')],
+                'calc_dep': ['_scan_locs:sitemap']
+            }
+            yield apply_filters(task, kw['filters'])
 
         # Copy all the assets to the right places
         asset_folder = os.path.join(os.path.dirname(__file__), "files")
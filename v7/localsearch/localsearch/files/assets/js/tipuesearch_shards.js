@@ -0,0 +1,43 @@
+/*
+Loader for the sharded Tipue Search index written by the localsearch
+plugin when LOCALSEARCH_OUTPUT = 'sharded'.  Use it instead of
+tipuesearch_content.js:
+
+    tipuesearchLoadShards('/assets/js/tipuesearch_manifest.json', 'en', function() {
+        $('#tipue_search_input').tipuesearch();
+    });
+
+Only the shards of the requested language (or of the default language,
+if that one is not indexed) are downloaded.
+*/
+
+var tipuesearch = {"pages": []};
+
+function tipuesearchLoadShards(manifestUrl, lang, done)
+{
+     $.getJSON(manifestUrl, function(manifest)
+     {
+          var base = manifestUrl.substring(0, manifestUrl.lastIndexOf('/') + 1);
+          var language = manifest.languages[lang] || manifest.languages[manifest.default_language];
+          var shards = new Array(language.shards.length);
+          var requests = $.map(language.shards, function(shard, i)
+          {
+               return $.getJSON(base + shard.url, function(pages)
+               {
+                    shards[i] = pages;
+               });
+          });
+          $.when.apply($, requests).done(function()
+          {
+               // Keep the pages in index order, whatever order the shards arrived in.
+               for (var i = 0; i < shards.length; i++)
+               {
+                    Array.prototype.push.apply(tipuesearch.pages, shards[i]);
+               }
+               if (done)
+               {
+                    done();
+               }
+          });
+     });
+}
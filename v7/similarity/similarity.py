@@ -26,26 +26,231 @@
 
 from __future__ import print_function, unicode_literals
 
+import hashlib
+import io
 import json
 import os
+import pickle
+
+from concurrent.futures import ProcessPoolExecutor
 
 import time
 
 import gensim
+import numpy
+import scipy.sparse
 from stop_words import get_stop_words
 
 from nikola.plugin_categories import LateTask
 from nikola import utils
 
 
+# Number of posts scored at once; bounds the size of the dense score matrices.
+CHUNK_SIZE = 256
+
+
+class SimilarityIndex(object):
+    """A persistent, incrementally updated LSI index for one language.
+
+    Documents are identified by a key (the post source path) and carry a
+    digest of their content.  Only documents whose digest changed since the
+    last build are tokenized and folded into the model; everything else is
+    reused from the on-disk cache.
+    """
+
+    # Bump this whenever the pickled layout changes.
+    version = 1
+
+    def __init__(self, path, num_topics=2):
+        self.path = path
+        self.num_topics = num_topics
+        self.docs = {}
+        self.neighbours = {}
+        self.dictionary = gensim.corpora.Dictionary()
+        self.lsi = None
+        self.trained_size = 0
+        self.pending = 0
+
+    def load(self):
+        """Load the index from disk, if a compatible one exists."""
+        try:
+            with open(self.path, 'rb') as inf:
+                data = pickle.load(inf)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return False
+        if data.get('version') != self.version or data.get('num_topics') != self.num_topics:
+            return False
+        self.docs = data['docs']
+        self.neighbours = data['neighbours']
+        self.dictionary = data['dictionary']
+        self.lsi = data['lsi']
+        self.trained_size = data['trained_size']
+        self.pending = data['pending']
+        return True
+
+    def save(self):
+        """Atomically write the index to disk."""
+        utils.makedirs(os.path.dirname(self.path))
+        data = {
+            'version': self.version,
+            'num_topics': self.num_topics,
+            'docs': self.docs,
+            'neighbours': self.neighbours,
+            'dictionary': self.dictionary,
+            'lsi': self.lsi,
+            'trained_size': self.trained_size,
+            'pending': self.pending,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as outf:
+            pickle.dump(data, outf, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+
+    def update(self, documents):
+        """Fold new or changed documents into the index.
+
+        ``documents`` is a list of ``(key, digest, tokenize)`` tuples, where
+        ``tokenize`` is a callable returning the document's words.  It is
+        only called for documents that are not already indexed with the
+        same digest.  Returns the number of documents that changed.
+        """
+        keys = set(key for key, _, _ in documents)
+        removed = [key for key in self.docs if key not in keys]
+        for key in removed:
+            del self.docs[key]
+            self.neighbours.pop(key, None)
+
+        changed = []
+        for key, digest, tokenize in documents:
+            entry = self.docs.get(key)
+            if entry is not None and entry['digest'] == digest:
+                continue
+            words = tokenize()
+            self.dictionary.add_documents([words])
+            entry = {'digest': digest, 'bow': self.dictionary.doc2bow(words)}
+            self.docs[key] = entry
+            changed.append(entry['bow'])
+
+        self.pending += len(changed) + len(removed)
+        if self.lsi is None or self.pending * 2 > max(self.trained_size, 1):
+            # Too much has changed since the model was trained (or there is
+            # no model yet), so start over from the cached bags of words.
+            self._train()
+        elif changed:
+            self.lsi.add_documents([self._known(bow) for bow in changed])
+        return len(changed) + len(removed)
+
+    def _train(self):
+        corpus = [entry['bow'] for entry in self.docs.values()]
+        self.lsi = gensim.models.LsiModel(corpus, id2word=self.dictionary, num_topics=self.num_topics)
+        self.trained_size = len(corpus)
+        self.pending = 0
+
+    def _known(self, bow):
+        """Drop words the LSI model has not been trained on yet."""
+        num_terms = self.lsi.num_terms
+        return [(word_id, count) for word_id, count in bow if word_id < num_terms]
+
+    def matrix(self, keys):
+        """Return the normalized LSI vectors of ``keys``, one row per document."""
+        corpus = [self.lsi[self._known(self.docs[key]['bow'])] for key in keys]
+        return gensim.similarities.MatrixSimilarity(corpus, num_features=self.num_topics).index
+
+
+def incidence_matrix(rows):
+    """Build a binary sparse document×term matrix from lists of terms."""
+    vocabulary = {}
+    indices = []
+    indptr = [0]
+    for terms in rows:
+        indices.extend(vocabulary.setdefault(term, len(vocabulary)) for term in set(terms))
+        indptr.append(len(indices))
+    data = numpy.ones(len(indices), dtype=numpy.float64)
+    return scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(rows), len(vocabulary)))
+
+
+def dice_matrix(incidence):
+    """Return the Dice coefficient between every pair of rows as a sparse matrix.
+
+    Rows with no terms at all get a similarity of 0 to everything.
+    """
+    overlap = (incidence * incidence.T).tocoo()
+    sizes = numpy.asarray(incidence.sum(axis=1)).ravel()
+    # Totally making this up
+    data = 2.0 * overlap.data / (sizes[overlap.row] + sizes[overlap.col])
+    return scipy.sparse.csr_matrix((data, (overlap.row, overlap.col)), shape=overlap.shape)
+
+
+def top_k(scores, k):
+    """Return the column indices of the ``k`` best scores of each row, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return numpy.zeros((scores.shape[0], 0), dtype=int)
+    best = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = numpy.take_along_axis(scores, best, axis=1)
+    order = numpy.argsort(-best_scores, axis=1, kind="stable")
+    return numpy.take_along_axis(best, order, axis=1)
+
+
+# Score matrices shared with worker processes, see _init_worker().
+_matrices = {}
+
+
+def _init_worker(body_vectors, tag_matrix, title_matrix):
+    _matrices["body"] = body_vectors
+    _matrices["tag"] = tag_matrix
+    _matrices["title"] = title_matrix
+
+
+def score_chunk(start, stop, count):
+    """Find the ``count`` most related posts for posts ``start`` to ``stop``.
+
+    Returns the neighbour indices and the matching total, tag, title and
+    body scores, each as a ``(stop - start) × count`` array.
+    """
+    body_vectors = _matrices["body"]
+    tag_sims = _matrices["tag"][start:stop].toarray()
+    title_sims = _matrices["title"][start:stop].toarray()
+    body_sims = numpy.dot(body_vectors[start:stop], body_vectors.T)
+    full_sims = tag_sims + title_sims + body_sims * 1.5
+    # A post is not related to itself.
+    for offset in range(full_sims.shape[0]):
+        full_sims[offset, start + offset] = -numpy.inf
+    best = top_k(full_sims, min(count, full_sims.shape[1] - 1))
+    return tuple(
+        [best] + [numpy.take_along_axis(sims, best, axis=1) for sims in (full_sims, tag_sims, title_sims, body_sims)]
+    )
+
+
+def related_table(body_vectors, tag_matrix, title_matrix, count, processes=1):
+    """Compute the related posts of every post in one pass.
+
+    Posts are scored in chunks of ``CHUNK_SIZE``; with ``processes`` > 1
+    the chunks are spread over a process pool.  Returns the same arrays
+    as ``score_chunk``, covering all posts.
+    """
+    size = body_vectors.shape[0]
+    chunks = [(start, min(start + CHUNK_SIZE, size), count) for start in range(0, size, CHUNK_SIZE)]
+    matrices = (body_vectors, tag_matrix, title_matrix)
+    if processes > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=matrices) as executor:
+            results = list(executor.map(score_chunk, *zip(*chunks)))
+    else:
+        _init_worker(*matrices)
+        try:
+            results = [score_chunk(*chunk) for chunk in chunks]
+        finally:
+            _matrices.clear()
+    if not results:
+        return tuple(numpy.zeros((0, 0)) for _ in range(5))
+    return tuple(numpy.concatenate(arrays) for arrays in zip(*results))
+
+
 class Similarity(LateTask):
     """Calculate post similarity."""
 
     name = "similarity"
 
-    def set_site(self, site):
-        self.site = site
-
     def gen_tasks(self):
         """Build similarity data for each post."""
         self.site.scan_posts()
@@ -58,12 +263,15 @@ class Similarity(LateTask):
         kw = {
             "translations": self.site.translations,
             "output_folder": self.site.config["OUTPUT_FOLDER"],
+            "cache_folder": self.site.config["CACHE_FOLDER"],
             "similar_count": self.site.config.get("SIMILAR_COUNT", 10),
         }
+        # Only affects how fast the data is computed, so not part of kw.
+        processes = self.site.config.get("SIMILARITY_PROCESSES", 1)
 
         stopwords = {}
         for l in self.site.translations:
-            stopwords[l] = get_stop_words(l)
+            stopwords[l] = set(get_stop_words(l))
 
         def split_text(text, lang="en"):
             words = text.lower().split()
@@ -71,92 +279,90 @@ class Similarity(LateTask):
 
         yield self.group_task()
 
-        def tags_similarity(p1, p2):
-            t1 = set(p1.tags)
-            t2 = set(p2.tags)
-            if not (t1 and t2):
-                return 0
-            # Totally making this up
-            return 2.0 * len(t1.intersection(t2)) / (len(t1) + len(t2))
-
-        def title_similarity(p1, p2):
-            t1 = set(split_text(p1.title()))
-            t2 = set(split_text(p2.title()))
-            if not (t1 and t2):
-                return 0
-            # Totally making this up
-            return 2.0 * len(t1.intersection(t2)) / (len(t1) + len(t2))
-
-        indexes = {}
-        dictionaries = {}
-        lsis = {}
-
-        def create_idx(indexes, dictionaries, lsis, lang):
-            texts = []
-            for p in timeline:
-                texts.append(split_text(p.text(strip_html=True, lang=lang), lang=lang))
-            dictionary = gensim.corpora.Dictionary(texts)
-            corpus = [dictionary.doc2bow(text) for text in texts]
-            lsi = gensim.models.LsiModel(corpus, id2word=dictionary, num_topics=2)
-            indexes[lang] = gensim.similarities.MatrixSimilarity(lsi[corpus])
-            dictionaries[lang] = dictionary
-            lsis[lang] = lsi
-
-        def write_similar(
-            path, post, lang, indexes=indexes, dictionaries=dictionaries, lsis=lsis
-        ):
-            if lang not in dictionaries:
-                create_idx(indexes, dictionaries, lsis, lang)
-            doc = split_text(post.text(lang), lang)
-            vec_bow = dictionaries[lang].doc2bow(doc)
-            vec_lsi = lsis[lang][vec_bow]
-            body_sims = indexes[lang][vec_lsi]
-
-            tag_sims = [tags_similarity(post, p) for p in timeline]
-            title_sims = [title_similarity(post, p) for p in timeline]
-            full_sims = [
-                tag_sims[i] + title_sims[i] + body_sims[i] * 1.5
-                for i in range(len(timeline))
-            ]
-            full_sims = sorted(enumerate(full_sims), key=lambda item: -item[1])
-            idx = timeline.index(post)
-            related = [
+        def source_digest(post, lang):
+            """Hash the source a post's text in ``lang`` is compiled from."""
+            with io.open(post.translated_source_path(lang), 'rb') as inf:
+                return hashlib.sha1(inf.read()).hexdigest()
+
+        def out_path(post, lang):
+            return os.path.join(kw["output_folder"], post.destination_path(lang=lang)) + ".related.json"
+
+        def cache_path(post, lang):
+            """Where the related posts of ``post`` are kept until they are copied to the output."""
+            return os.path.join(kw["cache_folder"], "similarity", lang, post.destination_path(lang=lang)) + ".related.json"
+
+        def write_similar(lang):
+            index = SimilarityIndex(os.path.join(kw["cache_folder"], "similarity", lang + ".pickle"))
+            if not index.load():
+                self.logger.info("Building similarity index for language {0}".format(lang))
+            changed = index.update([
                 (
-                    timeline[s[0]],
-                    s[1],
-                    tag_sims[s[0]],
-                    title_sims[s[0]],
-                    body_sims[s[0]],
-                )
-                for s in full_sims[: kw["similar_count"] + 1]
-                if s[0] != idx
-            ]
-            data = []
-            for p, score, tag, title, body in related:
-                data.append(
-                    {
-                        "url": "/" + p.destination_path(sep="/"),
-                        "title": p.title(),
-                        "date": int(time.mktime(p.date.timetuple()) * 1000),
-                        "score": score,
-                        "detailed_score": [tag, title, float(body)],
-                    }
+                    p.source_path,
+                    source_digest(p, lang),
+                    lambda p=p: split_text(p.text(strip_html=True, lang=lang), lang=lang),
                 )
-            with open(path, "w+") as outf:
-                json.dump(data, outf)
+                for p in timeline
+            ])
+            self.logger.debug("{0} posts changed in similarity index for language {1}".format(changed, lang))
+
+            keys = [p.source_path for p in timeline]
+            body_vectors = index.matrix(keys)
+            tag_matrix = dice_matrix(incidence_matrix([p.tags for p in timeline]))
+            title_matrix = dice_matrix(incidence_matrix([split_text(p.title()) for p in timeline]))
+            table = related_table(body_vectors, tag_matrix, title_matrix, kw["similar_count"], processes)
+            written = 0
+            for post, related, full_sims, tag_sims, title_sims, body_sims in zip(timeline, *table):
+                data = []
+                for i, score, tag, title, body in zip(related, full_sims, tag_sims, title_sims, body_sims):
+                    p = timeline[i]
+                    data.append(
+                        {
+                            "url": "/" + p.destination_path(sep="/"),
+                            "title": p.title(),
+                            "date": int(time.mktime(p.date.timetuple()) * 1000),
+                            "score": float(score),
+                            "detailed_score": [float(tag), float(title), float(body)],
+                        }
+                    )
+                # Scores drift a little whenever the model is updated, so
+                # only rewrite the file when the set of neighbours changed.
+                # The per-post tasks only copy files that were rewritten.
+                neighbours = [(d["url"], d["title"], d["date"]) for d in data]
+                path = cache_path(post, lang)
+                if index.neighbours.get(post.source_path) == neighbours and os.path.isfile(path):
+                    continue
+                index.neighbours[post.source_path] = neighbours
+                utils.makedirs(os.path.dirname(path))
+                with open(path, "w+") as outf:
+                    json.dump(data, outf)
+                written += 1
+            index.save()
+            self.logger.debug("Wrote {0} related posts files for language {1}".format(written, lang))
+
+        if not timeline:
+            return
 
         for lang in self.site.translations:
+            # All posts are scored at once, so one task computes the related
+            # posts of every post, and a task per post copies them to the
+            # output when they changed.
             file_dep = [p.translated_source_path(lang) for p in timeline]
-            uptodate = utils.config_changed({1: kw}, "similarity")
-            for i, post in enumerate(timeline):
-                out_name = os.path.join(kw["output_folder"], post.destination_path(lang=lang)) + ".related.json"
-                task = {
+            yield {
+                "basename": self.name,
+                "name": lang,
+                "targets": [cache_path(p, lang) for p in timeline],
+                "actions": [(write_similar, (lang,))],
+                "file_dep": file_dep,
+                "uptodate": [utils.config_changed({1: kw}, "similarity")],
+                "clean": True,
+            }
+            for post in timeline:
+                out_name = out_path(post, lang)
+                yield {
                     "basename": self.name,
                     "name": out_name,
                     "targets": [out_name],
-                    "actions": [(write_similar, (out_name, post, lang))],
-                    "file_dep": file_dep,
-                    "uptodate": [uptodate],
+                    "actions": [(utils.copy_file, (cache_path(post, lang), out_name))],
+                    "file_dep": [cache_path(post, lang)],
                     "clean": True,
                 }
-                yield task
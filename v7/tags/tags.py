@@ -27,14 +27,19 @@
 from __future__ import unicode_literals, print_function
 import codecs
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import heapq
 import io
+import json
 import math
+import os
 from os.path import relpath
 import re
 from textwrap import dedent
 
 from nikola.plugin_categories import Command
-from nikola.utils import bytes_str, LOGGER, req_missing, sys_decode, unicode_str
+from nikola.utils import bytes_str, LOGGER, makedirs, req_missing, sys_decode, unicode_str
 from nikola.plugins.compile.ipynb import flag as ipy_flag
 if ipy_flag:
     from nikola.plugins.compile.ipynb import current_nbformat, nbformat
@@ -245,6 +250,49 @@ def sort_tags(site, filepaths, dry_run=False):
     return all_new_tags
 
 
+def auto_tag_posts(site, untagged_only=False, dry_run=False, processes=None):
+    """ Automatically tags all posts at once.
+
+        $ nikola tags --auto-tag-all --untagged -n
+
+    The above command will show the suggested tags for every post that
+    has no tags yet, without editing any files.  Posts are tokenized
+    using a pool of processes (see --processes).
+
+    """
+
+    posts = [
+        post for post in site.timeline
+        if not (untagged_only and post.tags)
+    ]
+
+    if len(posts) == 0:
+        print("ERROR: Need at least one post.")
+        return
+
+    tagger = _AutoTag(site, processes=processes)
+
+    FMT = 'Tags for {0}:\n{1:>6} - {2}\n{3:>6} - {4}\n'
+    OLD = 'old'
+    NEW = 'new'
+
+    all_new_tags = []
+    for post in posts:
+        old_tags = _post_tags(post)
+        new_tags = _add_tags(old_tags[:], tagger.tag(post))
+        all_new_tags.append(new_tags)
+
+        if dry_run:
+            print(FMT.format(
+                post.source_path, OLD, old_tags, NEW, new_tags)
+            )
+
+        elif new_tags != old_tags:
+            _replace_tags(site, post, new_tags)
+
+    return all_new_tags
+
+
 def _format_doc_string(function):
     text = dedent(' ' * 4 + function.__doc__.strip())
     doc_lines = [line for line in text.splitlines() if line.strip()]
@@ -354,6 +402,29 @@ class CommandTags(Command):
             'type': bool,
             'help': 'Automatically tag a given set of posts.'
         },
+        {
+            'name': 'tag_all',
+            'long': 'auto-tag-all',
+            'default': False,
+            'type': bool,
+            'help': _format_doc_string(auto_tag_posts)
+        },
+        {
+            'name': 'untagged',
+            'long': 'untagged',
+            'default': False,
+            'type': bool,
+            'help': 'Only auto-tag posts without tags (with --auto-tag-all).\n'
+        },
+        {
+            'name': 'processes',
+            'long': 'processes',
+            'short': 'P',
+            'default': 0,
+            'type': int,
+            'help': 'Number of processes used to tokenize posts for auto-tagging;\n'
+                    'defaults to one per CPU.\n'
+        },
         {
             'name': 'dry-run',
             'long': 'dry-run',
@@ -393,8 +464,11 @@ class CommandTags(Command):
         elif len(options['search']) > 0:
             search_tags(self.site, options['search'])
 
+        elif options['tag_all']:
+            auto_tag_posts(self.site, options['untagged'], options['dry-run'], options['processes'] or None)
+
         elif options['tag'] and len(filepaths) > 0:
-            tagger = _AutoTag(self.site)
+            tagger = _AutoTag(self.site, processes=options['processes'] or None)
             for post in filepaths:
                 tags = ','.join(tagger.tag(post))
                 add_tags(self.site, tags, [post], options['dry-run'])
@@ -413,10 +487,19 @@ class CommandTags(Command):
 # ### Private definitions ######################################################
 
 class _AutoTag(object):
-    """ A class to auto tag posts, using tf-idf. """
+    """ A class to auto tag posts, using tf-idf.
+
+    The word counts of every post, and the number of posts each word
+    appears in, are cached under CACHE_FOLDER.  Only posts whose source
+    changed since the last run are tokenized again.
+
+    """
 
     WORDS = '([A-Za-z]+[A-Za-z-]*[A-Za-z]+|[A-Za-z]+)'
 
+    # Bump this whenever the tokenization or the cache layout changes.
+    CACHE_VERSION = 1
+
     def tag(self, post, count=5):
         """ Return a list of top tags, given a post.
 
@@ -436,15 +519,31 @@ class _AutoTag(object):
 
     # ### 'object' interface ###################################################
 
-    def __init__(self, site, use_nltk=True):
+    def __init__(self, site, use_nltk=True, processes=1):
         """ Set up a dictionary of documents.
 
-        Each post is mapped to a list of words it contains.
+        Each post is mapped to the counts of the words it contains.
+        Posts that need to be tokenized are spread over ``processes``
+        worker processes (``None`` means one per CPU).
 
         """
 
         self._site = site
         self._documents = {}
+        self._document_frequency = defaultdict(int)
+        self._max_counts = {}
+        self._processes = processes
+        self._setup_tokenizer(use_nltk)
+
+        self._process_tags()
+        self._process_posts()
+        self._document_count = len(self._documents)
+
+    # ### 'Private' interface ##################################################
+
+    def _setup_tokenizer(self, use_nltk):
+        """ Set up the tokenizer, and the stemmer if use_nltk. """
+
         self._stem_cache = {}
         self._use_nltk = use_nltk and self._nltk_available()
         self._tag_set = set([])
@@ -463,12 +562,6 @@ class _AutoTag(object):
         else:
             self._tag_pattern = re.compile(self.WORDS)
 
-        self._process_tags()
-        self._process_posts()
-        self._document_count = len(self._documents)
-
-    # ### 'Private' interface ##################################################
-
     def _find_stems_for_words_in_documents(self, text):
         """ Process text to get list of stems. """
 
@@ -488,19 +581,15 @@ class _AutoTag(object):
 
         for word in self._documents[post.source_path]:
             tf_idf_table[word] = self._tf_idf(word, post)
-            tags = sorted(
-                tf_idf_table, key=lambda x: tf_idf_table[x], reverse=True
-            )
+
+        tags = heapq.nlargest(count, tf_idf_table, key=tf_idf_table.get)
 
         if self._use_nltk:
             tags = [
                 sorted(self._stem_word_mapping[tag], key=len)[0]
-                for tag in tags[:count]
+                for tag in tags
             ]
 
-        else:
-            tags = tags[:count]
-
         return tags
 
     def _get_post_from_source_path(self, source):
@@ -528,13 +617,95 @@ class _AutoTag(object):
     def _get_word_count(self, post):
         """ Get the count of all words in a given post. """
 
-        word_counts = defaultdict(lambda: 0)
+        return self._documents[post.source_path]
 
-        for word in self._documents[post.source_path]:
-            word_counts[word] += 1
+    def _count_words(self, post):
+        """ Tokenize a post and count the words (or stems) in it. """
+
+        return self._count_words_in_text(self._get_post_text(post))
+
+    def _count_words_in_posts(self, posts):
+        """ Count the words of several posts, in parallel if possible.
+
+        Returns a list of word counts, in the same order as ``posts``.
+
+        """
+
+        if self._processes == 1 or len(posts) < 2:
+            return [self._count_words(post) for post in posts]
+
+        texts = [self._get_post_text(post) for post in posts]
+        with ProcessPoolExecutor(
+            self._processes, initializer=_init_tokenizer_worker, initargs=(self._use_nltk,)
+        ) as executor:
+            results = list(executor.map(_count_words_worker, texts, chunksize=16))
+
+        all_word_counts = []
+        for word_counts, stems in results:
+            for stem, words in stems.items():
+                self._stem_word_mapping[stem].update(words)
+            all_word_counts.append(word_counts)
+
+        return all_word_counts
+
+    def _count_words_in_text(self, text):
+        """ Tokenize text and count the words (or stems) in it. """
+
+        if not self._use_nltk:
+            words = self._tag_pattern.findall(text)
+
+        else:
+            words = self._find_stems_for_words_in_documents(text)
+
+        # A plain dict keeps the words in order of first appearance,
+        # which is used to break ties between equally scored tags.
+        word_counts = {}
+        for word in words:
+            word_counts[word] = word_counts.get(word, 0) + 1
 
         return word_counts
 
+    def _cache_path(self):
+        """ Return the path of the on-disk cache for this tokenizer. """
+
+        name = 'autotag-nltk.json' if self._use_nltk else 'autotag.json'
+        return os.path.join(self._site.config['CACHE_FOLDER'], 'tags', name)
+
+    def _load_cache(self):
+        """ Load the cached word counts, or an empty cache. """
+
+        try:
+            with io.open(self._cache_path(), 'r', encoding='utf-8') as cache_file:
+                cache = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            cache = None
+
+        if not cache or cache.get('version') != self.CACHE_VERSION:
+            cache = {
+                'version': self.CACHE_VERSION,
+                'documents': {},
+                'document_frequency': {},
+                'stems': {},
+            }
+
+        return cache
+
+    def _save_cache(self, cache):
+        """ Atomically write the cache to disk. """
+
+        path = self._cache_path()
+        makedirs(os.path.dirname(path))
+        with io.open(path + '.tmp', 'w', encoding='utf-8') as cache_file:
+            cache_file.write(unicode_str(json.dumps(cache)))
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _hash_file(path):
+        """ Return a hash of the contents of a file. """
+
+        with io.open(path, 'rb') as source_file:
+            return hashlib.md5(source_file.read()).hexdigest()
+
     def _get_stem_from_cache(self, word):
         """ Return the stem for a word, and cache it, if required. """
 
@@ -556,9 +727,7 @@ class _AutoTag(object):
         """
 
         if word not in self._tag_set:
-            count = sum(
-                1 for doc in self._documents.values() if word.lower() in doc
-            )
+            count = self._document_frequency[word.lower()]
         else:
             count = 0.25
 
@@ -576,19 +745,72 @@ class _AutoTag(object):
         return nltk is not None
 
     def _process_posts(self):
-        """ Tokenize the posts (and stem the words, if use_nltk). """
+        """ Tokenize the posts (and stem the words, if use_nltk).
 
-        for post in self._site.timeline:
-
-            text = self._get_post_text(post)
+        Posts are looked up in the cache by source mtime first, and by
+        source hash if the mtime changed.  Only posts that are new or
+        whose contents changed are tokenized, and the document frequency
+        table is updated for just those posts.
 
-            if not self._use_nltk:
-                words = self._tag_pattern.findall(text)
+        """
 
-            else:
-                words = self._find_stems_for_words_in_documents(text)
+        cache = self._load_cache()
+        cached_documents = cache['documents']
+        documents = {}
+        self._document_frequency.update(cache['document_frequency'])
+        if self._use_nltk:
+            for stem, words in cache['stems'].items():
+                self._stem_word_mapping[stem].update(words)
 
-            self._documents[post.source_path] = words
+        changed = False
+        stale = []
+        for post in self._site.timeline:
+            path = post.source_path
+            entry = cached_documents.pop(path, None)
+            mtime = os.stat(path).st_mtime
+
+            if entry is None or entry['mtime'] != mtime:
+                digest = self._hash_file(path)
+                if entry is None or entry['hash'] != digest:
+                    if entry is not None:
+                        self._update_document_frequency(entry['counts'], -1)
+                    entry = {'hash': digest, 'counts': None}
+                    stale.append((post, entry))
+                entry['mtime'] = mtime
+                changed = True
+
+            documents[path] = entry
+
+        all_word_counts = self._count_words_in_posts([post for post, _ in stale])
+        for (post, entry), word_counts in zip(stale, all_word_counts):
+            entry['counts'] = word_counts
+            self._update_document_frequency(word_counts, 1)
+
+        for path, entry in documents.items():
+            self._documents[path] = entry['counts']
+
+        # Whatever is left belongs to posts that no longer exist.
+        for entry in cached_documents.values():
+            self._update_document_frequency(entry['counts'], -1)
+            changed = True
+
+        if changed:
+            cache['documents'] = documents
+            cache['document_frequency'] = self._document_frequency
+            if self._use_nltk:
+                cache['stems'] = dict(
+                    (stem, sorted(words))
+                    for stem, words in self._stem_word_mapping.items()
+                )
+            self._save_cache(cache)
+
+    def _update_document_frequency(self, word_counts, delta):
+        """ Add (or remove) a document's words to the frequency table. """
+
+        for word in word_counts:
+            self._document_frequency[word] += delta
+            if self._document_frequency[word] <= 0:
+                del self._document_frequency[word]
 
     def _process_tags(self):
         """ Create a tag set, to be used during tf-idf calculation. """
@@ -606,10 +828,13 @@ class _AutoTag(object):
 
         word_counts = self._get_word_count(post)
 
+        if post.source_path not in self._max_counts:
+            self._max_counts[post.source_path] = max(word_counts.values())
+
         # A mix of augmented, logarithmic frequency.  We divide with
         # the max frequency to prevent a bias towards longer document.
         tf = math.log(
-            1 + float(word_counts[word]) / max(word_counts.values())
+            1 + float(word_counts[word]) / self._max_counts[post.source_path]
         )
 
         return tf
@@ -623,6 +848,37 @@ class _AutoTag(object):
         return tf * idf
 
 
+# The tokenizer used by each worker process, see _init_tokenizer_worker().
+_worker_tagger = None
+
+
+def _init_tokenizer_worker(use_nltk):
+    """ Set up a tokenizer in a worker process. """
+
+    global _worker_tagger
+    _worker_tagger = _AutoTag.__new__(_AutoTag)
+    _worker_tagger._setup_tokenizer(use_nltk)
+
+
+def _count_words_worker(text):
+    """ Count the words of a text in a worker process.
+
+    Returns the word counts, and the words seen for each stem in them.
+
+    """
+
+    word_counts = _worker_tagger._count_words_in_text(text)
+    if _worker_tagger._use_nltk:
+        stems = dict(
+            (stem, _worker_tagger._stem_word_mapping[stem])
+            for stem in word_counts
+        )
+    else:
+        stems = {}
+
+    return word_counts, stems
+
+
 def _add_tags(tags, additions):
     """ In all tags list, add tags in additions if not already present. """
 
@@ -30,16 +30,59 @@
 """
 
 import hashlib
+import json
 import os
+import shutil
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
-from docutils.nodes import image, literal_block
+from docutils.nodes import image, literal_block, pending
 from docutils.parsers.rst import Directive, directives
+from docutils.transforms import Transform
 from nikola.plugin_categories import RestExtension
 
 OUTPUT_DIR = None  # Set below
 OUTPUT_URL_PATH = None  # Set below
+CACHE_DIR = None  # Set below, None when the cache is disabled
+EXECUTOR = None  # Set below
+
+
+def render(cmdline, body, output, cached):
+    """Run ditaa, returns (returncode, stderr).
+
+    On success the output is also stored in the ``cached`` file.
+    """
+    tf = tempfile.NamedTemporaryFile(delete=False)
+    try:
+        tf.write(body.encode('utf8'))
+        tf.close()
+        p = subprocess.run([cmdline[0], tf.name] + cmdline[1:], capture_output=True)
+    finally:
+        os.unlink(tf.name)
+    if p.returncode == 0 and cached and os.path.exists(output):
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        shutil.copyfile(output, cached + '.tmp')
+        os.replace(cached + '.tmp', cached)
+    return p.returncode, p.stderr
+
+
+def copy_cached(cached, output):
+    """Copy a cached diagram to its output file, returns False when it is not cached."""
+    try:
+        with open(cached, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return False
+    try:
+        with open(output, 'rb') as f:
+            if f.read() == data:
+                return True
+    except OSError:
+        pass
+    with open(output, 'wb') as f:
+        f.write(data)
+    return True
 
 
 class Ditaa(Directive):
@@ -58,55 +101,72 @@ class Ditaa(Directive):
         if not os.path.exists(OUTPUT_DIR):
             os.makedirs(OUTPUT_DIR)
 
-        nodes = []
-
         body = '\n'.join(self.content)
-        tf = tempfile.NamedTemporaryFile(delete=False)
-        tf.write(body.encode('utf8'))
-        tf.flush()
 
         # make a filename
         filename_template = self.options.pop('filename', '{checksum}.png')
-        filename = filename_template.format({
-            'checksum': hashlib.sha256(body.encode('utf-8')).hexdigest()[0:12],
-        })
+        filename = filename_template.format(
+            checksum=hashlib.sha256(body.encode('utf-8')).hexdigest()[0:12],
+        )
 
         alt = self.options.get('alt', 'ditaa diagram')
         classes = self.options.pop('class', ['ditaa'])
         cmdline_opts = self.options.pop('cmdline', '').split(' ')
 
+        output = os.path.join(OUTPUT_DIR, filename)
         cmdline = [
             'ditaa',
-            tf.name,
-            os.path.join(OUTPUT_DIR, filename),
+            output,
             '--overwrite',
             '--encoding', 'utf8',
         ] + cmdline_opts
 
+        self.state.document.settings.record_dependencies.add("####MAGIC####CONFIG:DITAA_OUTPUT_URL_PATH")
+
+        cached = None
+        if CACHE_DIR:
+            key = hashlib.sha256(json.dumps([body, cmdline_opts]).encode('utf-8')).hexdigest()
+            cached = os.path.join(CACHE_DIR, key + os.path.splitext(filename)[1])
+            if copy_cached(cached, output):
+                return [image(uri=OUTPUT_URL_PATH + '/' + filename, classes=classes, alt=alt)]
+
+        # Render in the background, DitaaResult waits for it when the document is complete,
+        # so all the diagrams of a document are rendered concurrently.
+        node = pending(DitaaResult, {
+            'future': EXECUTOR.submit(render, cmdline, body, output, cached),
+            'name': self.name,
+            'block_text': self.block_text,
+            'lineno': self.lineno,
+            'uri': OUTPUT_URL_PATH + '/' + filename,
+            'classes': classes,
+            'alt': alt,
+        })
+        self.state.document.note_pending(node)
+        return [node]
+
+
+class DitaaResult(Transform):
+    """Replace a pending ditaa diagram with its image, or with the error."""
+
+    default_priority = 500
+
+    def apply(self):
+        details = self.startnode.details
         try:
-            p = subprocess.run(cmdline, capture_output=True)
+            returncode, stderr = details['future'].result()
         except Exception as exc:
-            error = self.state_machine.reporter.error(
-                'Failed to run ditaa: %s' % (exc, ),
-                literal_block(self.block_text, self.block_text),
-                line=self.lineno)
-            nodes.append(error)
+            message = 'Failed to run ditaa: %s' % (exc, )
         else:
-            if p.returncode == 0:
-                url = OUTPUT_URL_PATH + '/' + filename
-                imgnode = image(uri=url, classes=classes, alt=alt)
-                nodes.append(imgnode)
-            else:
-                error = self.state_machine.reporter.error(
-                    'Error in "%s" directive: %s' % (self.name, p.stderr),
-                    literal_block(self.block_text, self.block_text),
-                    line=self.lineno)
-                nodes.append(error)
-        finally:
-            os.unlink(tf.name)
-
-        self.state.document.settings.record_dependencies.add("####MAGIC####CONFIG:DITAA_OUTPUT_URL_PATH")
-        return nodes
+            if returncode == 0:
+                imgnode = image(uri=details['uri'], classes=details['classes'], alt=details['alt'])
+                self.startnode.replace_self(imgnode)
+                return
+            message = 'Error in "%s" directive: %s' % (details['name'], stderr)
+        error = self.document.reporter.error(
+            message,
+            literal_block(details['block_text'], details['block_text']),
+            line=details['lineno'])
+        self.startnode.replace_self(error)
 
 
 class Plugin(RestExtension):
@@ -114,8 +174,12 @@ class Plugin(RestExtension):
     name = "ditaa"
 
     def set_site(self, site):
-        global OUTPUT_DIR, OUTPUT_URL_PATH
+        global OUTPUT_DIR, OUTPUT_URL_PATH, CACHE_DIR, EXECUTOR
         directives.register_directive('ditaa', Ditaa)
         OUTPUT_DIR = site.config['DITAA_OUTPUT_FOLDER']
         OUTPUT_URL_PATH = site.config['DITAA_OUTPUT_URL_PATH']
+        CACHE_DIR = None
+        if site.config.get('DITAA_CACHE', True):
+            CACHE_DIR = os.path.join(site.config['CACHE_FOLDER'], 'ditaa')
+        EXECUTOR = ThreadPoolExecutor(site.config.get('DITAA_PROCESSES') or None)
         return super(Plugin, self).set_site(site)
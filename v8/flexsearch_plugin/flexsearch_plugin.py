@@ -20,11 +20,110 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import hashlib
 import os
 import json
+import re
 from nikola.plugin_categories import LateTask
 from nikola import utils
 
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+# Fields of the prebuilt inverted index, in the order of each posting entry.
+INDEX_FIELDS = ('title', 'tags', 'content')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase words, the same way the shipped JS does."""
+    return TOKEN_RE.findall(text.lower())
+
+
+def delta_encode(numbers):
+    """Turn a sorted list of numbers into the gaps between them."""
+    previous = 0
+    deltas = []
+    for number in numbers:
+        deltas.append(number - previous)
+        previous = number
+    return deltas
+
+
+def build_inverted_index(documents, stemmer=None):
+    """Build an inverted index over the title, tags and content of documents.
+
+    ``documents`` is a list of ``(key, fields)`` pairs, where ``fields``
+    maps each name in INDEX_FIELDS to text.  Returns a JSON-serializable
+    dict with:
+
+    * ``docs``: the document keys; documents are referred to by position
+    * ``terms``: every word seen, sorted, so the client can do prefix
+      lookups with a binary search
+    * ``refs``: for each term, the position of its entry in ``postings``
+    * ``postings``: for each entry, one list per field of the documents
+      containing the term, delta-encoded
+
+    With a stemmer, all words sharing a stem point to the same postings,
+    so searching for any of them finds the others without the client
+    having to stem the query.
+    """
+    postings = {}
+    stems = {}
+    for number, (key, fields) in enumerate(documents):
+        for field_number, field in enumerate(INDEX_FIELDS):
+            for word in set(tokenize(fields.get(field) or '')):
+                if word not in stems:
+                    stems[word] = stemmer.stemWord(word) if stemmer else word
+                entry = postings.setdefault(stems[word], [[] for _ in INDEX_FIELDS])
+                if not entry[field_number] or entry[field_number][-1] != number:
+                    entry[field_number].append(number)
+
+    entries = sorted(postings)
+    entry_numbers = dict((stem, number) for number, stem in enumerate(entries))
+    terms = sorted(stems)
+    return {
+        'version': 1,
+        'fields': list(INDEX_FIELDS),
+        'docs': [key for key, _ in documents],
+        'terms': terms,
+        'refs': [entry_numbers[stems[term]] for term in terms],
+        'postings': [
+            [delta_encode(numbers) for numbers in postings[stem]]
+            for stem in entries
+        ],
+    }
+
+
+class index_changed(object):
+    """An up-to-date check comparing a digest of each search index entry.
+
+    The digests are computed when the task is checked, so they see the
+    posts as compiled by the tasks that ran before.  When something
+    changed, the entries that were added, changed or removed are logged.
+    """
+
+    def __init__(self, calc_digests, logger):
+        self.calc_digests = calc_digests
+        self.logger = logger
+        self.identifier = 'flexsearch_index_digests'
+
+    def configure_task(self, task):
+        task.value_savers.append(lambda: {self.identifier: self.calc_digests()})
+
+    def __call__(self, task, values):
+        old = values.get(self.identifier)
+        if old is None:
+            return False
+        new = self.calc_digests()
+        changed = sorted(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+        if changed:
+            self.logger.info('{0} search index entries changed: {1}'.format(len(changed), ', '.join(changed)))
+        return not changed
+
 
 class FlexSearchPlugin(LateTask):
     name = "flexsearch_plugin"
@@ -41,50 +140,105 @@ class FlexSearchPlugin(LateTask):
 
         output_path = self.site.config['OUTPUT_FOLDER']
         index_file_path = os.path.join(output_path, 'search_index.json')
+        inverted_index_file_path = os.path.join(output_path, 'search_inverted_index.json')
+        prebuilt_index = self.site.config.get('FLEXSEARCH_PREBUILT_INDEX', False)
+        stemmer_language = self.site.config.get('FLEXSEARCH_STEMMER', None)
+        if prebuilt_index and stemmer_language and snowballstemmer is None:
+            utils.req_missing(['snowballstemmer'], 'stem the FlexSearch index', optional=True)
 
-        def build_index():
-            """Build the entire search index from scratch, including both posts and pages."""
-            index = {}
-
-            # Get configuration for what content to include
-            # Default to True for backward compatibility
-            index_posts = self.site.config.get('FLEXSEARCH_INDEX_POSTS', True)
-            index_pages = self.site.config.get('FLEXSEARCH_INDEX_PAGES', False)
-            index_drafts = self.site.config.get('FLEXSEARCH_INDEX_DRAFTS', False)
+        # Get configuration for what content to include
+        # Default to True for backward compatibility
+        kw = {
+            'index_posts': self.site.config.get('FLEXSEARCH_INDEX_POSTS', True),
+            'index_pages': self.site.config.get('FLEXSEARCH_INDEX_PAGES', False),
+            'index_drafts': self.site.config.get('FLEXSEARCH_INDEX_DRAFTS', False),
+            'prebuilt_index': prebuilt_index,
+            'stemmer': stemmer_language,
+        }
 
+        def indexed_items():
+            """Return (slug, item, index entry) for everything to index."""
+            items = []
             for item in self.site.timeline:
                 # Skip draft items unless configured to include them
-                if item.is_draft and not index_drafts:
+                if item.is_draft and not kw['index_drafts']:
                     continue
 
                 # Include posts if configured
-                if item.is_post and index_posts:
-                    index[item.meta('slug')] = {
+                if item.is_post and kw['index_posts']:
+                    items.append((item.meta('slug'), item, {
                         'title': item.title(),
                         # 'content': item.text(strip_html=True),
                         'tags': item.meta('tags'),
                         'url': item.permalink(),
                         'type': 'post'
-                    }
+                    }))
                 # Include pages if configured
-                elif not item.is_post and index_pages:
-                    index[item.meta('slug')] = {
+                elif not item.is_post and kw['index_pages']:
+                    items.append((item.meta('slug'), item, {
                         'title': item.title(),
                         # 'content': item.text(strip_html=True),
                         'tags': item.meta('tags'),
                         'url': item.permalink(),
                         'type': 'page'
-                    }
+                    }))
+            return items
+
+        def entry_digests():
+            """Hash exactly what each entry of the index is built from."""
+            digests = {}
+            for slug, item, entry in indexed_items():
+                digest = hashlib.md5(json.dumps(entry, sort_keys=True).encode('utf-8'))
+                if prebuilt_index:
+                    # The body text is only indexed by the prebuilt index.
+                    # Hashing the compiled post is much cheaper than
+                    # stripping it, and changes whenever the text does.
+                    try:
+                        with open(item.translated_base_path(self.site.default_lang), 'rb') as f:
+                            digest.update(f.read())
+                    except IOError:
+                        pass
+                digests[slug] = digest.hexdigest()
+            return digests
+
+        def build_index():
+            """Build the entire search index from scratch, including both posts and pages."""
+            index = {}
+            documents = []
+
+            for slug, item, entry in indexed_items():
+                index[slug] = entry
+                if prebuilt_index:
+                    documents.append((slug, {
+                        'title': item.title(),
+                        'tags': ' '.join(item.tags),
+                        'content': item.text(strip_html=True),
+                    }))
 
             with open(index_file_path, 'w', encoding='utf-8') as f:
                 json.dump(index, f, ensure_ascii=False)
 
+            if prebuilt_index:
+                stemmer = None
+                if stemmer_language and snowballstemmer is not None:
+                    stemmer = snowballstemmer.stemmer(stemmer_language)
+                inverted_index = build_inverted_index(documents, stemmer)
+                with open(inverted_index_file_path, 'w', encoding='utf-8') as f:
+                    json.dump(inverted_index, f, ensure_ascii=False, separators=(',', ':'))
+
+        targets = [index_file_path]
+        if prebuilt_index:
+            targets.append(inverted_index_file_path)
+
         task = {
             'basename': self.name,
             'name': 'all_posts',
             'actions': [build_index],
-            'targets': [index_file_path],
-            'uptodate': [utils.config_changed({1: self.site.GLOBAL_CONTEXT})],
+            'targets': targets,
+            'uptodate': [
+                utils.config_changed(kw, 'flexsearch_plugin'),
+                index_changed(entry_digests, self.logger),
+            ],
             'clean': True,
         }
         yield task
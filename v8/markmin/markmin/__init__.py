@@ -45,6 +45,7 @@ class CompileMarkmin(PageCompiler):
 
     name = "markmin"
     demote_headers = True
+    renderer = None
 
     def compile_string(self, data, source_path=None, is_two_file=True, post=None, lang=None):
         """Compile the source file into HTML strings (with shortcode support).
@@ -54,7 +55,10 @@ class CompileMarkmin(PageCompiler):
         if not is_two_file:
             _, data = self.split_metadata(data, post, lang)
         new_data, shortcodes = sc.extract_shortcodes(data)
-        output = m2h.markmin2html(new_data, pretty_print=True)
+        if self.renderer is None:
+            # Reused for all posts, it remembers the html of unchanged blocks
+            self.renderer = m2h.Renderer(pretty_print=True)
+        output = self.renderer.render(new_data)
         output, shortcode_deps = self.site.apply_shortcodes_uuid(output, shortcodes, filename=source_path, extra_context={'post': post})
         return output, shortcode_deps
 
@@ -5,8 +5,10 @@
 # recreated by Vladyslav Kozlovskyy
 # license MIT/BSD/GPL
 import re
+import threading
 import urllib
 from cgi import escape
+from collections import OrderedDict
 from string import maketrans
 
 try:
@@ -31,7 +33,7 @@ MathJax.Hub.Config({
 </script>
 """
 
-__all__ = ["render", "markmin2html", "markmin_escape"]
+__all__ = ["Renderer", "render", "markmin2html", "markmin_escape"]
 
 __doc__ = """
 # Markmin markup language
@@ -603,6 +605,8 @@ ttab_out = maketrans(
     "\x0b\x0c\x0e\x0f\x10\x11\x12\x13\x14\x15\x16\x17\x18\x19\x1a\x1b\x05",
     "'`:*~\\[]{}@$+-.#\n",
 )
+# a blank line followed by a line that is not part of a list
+regex_block_start = re.compile(r"\n\s*?\n(?=[ \t\r\x0b\x0c]*[^\s+\-.])")
 regex_quote = re.compile(r"(?P<name>\w+?)\s*\=\s*")
 
 
@@ -748,333 +752,294 @@ def email_simple(email):
     return '<a href="mailto:%s">%s</a>' % (email, email)
 
 
-def render(
-    text,
-    extra={},
-    allowed={},
-    sep="p",
-    URL=None,
-    environment=None,
-    latex="google",
-    autolinks="default",
-    protolinks="default",
-    class_prefix="",
-    id_prefix="markmin_",
-    pretty_print=False,
-):
-    """
-    Arguments:
-    - text is the text to be processed
-    - extra is a dict like extra=dict(custom=lambda value: value) that process custom code
-      as in " ``this is custom code``:custom "
-    - allowed is a dictionary of list of allowed classes like
-      allowed = dict(code=('python','cpp','java'))
-    - sep can be 'p' to separate text in <p>...</p>
-      or can be 'br' to separate text using <br />
-    - URL -
-    - environment is a dictionary of environment variables (can be accessed with @{variable}
-    - latex -
-    - autolinks is a function to convert auto urls to html-code (default is autolinks(url) )
-    - protolinks is a function to convert proto-urls (e.g."proto:url") to html-code
-      (default is protolinks(proto,url))
-    - class_prefix is a prefix for ALL classes in markmin text. E.g. if class_prefix='my_'
-      then for ``test``:cls class will be changed to "my_cls" (default value is '')
-    - id_prefix is prefix for ALL ids in markmin text (default value is 'markmin_'). E.g.:
-        -- [[id]] will be converted to <span class="anchor" id="markmin_id"></span>
-        -- [[link #id]] will be converted to <a href="#markmin_id">link</a>
-        -- ``test``:cls[id] will be converted to <code class="cls" id="markmin_id">test</code>
-
-    >>> render('this is\\n# a section\\n\\nparagraph')
-    '<p>this is</p><h1>a section</h1><p>paragraph</p>'
-    >>> render('this is\\n## a subsection\\n\\nparagraph')
-    '<p>this is</p><h2>a subsection</h2><p>paragraph</p>'
-    >>> render('this is\\n### a subsubsection\\n\\nparagraph')
-    '<p>this is</p><h3>a subsubsection</h3><p>paragraph</p>'
-    >>> render('**hello world**')
-    '<p><strong>hello world</strong></p>'
-    >>> render('``hello world``')
-    '<code>hello world</code>'
-    >>> render('``hello world``:python')
-    '<code class="python">hello world</code>'
-    >>> render('``\\nhello\\nworld\\n``:python')
-    '<pre><code class="python">hello\\nworld</code></pre>'
-    >>> render('``hello world``:python[test_id]')
-    '<code class="python" id="markmin_test_id">hello world</code>'
-    >>> render('``hello world``:id[test_id]')
-    '<code id="markmin_test_id">hello world</code>'
-    >>> render('``\\nhello\\nworld\\n``:python[test_id]')
-    '<pre><code class="python" id="markmin_test_id">hello\\nworld</code></pre>'
-    >>> render('``\\nhello\\nworld\\n``:id[test_id]')
-    '<pre><code id="markmin_test_id">hello\\nworld</code></pre>'
-    >>> render("''hello world''")
-    '<p><em>hello world</em></p>'
-    >>> render('** hello** **world**')
-    '<p>** hello** <strong>world</strong></p>'
-
-    >>> render('- this\\n- is\\n- a list\\n\\nand this\\n- is\\n- another')
-    '<ul><li>this</li><li>is</li><li>a list</li></ul><p>and this</p><ul><li>is</li><li>another</li></ul>'
-
-    >>> render('+ this\\n+ is\\n+ a list\\n\\nand this\\n+ is\\n+ another')
-    '<ol><li>this</li><li>is</li><li>a list</li></ol><p>and this</p><ol><li>is</li><li>another</li></ol>'
-
-    >>> render("----\\na | b\\nc | d\\n----\\n")
-    '<table><tbody><tr class="first"><td>a</td><td>b</td></tr><tr class="even"><td>c</td><td>d</td></tr></tbody></table>'
-
-    >>> render("----\\nhello world\\n----\\n")
-    '<blockquote>hello world</blockquote>'
-
-    >>> render('[[myanchor]]')
-    '<p><span class="anchor" id="markmin_myanchor"></span></p>'
-
-    >>> render('[[ http://example.com]]')
-    '<p><a href="http://example.com">http://example.com</a></p>'
-
-    >>> render('[[bookmark [http://example.com] ]]')
-    '<p><span class="anchor" id="markmin_bookmark"><a href="http://example.com">http://example.com</a></span></p>'
-
-    >>> render('[[this is a link http://example.com]]')
-    '<p><a href="http://example.com">this is a link</a></p>'
-
-    >>> render('[[this is an image http://example.com left]]')
-    '<p><img src="http://example.com" alt="this is an image" style="float:left" /></p>'
-
-    >>> render('[[this is an image http://example.com left 200px]]')
-    '<p><img src="http://example.com" alt="this is an image" style="float:left;width:200px" /></p>'
-
-    >>> render("[[Your browser doesn't support <video> HTML5 tag http://example.com video]]")
-    '<p><video controls="controls"><source src="http://example.com" />Your browser doesn\\'t support &lt;video&gt; HTML5 tag</video></p>'
-
-    >>> render("[[Your browser doesn't support <audio> HTML5 tag http://example.com audio]]")
-    '<p><audio controls="controls"><source src="http://example.com" />Your browser doesn\\'t support &lt;audio&gt; HTML5 tag</audio></p>'
-
-    >>> render("[[Your\\nbrowser\\ndoesn't\\nsupport\\n<audio> HTML5 tag http://exam\\\\\\nple.com\\naudio]]")
-    '<p><audio controls="controls"><source src="http://example.com" />Your browser doesn\\'t support &lt;audio&gt; HTML5 tag</audio></p>'
-
-    >>> render('[[this is a **link** http://example.com]]')
-    '<p><a href="http://example.com">this is a <strong>link</strong></a></p>'
-
-    >>> render("``aaa``:custom", extra=dict(custom=lambda text: 'x'+text+'x'))
-    'xaaax'
-
-    >>> print render(r"$$\int_a^b sin(x)dx$$")
-    <img src="http://chart.apis.google.com/chart?cht=tx&chl=%5Cint_a%5Eb%20sin%28x%29dx" />
-
-    >>> markmin2html(r"use backslash: \[\[[[mess\[[ag\]]e link]]\]]")
-    '<p>use backslash: [[<a href="link">mess[[ag]]e</a>]]</p>'
-
-    >>> markmin2html("backslash instead of exclamation sign: \``probe``")
-    '<p>backslash instead of exclamation sign: ``probe``</p>'
-
-    >>> render(r"simple image: [[\[[this is an image\]] http://example.com IMG]]!!!")
-    '<p>simple image: <img src="http://example.com" alt="[[this is an image]]" />!!!</p>'
-
-    >>> render(r"simple link no anchor with popup: [[ http://example.com popup]]")
-    '<p>simple link no anchor with popup: <a href="http://example.com" target="_blank">http://example.com</a></p>'
-
-    >>> render("auto-url: http://example.com")
-    '<p>auto-url: <a href="http://example.com">http://example.com</a></p>'
-
-    >>> render("auto-image: (http://example.com/image.jpeg)")
-    '<p>auto-image: (<img src="http://example.com/image.jpeg" controls />)</p>'
+class _State(object):
+    """What a Renderer keeps track of while it renders one text."""
 
-    >>> render("qr: (qr:http://example.com/image.jpeg)")
-    '<p>qr: (<img style="width:100px" src="http://chart.apis.google.com/chart?cht=qr&chs=100x100&chl=http://example.com/image.jpeg&choe=UTF-8&chld=H" alt="QR Code" title="QR Code" />)</p>'
-
-    >>> render("embed: (embed:http://example.com/page)")
-    '<p>embed: (<iframe src="http://example.com/page" frameborder="0" allowfullscreen></iframe>)</p>'
-
-    >>> render("iframe: (iframe:http://example.com/page)")
-    '<p>iframe: (<iframe src="http://example.com/page" frameborder="0" allowfullscreen></iframe>)</p>'
-
-    >>> render("title1: [[test message [simple \[test\] title] http://example.com ]] test")
-    '<p>title1: <a href="http://example.com" title="simple [test] title">test message</a> test</p>'
-
-    >>> render("title2: \[\[[[test message [simple title] http://example.com popup]]\]]")
-    '<p>title2: [[<a href="http://example.com" title="simple title" target="_blank">test message</a>]]</p>'
-
-    >>> render("title3: [[ [link w/o anchor but with title] http://www.example.com ]]")
-    '<p>title3: <a href="http://www.example.com" title="link w/o anchor but with title">http://www.example.com</a></p>'
-
-    >>> render("title4: [[ [simple title] http://www.example.com popup]]")
-    '<p>title4: <a href="http://www.example.com" title="simple title" target="_blank">http://www.example.com</a></p>'
-
-    >>> render("title5: [[test message [simple title] http://example.com IMG]]")
-    '<p>title5: <img src="http://example.com" alt="test message" title="simple title" /></p>'
-
-    >>> render("title6: [[[test message w/o title] http://example.com IMG]]")
-    '<p>title6: <img src="http://example.com" alt="[test message w/o title]" /></p>'
-
-    >>> render("title7: [[[this is not a title] [this is a title] http://example.com IMG]]")
-    '<p>title7: <img src="http://example.com" alt="[this is not a title]" title="this is a title" /></p>'
-
-    >>> render("title8: [[test message [title] http://example.com center]]")
-    '<p>title8: <p style="text-align:center"><img src="http://example.com" alt="test message" title="title" /></p></p>'
-
-    >>> render("title9: [[test message [title] http://example.com left]]")
-    '<p>title9: <img src="http://example.com" alt="test message" title="title" style="float:left" /></p>'
-
-    >>> render("title10: [[test message [title] http://example.com right 100px]]")
-    '<p>title10: <img src="http://example.com" alt="test message" title="title" style="float:right;width:100px" /></p>'
-
-    >>> render("title11: [[test message [title] http://example.com center 200px]]")
-    '<p>title11: <p style="text-align:center"><img src="http://example.com" alt="test message" title="title" style="width:200px" /></p></p>'
-
-    >>> render(r"\\[[probe]]")
-    '<p>[[probe]]</p>'
-
-    >>> render(r"\\\\[[probe]]")
-    '<p>\\\\<span class="anchor" id="markmin_probe"></span></p>'
-
-    >>> render(r"\\\\\\[[probe]]")
-    '<p>\\\\[[probe]]</p>'
-
-    >>> render(r"\\\\\\\\[[probe]]")
-    '<p>\\\\\\\\<span class="anchor" id="markmin_probe"></span></p>'
-
-    >>> render(r"\\\\\\\\\[[probe]]")
-    '<p>\\\\\\\\[[probe]]</p>'
-
-    >>> render(r"\\\\\\\\\\\[[probe]]")
-    '<p>\\\\\\\\\\\\<span class="anchor" id="markmin_probe"></span></p>'
-
-    >>> render("``[[ [\\[[probe\]\\]] URL\\[x\\]]]``:red[dummy_params]")
-    '<span style="color: red"><a href="URL[x]" title="[[probe]]">URL[x]</a></span>'
-
-    >>> render("the \\**text**")
-    '<p>the **text**</p>'
-
-    >>> render("the \\``text``")
-    '<p>the ``text``</p>'
+    def __init__(self):
+        self.segments = []  # code replaced by META
+        self.links = []  # links replaced by LINK
+        self.strings = []  # lines of the text
+        self.strings_len = 0
+        self.out = []  # list of processed lines
+        self.etags = []  # trailing tags
+        self.ltags = []  # level# correspondent to trailing tag
+        self.tlev = []  # list of tags for each level ('ul' or 'ol')
+        self.unclosed = False  # a table or blockquote runs to the end of the text
 
-    >>> render("the \\\\''text''")
-    "<p>the ''text''</p>"
-
-    >>> render("the [[link [**with** ``<b>title</b>``:red] http://www.example.com]]")
-    '<p>the <a href="http://www.example.com" title="**with** ``&lt;b&gt;title&lt;/b&gt;``:red">link</a></p>'
 
-    >>> render("the [[link \\[**without** ``<b>title</b>``:red\\] http://www.example.com]]")
-    '<p>the <a href="http://www.example.com">link [<strong>without</strong> <span style="color: red">&lt;b&gt;title&lt;/b&gt;</span>]</a></p>'
+def _translate_backslashed(m):
+    return m.group(1).translate(ttab_in)
 
-    >>> render("aaa-META-``code``:text[]-LINK-[[link http://www.example.com]]-LINK-[[image http://www.picture.com img]]-end")
-    '<p>aaa-META-<code class="text">code</code>-LINK-<a href="http://www.example.com">link</a>-LINK-<img src="http://www.picture.com" alt="image" />-end</p>'
 
-    >>> render("[[<a>test</a> [<a>test2</a>] <a>text3</a>]]")
-    '<p><a href="&lt;a&gt;text3&lt;/a&gt;" title="&lt;a&gt;test2&lt;/a&gt;">&lt;a&gt;test&lt;/a&gt;</a></p>'
+class Renderer(object):
+    """Renders markmin texts with a fixed set of options.
 
-    >>> render("[[<a>test</a> [<a>test2</a>] <a>text3</a> IMG]]")
-    '<p><img src="&lt;a&gt;text3&lt;/a&gt;" alt="&lt;a&gt;test&lt;/a&gt;" title="&lt;a&gt;test2&lt;/a&gt;" /></p>'
+    The arguments are those of render(), except for the text, and a renderer
+    can be used for any number of texts.
 
-    >>> render("**bold** ''italic'' ~~strikeout~~")
-    '<p><strong>bold</strong> <em>italic</em> <del>strikeout</del></p>'
+    With pretty_print and sep="p" the html of every block (lines ending in
+    blank lines, which are rendered the same on their own) is remembered,
+    for at most memo_size blocks.  Rendering a text again after a small
+    edit then only renders the blocks that changed.
+    """
 
-    >>> render("this is ``a red on yellow text``:c[#FF0000:#FFFF00]")
-    '<p>this is <span style="color: #FF0000;background-color: #FFFF00;">a red on yellow text</span></p>'
+    def __init__(
+        self,
+        extra={},
+        allowed={},
+        sep="p",
+        URL=None,
+        environment=None,
+        latex="google",
+        autolinks="default",
+        protolinks="default",
+        class_prefix="",
+        id_prefix="markmin_",
+        pretty_print=False,
+        memo_size=4096,
+    ):
+        if autolinks == "default":
+            autolinks = autolinks_simple
+        if protolinks == "default":
+            protolinks = protolinks_simple
+        self.extra = extra
+        self.allowed = allowed
+        self.URL = URL
+        self.environment = environment
+        self.latex = latex
+        self.autolinks = autolinks
+        self.protolinks = protolinks
+        self.class_prefix = class_prefix
+        self.id_prefix = id_prefix
+        self.pretty_print = pretty_print
+        self.pp = "\n" if pretty_print else ""
+        if sep == "p":
+            self.pbeg = "<p>"
+            self.pend = "</p>" + self.pp
+            self.br = ""
+        else:
+            self.pbeg = self.pend = ""
+            self.br = "<br />" + self.pp if sep == "br" else ""
+        # Blocks only render the same on their own if their html ends with a
+        # newline, nothing (like <br />) is carried over to the next
+        # paragraph and the environment gives the same output every time.
+        self.memo = None
+        if memo_size and pretty_print and not self.br and not environment:
+            self.memo = OrderedDict()
+            self.memo_size = memo_size
+            self.memo_lock = threading.Lock()
+        self.nested = {}
+
+    def render(self, text):
+        """Render markmin text, returns html."""
+        text = self.prepare(text)
+        if self.memo is None:
+            return self.render_block(text)[0]
+
+        blocks = self.split(text)
+        out = []
+        i = 0
+        while i < len(blocks):
+            block = blocks[i]
+            i += 1
+            while True:
+                with self.memo_lock:
+                    html = self.memo.pop(block, False)
+                    if html is not False:
+                        self.memo[block] = html
+                if html is False:
+                    html, complete = self.render_block(block)
+                    if not complete:
+                        html = None  # remembered to merge it right away next time
+                    with self.memo_lock:
+                        self.memo[block] = html
+                        while len(self.memo) > self.memo_size:
+                            self.memo.popitem(last=False)
+                if html is not None:
+                    break
+                if i == len(blocks):
+                    html = self.render_block(block)[0]
+                    break
+                # A table or blockquote runs into the next block, or the
+                # next block depends on this one.
+                block += "\n" + blocks[i]
+                i += 1
+            out.append(html)
+        return "".join(out)
+
+    def nested_renderer(self, links=True):
+        """Renderer for the text of links, media and colored code."""
+        renderer = self.nested.get(links)
+        if renderer is None:
+            renderer = self.nested[links] = Renderer(
+                {},
+                {},
+                "br",
+                self.URL,
+                self.environment,
+                self.latex,
+                self.autolinks if links else None,
+                self.protolinks if links else None,
+                self.class_prefix,
+                self.id_prefix,
+                self.pretty_print,
+                memo_size=0,
+            )
+        return renderer
 
-    >>> render("this is ``a text with yellow background``:c[:yellow]")
-    '<p>this is <span style="background-color: yellow;">a text with yellow background</span></p>'
+    def prepare(self, text):
+        """Handle backslashes, line continuations, @{...} urls and latex."""
+        if isinstance(text, unicode):  # NOQA
+            text = text.encode("utf8")
+        text = str(text or "")
+        text = regex_backslash.sub(_translate_backslashed, text)
+        # concatenate strings separeted by \\n
+        text = text.replace("\x05", "").replace("\r\n", "\n")
 
-    >>> render("this is ``a colored text (RoyalBlue)``:color[rgb(65,105,225)]")
-    '<p>this is <span style="color: rgb(65,105,225);">a colored text (RoyalBlue)</span></p>'
+        if self.URL is not None:
+            text = replace_at_urls(text, self.URL)
 
-    >>> render("this is ``a green text``:color[green:]")
-    '<p>this is <span style="color: green;">a green text</span></p>'
+        if self.latex == "google":
+            text = regex_dd.sub("``\g<latex>``:latex ", text)
+        return text
 
-    >>> render("**@{probe:1}**", environment=dict(probe=lambda t:"test %s" % t))
-    '<p><strong>test 1</strong></p>'
+    def split(self, text):
+        """Split a prepared text into blocks.
 
-    >>> render("**@{probe:t=a}**", environment=dict(probe=lambda t:"test %s" % t, a=1))
-    '<p><strong>test 1</strong></p>'
+        A block ends with blank lines, and the next one starts with neither a
+        list item nor a paragraph in a list, and not within code or a link.
+        """
+        spans = [m.span() for m in regex_code.finditer(text)]
+        # links are searched for once code is replaced by META
+        padded = []
+        pos = 0
+        for a, b in spans:
+            padded.append(text[pos:a])
+            padded.append(META * (b - a))
+            pos = b
+        padded.append(text[pos:])
+        spans.extend(m.span() for m in regex_link.finditer("".join(padded)))
+        spans.sort()
+
+        blocks = []
+        start = 0  # start of the current block
+        k = 0
+        end = 0  # end of the spans starting before the newline
+        for m in regex_block_start.finditer(text):
+            newline = m.end() - 1
+            while k < len(spans) and spans[k][0] <= newline:
+                end = max(end, spans[k][1])
+                k += 1
+            if end <= newline:  # no span covers the newline
+                blocks.append(text[start:newline])
+                start = newline + 1
+        blocks.append(text[start:])
+        return blocks
+
+    def render_block(self, text):
+        """Render a prepared text, returns (html, complete).
+
+        complete is False if the html could be different when more text
+        follows.
+        """
+        st = _State()
+
+        #############################################################
+        # replace all blocks marked with ``...``:class[id] with META
+        # store them into segments they will be treated as code
+        #############################################################
+        text = regex_code.sub(lambda m: self.mark_code(st, m), text)
+
+        #############################################################
+        # replace all blocks marked with [[...]] with LINK
+        # store them into links they will be treated as link
+        #############################################################
+        text = regex_link.sub(lambda m: self.mark_link(st, m), text)
+        text = escape(text)
+
+        if self.protolinks:
+            text = regex_proto.sub(lambda m: self.protolinks(*m.group("p", "k")), text)
+
+        if self.autolinks:
+            text = replace_autolinks(text, self.autolinks)
+
+        #############################################################
+        # normalize spaces
+        #############################################################
+        st.strings = text.split("\n")
+        st.strings_len = len(st.strings)
+        mtag = self.parse_lines(st)
+        text = "".join(st.out)
+        complete = not st.unclosed and mtag != "q" and text.endswith("\n")
+
+        #############################################################
+        # do strong,em,del
+        #############################################################
+        text = regex_strong.sub("<strong>\g<t></strong>", text)
+        text = regex_del.sub("<del>\g<t></del>", text)
+        text = regex_em.sub("<em>\g<t></em>", text)
+
+        #############################################################
+        # deal with images, videos, audios and links
+        #############################################################
+        parts = text.split(LINK)
+        text = parts[0]
+        for i, s in enumerate(st.links):
+            if s is None:
+                html = LINK
+            else:
+                html = regex_media_level2.sub(self.sub_media, s)
+                if html == s:
+                    html = regex_link_level2.sub(self.sub_link, html)
+                if html == s:
+                    # return unprocessed string as a signal of an error
+                    html = "[[%s]]" % s
+            text += html + parts[i + 1]
 
-    >>> render('[[id1 [span **messag** in ''markmin''] ]] ... [[**link** to id [link\\\'s title] #mark1]]')
-    '<p><span class="anchor" id="markmin_id1">span <strong>messag</strong> in markmin</span> ... <a href="#markmin_mark1" title="link\\\'s title"><strong>link</strong> to id</a></p>'
+        #############################################################
+        # process all code text
+        #############################################################
+        text = regex_expand_meta.sub(lambda m: self.expand_meta(st, m), text)
 
-    >>> render('# Multiline[[NEWLINE]]\\n title\\nParagraph[[NEWLINE]]\\nwith breaks[[NEWLINE]]\\nin it')
-    '<h1>Multiline<br /> title</h1><p>Paragraph<br /> with breaks<br /> in it</p>'
+        if self.environment:
+            text = replace_components(text, self.environment)
 
-    >>> render("anchor with name 'NEWLINE': [[NEWLINE [ ] ]]")
-    '<p>anchor with name \\'NEWLINE\\': <span class="anchor" id="markmin_NEWLINE"></span></p>'
+        return text.translate(ttab_out), complete
 
-    >>> render("anchor with name 'NEWLINE': [[NEWLINE [newline] ]]")
-    '<p>anchor with name \\'NEWLINE\\': <span class="anchor" id="markmin_NEWLINE">newline</span></p>'
-    """
-    if autolinks == "default":
-        autolinks = autolinks_simple
-    if protolinks == "default":
-        protolinks = protolinks_simple
-    pp = "\n" if pretty_print else ""
-    if isinstance(text, unicode):  # NOQA
-        text = text.encode("utf8")
-    text = str(text or "")
-    text = regex_backslash.sub(lambda m: m.group(1).translate(ttab_in), text)
-    # concatenate strings separeted by \\n
-    text = text.replace("\x05", "").replace("\r\n", "\n")
-
-    if URL is not None:
-        text = replace_at_urls(text, URL)
-
-    if latex == "google":
-        text = regex_dd.sub("``\g<latex>``:latex ", text)
-
-    #############################################################
-    # replace all blocks marked with ``...``:class[id] with META
-    # store them into segments they will be treated as code
-    #############################################################
-    segments = []
-
-    def mark_code(m):
+    def mark_code(self, st, m):
         g = m.group(0)
         if g in (META, DISABLED_META):
-            segments.append((None, None, None, g))
+            st.segments.append((None, None, None, g))
             return m.group()
         elif g == "````":
-            segments.append((None, None, None, ""))
+            st.segments.append((None, None, None, ""))
             return m.group()
         else:
             c = m.group("c") or ""
             p = m.group("p") or ""
-            if "code" in allowed and c not in allowed["code"]:
+            if "code" in self.allowed and c not in self.allowed["code"]:
                 c = ""
             code = m.group("t").replace("!`!", "`")
-            segments.append((code, c, p, m.group(0)))
+            st.segments.append((code, c, p, m.group(0)))
         return META
 
-    text = regex_code.sub(mark_code, text)
-
-    #############################################################
-    # replace all blocks marked with [[...]] with LINK
-    # store them into links they will be treated as link
-    #############################################################
-    links = []
-
-    def mark_link(m):
-        links.append(None if m.group() == LINK else m.group("s"))
+    def mark_link(self, st, m):
+        st.links.append(None if m.group() == LINK else m.group("s"))
         return LINK
 
-    text = regex_link.sub(mark_link, text)
-    text = escape(text)
-
-    if protolinks:
-        text = regex_proto.sub(lambda m: protolinks(*m.group("p", "k")), text)
-
-    if autolinks:
-        text = replace_autolinks(text, autolinks)
-
-    #############################################################
-    # normalize spaces
-    #############################################################
-    strings = text.split("\n")
-
-    def parse_title(t, s):  # out, lev, etags, tag, s):
+    def parse_title(self, st, t, s):
         hlevel = str(len(t))
-        out.extend(etags[::-1])
-        out.append("<h%s>%s" % (hlevel, s))
-        etags[:] = ["</h%s>%s" % (hlevel, pp)]
+        st.out.extend(st.etags[::-1])
+        st.out.append("<h%s>%s" % (hlevel, s))
+        st.etags[:] = ["</h%s>%s" % (hlevel, self.pp)]
         lev = 0
-        ltags[:] = []
-        tlev[:] = []
+        st.ltags[:] = []
+        st.tlev[:] = []
         return (lev, "h")
 
-    def parse_list(t, p, s, tag, lev, mtag, lineno):
+    def parse_list(self, st, t, p, s, tag, lev, mtag, lineno):
+        pp = self.pp
+        out, etags, ltags, tlev = st.out, st.etags, st.ltags, st.tlev
         lent = len(t)
         if lent < lev:  # current item level < previous item level
             while ltags[-1] > lent:
@@ -1089,7 +1054,7 @@ def render(
                 ltags[:] = []
                 tlev[:] = []
                 etags[:] = []
-            if pend and mtag == ".":  # paragraph in a list:
+            if self.pend and mtag == ".":  # paragraph in a list:
                 out.append(etags.pop())
                 ltags.pop()
             for i in range(lent - lev):
@@ -1117,51 +1082,54 @@ def render(
         etags.append("</li>" + pp)
         ltags.append(lev)
         if s[:1] == "-":
-            (s, mtag, lineno) = parse_table_or_blockquote(s, mtag, lineno)
+            (s, mtag, lineno) = self.parse_table_or_blockquote(st, s, mtag, lineno)
         if p and mtag == "l":
-            (lev, mtag, lineno) = parse_point(t, s, lev, "", lineno)
+            (lev, mtag, lineno) = self.parse_point(st, t, s, lev, "", lineno)
         else:
             out.append(s)
 
         return (lev, mtag, lineno)
 
-    def parse_point(t, s, lev, mtag, lineno):
+    def parse_point(self, st, t, s, lev, mtag, lineno):
         """ paragraphs in lists """
+        out, etags, ltags = st.out, st.etags, st.ltags
         lent = len(t)
         if lent > lev:
-            return parse_list(t, ".", s, "ul", lev, mtag, lineno)
+            return self.parse_list(st, t, ".", s, "ul", lev, mtag, lineno)
         elif lent < lev:
             while ltags[-1] > lent:
                 ltags.pop()
                 out.append(etags.pop())
             lev = lent
-            tlev[lev:] = []
+            st.tlev[lev:] = []
             mtag = ""
         elif lent == lev:
-            if pend and mtag == ".":
+            if self.pend and mtag == ".":
                 out.append(etags.pop())
                 ltags.pop()
-        if br and mtag in ("l", "."):
-            out.append(br)
+        if self.br and mtag in ("l", "."):
+            out.append(self.br)
         if s == META:
             mtag = ""
         else:
             mtag = "."
             if s[:1] == "-":
-                (s, mtag, lineno) = parse_table_or_blockquote(s, mtag, lineno)
+                (s, mtag, lineno) = self.parse_table_or_blockquote(st, s, mtag, lineno)
             if mtag == ".":
-                out.append(pbeg)
-                if pend:
-                    etags.append(pend)
+                out.append(self.pbeg)
+                if self.pend:
+                    etags.append(self.pend)
                     ltags.append(lev)
         out.append(s)
         return (lev, mtag, lineno)
 
-    def parse_table_or_blockquote(s, mtag, lineno):
+    def parse_table_or_blockquote(self, st, s, mtag, lineno):
         # check next line. If next line :
         # - is empty -> this is an <hr /> tag
         # - consists '|' -> table
         # - consists other characters -> blockquote
+        pp = self.pp
+        strings, strings_len = st.strings, st.strings_len
         if lineno + 1 >= strings_len or not (s.count("-") == len(s) and len(s) > 3):
             return (s, mtag, lineno)
 
@@ -1219,13 +1187,15 @@ def render(
                     )
                     rownum += 1
                     lineno += 1
+                else:
+                    st.unclosed = True
 
                 t_cls = (
-                    ' class="%s%s"' % (class_prefix, t_cls)
+                    ' class="%s%s"' % (self.class_prefix, t_cls)
                     if t_cls and t_cls != "id"
                     else ""
                 )
-                t_id = ' id="%s%s"' % (id_prefix, t_id) if t_id else ""
+                t_id = ' id="%s%s"' % (self.id_prefix, t_id) if t_id else ""
                 s = ""
                 if thead:
                     s += "<thead>" + pp + "".join([l for l in thead]) + "</thead>" + pp
@@ -1270,13 +1240,15 @@ def render(
                         continue
 
                     lineno += 1
+                else:
+                    st.unclosed = True
 
                 t_cls = (
-                    ' class="%s%s"' % (class_prefix, t_cls)
+                    ' class="%s%s"' % (self.class_prefix, t_cls)
                     if t_cls and t_cls != "id"
                     else ""
                 )
-                t_id = ' id="%s%s"' % (id_prefix, t_id) if t_id else ""
+                t_id = ' id="%s%s"' % (self.id_prefix, t_id) if t_id else ""
 
                 s = "<blockquote%s%s>%s</blockquote>%s" % (
                     t_cls,
@@ -1291,115 +1263,97 @@ def render(
             mtag = "q"
         return (s, "q", lineno)
 
-    if sep == "p":
-        pbeg = "<p>"
-        pend = "</p>" + pp
-        br = ""
-    else:
-        pbeg = pend = ""
-        br = "<br />" + pp if sep == "br" else ""
-
-    lev = 0  # nesting level of lists
-    c0 = ""  # first character of current line
-    out = []  # list of processed lines
-    etags = []  # trailing tags
-    ltags = []  # level# correspondent to trailing tag
-    tlev = []  # list of tags for each level ('ul' or 'ol')
-    # marked tag (~last tag) ('l','.','h','p','t'). Used to set <br/>
-    mtag = ""
-    # and to avoid <p></p> around tables and blockquotes
-    lineno = 0
-    strings_len = len(strings)
-    while lineno < strings_len:
-        s0 = strings[lineno][:1]
-        s = strings[lineno].strip()
-        """ #     +     -     .             ---------------------
-            ##    ++    --    ..   -------  field | field | field  <-title
-            ###   +++   ---   ...  quote    =====================
-            ####  ++++  ----  .... -------  field | field | field  <-body
-            ##### +++++ ----- .....         ---------------------:class[id]
-        """
-        pc0 = c0  # first character of previous line
-        c0 = s[:1]
-        if c0:  # for non empty strings
-            if c0 in "#+-.":  # first character is one of: # + - .
-                (t1, t2, p, ss) = regex_list.findall(s)[0]
-                # t1 - tag ("###")
-                # t2 - tag ("+++", "---", "...")
-                # p - paragraph point ('.')->for "++." or "--."
-                # ss - other part of string
-                if t1 or t2:
-                    # headers and lists:
-                    if c0 == "#":  # headers
-                        (lev, mtag) = parse_title(t1, ss)
-                        lineno += 1
-                        continue
-                    elif c0 == "+":  # ordered list
-                        (lev, mtag, lineno) = parse_list(
-                            t2, p, ss, "ol", lev, mtag, lineno
-                        )
-                        lineno += 1
-                        continue
-                    elif c0 == "-":  # unordered list, table or blockquote
-                        if p or ss:
-                            (lev, mtag, lineno) = parse_list(
-                                t2, p, ss, "ul", lev, mtag, lineno
-                            )
+    def parse_lines(self, st):
+        """Turn st.strings into html in st.out, returns the last marked tag."""
+        br, pbeg, pend = self.br, self.pbeg, self.pend
+        strings, strings_len, out = st.strings, st.strings_len, st.out
+        lev = 0  # nesting level of lists
+        c0 = ""  # first character of current line
+        # marked tag (~last tag) ('l','.','h','p','t'). Used to set <br/>
+        mtag = ""
+        # and to avoid <p></p> around tables and blockquotes
+        lineno = 0
+        while lineno < strings_len:
+            s0 = strings[lineno][:1]
+            s = strings[lineno].strip()
+            """ #     +     -     .             ---------------------
+                ##    ++    --    ..   -------  field | field | field  <-title
+                ###   +++   ---   ...  quote    =====================
+                ####  ++++  ----  .... -------  field | field | field  <-body
+                ##### +++++ ----- .....         ---------------------:class[id]
+            """
+            pc0 = c0  # first character of previous line
+            c0 = s[:1]
+            if c0:  # for non empty strings
+                if c0 in "#+-.":  # first character is one of: # + - .
+                    (t1, t2, p, ss) = regex_list.findall(s)[0]
+                    # t1 - tag ("###")
+                    # t2 - tag ("+++", "---", "...")
+                    # p - paragraph point ('.')->for "++." or "--."
+                    # ss - other part of string
+                    if t1 or t2:
+                        # headers and lists:
+                        if c0 == "#":  # headers
+                            (lev, mtag) = self.parse_title(st, t1, ss)
                             lineno += 1
                             continue
-                        else:
-                            (s, mtag, lineno) = parse_table_or_blockquote(
-                                s, mtag, lineno
+                        elif c0 == "+":  # ordered list
+                            (lev, mtag, lineno) = self.parse_list(
+                                st, t2, p, ss, "ol", lev, mtag, lineno
                             )
-                    elif lev > 0:  # and c0 == '.' # paragraph in lists
-                        (lev, mtag, lineno) = parse_point(t2, ss, lev, mtag, lineno)
-                        lineno += 1
-                        continue
-
-            if lev == 0 and (mtag == "q" or s == META):
-                # new paragraph
-                pc0 = ""
+                            lineno += 1
+                            continue
+                        elif c0 == "-":  # unordered list, table or blockquote
+                            if p or ss:
+                                (lev, mtag, lineno) = self.parse_list(
+                                    st, t2, p, ss, "ul", lev, mtag, lineno
+                                )
+                                lineno += 1
+                                continue
+                            else:
+                                (s, mtag, lineno) = self.parse_table_or_blockquote(
+                                    st, s, mtag, lineno
+                                )
+                        elif lev > 0:  # and c0 == '.' # paragraph in lists
+                            (lev, mtag, lineno) = self.parse_point(st, t2, ss, lev, mtag, lineno)
+                            lineno += 1
+                            continue
 
-            if pc0 == "" or (mtag != "p" and s0 not in (" ", "\t")):
-                # paragraph
-                out.extend(etags[::-1])
-                etags = []
-                ltags = []
-                tlev = []
-                lev = 0
-                if br and mtag == "p":
-                    out.append(br)
-                if mtag != "q" and s != META:
-                    if pend:
-                        etags = [pend]
-                    out.append(pbeg)
-                    mtag = "p"
-                else:
-                    mtag = ""
-                out.append(s)
-            else:
-                if lev > 0 and mtag == "." and s == META:
-                    out.append(etags.pop())
-                    ltags.pop()
+                if lev == 0 and (mtag == "q" or s == META):
+                    # new paragraph
+                    pc0 = ""
+
+                if pc0 == "" or (mtag != "p" and s0 not in (" ", "\t")):
+                    # paragraph
+                    out.extend(st.etags[::-1])
+                    st.etags = []
+                    st.ltags = []
+                    st.tlev = []
+                    lev = 0
+                    if br and mtag == "p":
+                        out.append(br)
+                    if mtag != "q" and s != META:
+                        if pend:
+                            st.etags = [pend]
+                        out.append(pbeg)
+                        mtag = "p"
+                    else:
+                        mtag = ""
                     out.append(s)
-                    mtag = ""
                 else:
-                    out.append(" " + s)
-        lineno += 1
-    out.extend(etags[::-1])
-    text = "".join(out)
-
-    #############################################################
-    # do strong,em,del
-    #############################################################
-    text = regex_strong.sub("<strong>\g<t></strong>", text)
-    text = regex_del.sub("<del>\g<t></del>", text)
-    text = regex_em.sub("<em>\g<t></em>", text)
-
-    #############################################################
-    # deal with images, videos, audios and links
-    #############################################################
-    def sub_media(m):
+                    if lev > 0 and mtag == "." and s == META:
+                        out.append(st.etags.pop())
+                        st.ltags.pop()
+                        out.append(s)
+                        mtag = ""
+                    else:
+                        out.append(" " + s)
+            lineno += 1
+        out.extend(st.etags[::-1])
+        return mtag
+
+    def sub_media(self, m):
+        pp = self.pp
         t, a, k, p, w = m.group("t", "a", "k", "p", "w")
         if not k:
             return m.group(0)
@@ -1426,20 +1380,7 @@ def render(
         if style:
             style = ' style="%s"' % style
         if p in ("video", "audio"):
-            t = render(
-                t,
-                {},
-                {},
-                "br",
-                URL,
-                environment,
-                latex,
-                autolinks,
-                protolinks,
-                class_prefix,
-                id_prefix,
-                pretty_print,
-            )
+            t = self.nested_renderer().render(t)
             return (
                 '<%(p)s controls="controls"%(title)s%(style)s><source src="%(k)s" />%(t)s</%(p)s>'
                 % dict(p=p, title=title, style=style, k=k, t=t)
@@ -1449,7 +1390,7 @@ def render(
             begin=p_begin, k=k, alt=alt, title=title, style=style, end=p_end
         )
 
-    def sub_link(m):
+    def sub_link(self, m):
         t, a, k, p = m.group("t", "a", "k", "p")
         if not k and not t:
             return m.group(0)
@@ -1458,86 +1399,39 @@ def render(
         if k:
             if "#" in k and ":" not in k.split("#")[0]:
                 # wikipage, not external url
-                k = k.replace("#", "#" + id_prefix)
+                k = k.replace("#", "#" + self.id_prefix)
             k = escape(k)
             title = ' title="%s"' % a.replace(META, DISABLED_META) if a else ""
             target = ' target="_blank"' if p == "popup" else ""
-            t = (
-                render(
-                    t,
-                    {},
-                    {},
-                    "br",
-                    URL,
-                    environment,
-                    latex,
-                    None,
-                    None,
-                    class_prefix,
-                    id_prefix,
-                    pretty_print,
-                )
-                if t
-                else k
-            )
+            t = self.nested_renderer(links=False).render(t) if t else k
             return '<a href="%(k)s"%(title)s%(target)s>%(t)s</a>' % dict(
                 k=k, title=title, target=target, t=t
             )
         if t == "NEWLINE" and not a:
-            return "<br />" + pp
+            return "<br />" + self.pp
         return '<span class="anchor" id="%s">%s</span>' % (
-            escape(id_prefix + t),
-            render(
-                a,
-                {},
-                {},
-                "br",
-                URL,
-                environment,
-                latex,
-                autolinks,
-                protolinks,
-                class_prefix,
-                id_prefix,
-                pretty_print,
-            ),
+            escape(self.id_prefix + t),
+            self.nested_renderer().render(a),
         )
 
-    parts = text.split(LINK)
-    text = parts[0]
-    for i, s in enumerate(links):
-        if s is None:
-            html = LINK
-        else:
-            html = regex_media_level2.sub(sub_media, s)
-            if html == s:
-                html = regex_link_level2.sub(sub_link, html)
-            if html == s:
-                # return unprocessed string as a signal of an error
-                html = "[[%s]]" % s
-        text += html + parts[i + 1]
-
-    #############################################################
-    # process all code text
-    #############################################################
-    def expand_meta(m):
-        code, b, p, s = segments.pop(0)
+    def expand_meta(self, st, m):
+        code, b, p, s = st.segments.pop(0)
         if code is None or m.group() == DISABLED_META:
             return escape(s)
-        if b in extra:
+        if b in self.extra:
             if code[:1] == "\n":
                 code = code[1:]
             if code[-1:] == "\n":
                 code = code[:-1]
             if p:
-                return str(extra[b](code, p))
+                return str(self.extra[b](code, p))
             else:
-                return str(extra[b](code))
+                return str(self.extra[b](code))
         elif b == "cite":
             return (
                 "["
                 + ",".join(
-                    '<a href="#%s" class="%s">%s</a>' % (id_prefix + d, b, d)
+                    '<a href="#%s" class="%s">%s</a>' % (self.id_prefix + d, b, d)
                     for d in escape(code).split(",")
                 )
                 + "]"
@@ -1547,20 +1441,7 @@ def render(
         elif b in html_colors:
             return '<span style="color: %s">%s</span>' % (
                 b,
-                render(
-                    code,
-                    {},
-                    {},
-                    "br",
-                    URL,
-                    environment,
-                    latex,
-                    autolinks,
-                    protolinks,
-                    class_prefix,
-                    id_prefix,
-                    pretty_print,
-                ),
+                self.nested_renderer().render(code),
             )
         elif b in ("c", "color") and p:
             c = p.split(":")
@@ -1569,23 +1450,10 @@ def render(
             return '<span style="%s%s">%s</span>' % (
                 fg,
                 bg,
-                render(
-                    code,
-                    {},
-                    {},
-                    "br",
-                    URL,
-                    environment,
-                    latex,
-                    autolinks,
-                    protolinks,
-                    class_prefix,
-                    id_prefix,
-                    pretty_print,
-                ),
+                self.nested_renderer().render(code),
             )
-        cls = ' class="%s%s"' % (class_prefix, b) if b and b != "id" else ""
-        id = ' id="%s%s"' % (id_prefix, escape(p)) if p else ""
+        cls = ' class="%s%s"' % (self.class_prefix, b) if b and b != "id" else ""
+        id = ' id="%s%s"' % (self.id_prefix, escape(p)) if p else ""
         beg = code[:1] == "\n"
         end = [None, -1][code[-1:] == "\n"]
         if beg and end:
@@ -1593,16 +1461,274 @@ def render(
                 cls,
                 id,
                 escape(code[1:-1]),
-                pp,
+                self.pp,
             )
         return "<code%s%s>%s</code>" % (cls, id, escape(code[beg:end]))
 
-    text = regex_expand_meta.sub(expand_meta, text)
 
-    if environment:
-        text = replace_components(text, environment)
+def render(
+    text,
+    extra={},
+    allowed={},
+    sep="p",
+    URL=None,
+    environment=None,
+    latex="google",
+    autolinks="default",
+    protolinks="default",
+    class_prefix="",
+    id_prefix="markmin_",
+    pretty_print=False,
+):
+    """
+    Arguments:
+    - text is the text to be processed
+    - extra is a dict like extra=dict(custom=lambda value: value) that process custom code
+      as in " ``this is custom code``:custom "
+    - allowed is a dictionary of list of allowed classes like
+      allowed = dict(code=('python','cpp','java'))
+    - sep can be 'p' to separate text in <p>...</p>
+      or can be 'br' to separate text using <br />
+    - URL -
+    - environment is a dictionary of environment variables (can be accessed with @{variable}
+    - latex -
+    - autolinks is a function to convert auto urls to html-code (default is autolinks(url) )
+    - protolinks is a function to convert proto-urls (e.g."proto:url") to html-code
+      (default is protolinks(proto,url))
+    - class_prefix is a prefix for ALL classes in markmin text. E.g. if class_prefix='my_'
+      then for ``test``:cls class will be changed to "my_cls" (default value is '')
+    - id_prefix is prefix for ALL ids in markmin text (default value is 'markmin_'). E.g.:
+        -- [[id]] will be converted to <span class="anchor" id="markmin_id"></span>
+        -- [[link #id]] will be converted to <a href="#markmin_id">link</a>
+        -- ``test``:cls[id] will be converted to <code class="cls" id="markmin_id">test</code>
+
+    >>> render('this is\\n# a section\\n\\nparagraph')
+    '<p>this is</p><h1>a section</h1><p>paragraph</p>'
+    >>> render('this is\\n## a subsection\\n\\nparagraph')
+    '<p>this is</p><h2>a subsection</h2><p>paragraph</p>'
+    >>> render('this is\\n### a subsubsection\\n\\nparagraph')
+    '<p>this is</p><h3>a subsubsection</h3><p>paragraph</p>'
+    >>> render('**hello world**')
+    '<p><strong>hello world</strong></p>'
+    >>> render('``hello world``')
+    '<code>hello world</code>'
+    >>> render('``hello world``:python')
+    '<code class="python">hello world</code>'
+    >>> render('``\\nhello\\nworld\\n``:python')
+    '<pre><code class="python">hello\\nworld</code></pre>'
+    >>> render('``hello world``:python[test_id]')
+    '<code class="python" id="markmin_test_id">hello world</code>'
+    >>> render('``hello world``:id[test_id]')
+    '<code id="markmin_test_id">hello world</code>'
+    >>> render('``\\nhello\\nworld\\n``:python[test_id]')
+    '<pre><code class="python" id="markmin_test_id">hello\\nworld</code></pre>'
+    >>> render('``\\nhello\\nworld\\n``:id[test_id]')
+    '<pre><code id="markmin_test_id">hello\\nworld</code></pre>'
+    >>> render("''hello world''")
+    '<p><em>hello world</em></p>'
+    >>> render('** hello** **world**')
+    '<p>** hello** <strong>world</strong></p>'
+
+    >>> render('- this\\n- is\\n- a list\\n\\nand this\\n- is\\n- another')
+    '<ul><li>this</li><li>is</li><li>a list</li></ul><p>and this</p><ul><li>is</li><li>another</li></ul>'
+
+    >>> render('+ this\\n+ is\\n+ a list\\n\\nand this\\n+ is\\n+ another')
+    '<ol><li>this</li><li>is</li><li>a list</li></ol><p>and this</p><ol><li>is</li><li>another</li></ol>'
+
+    >>> render("----\\na | b\\nc | d\\n----\\n")
+    '<table><tbody><tr class="first"><td>a</td><td>b</td></tr><tr class="even"><td>c</td><td>d</td></tr></tbody></table>'
+
+    >>> render("----\\nhello world\\n----\\n")
+    '<blockquote>hello world</blockquote>'
+
+    >>> render('[[myanchor]]')
+    '<p><span class="anchor" id="markmin_myanchor"></span></p>'
+
+    >>> render('[[ http://example.com]]')
+    '<p><a href="http://example.com">http://example.com</a></p>'
+
+    >>> render('[[bookmark [http://example.com] ]]')
+    '<p><span class="anchor" id="markmin_bookmark"><a href="http://example.com">http://example.com</a></span></p>'
+
+    >>> render('[[this is a link http://example.com]]')
+    '<p><a href="http://example.com">this is a link</a></p>'
+
+    >>> render('[[this is an image http://example.com left]]')
+    '<p><img src="http://example.com" alt="this is an image" style="float:left" /></p>'
+
+    >>> render('[[this is an image http://example.com left 200px]]')
+    '<p><img src="http://example.com" alt="this is an image" style="float:left;width:200px" /></p>'
+
+    >>> render("[[Your browser doesn't support <video> HTML5 tag http://example.com video]]")
+    '<p><video controls="controls"><source src="http://example.com" />Your browser doesn\\'t support &lt;video&gt; HTML5 tag</video></p>'
+
+    >>> render("[[Your browser doesn't support <audio> HTML5 tag http://example.com audio]]")
+    '<p><audio controls="controls"><source src="http://example.com" />Your browser doesn\\'t support &lt;audio&gt; HTML5 tag</audio></p>'
+
+    >>> render("[[Your\\nbrowser\\ndoesn't\\nsupport\\n<audio> HTML5 tag http://exam\\\\\\nple.com\\naudio]]")
+    '<p><audio controls="controls"><source src="http://example.com" />Your browser doesn\\'t support &lt;audio&gt; HTML5 tag</audio></p>'
+
+    >>> render('[[this is a **link** http://example.com]]')
+    '<p><a href="http://example.com">this is a <strong>link</strong></a></p>'
+
+    >>> render("``aaa``:custom", extra=dict(custom=lambda text: 'x'+text+'x'))
+    'xaaax'
+
+    >>> print render(r"$$\int_a^b sin(x)dx$$")
+    <img src="http://chart.apis.google.com/chart?cht=tx&chl=%5Cint_a%5Eb%20sin%28x%29dx" />
+
+    >>> markmin2html(r"use backslash: \[\[[[mess\[[ag\]]e link]]\]]")
+    '<p>use backslash: [[<a href="link">mess[[ag]]e</a>]]</p>'
+
+    >>> markmin2html("backslash instead of exclamation sign: \``probe``")
+    '<p>backslash instead of exclamation sign: ``probe``</p>'
+
+    >>> render(r"simple image: [[\[[this is an image\]] http://example.com IMG]]!!!")
+    '<p>simple image: <img src="http://example.com" alt="[[this is an image]]" />!!!</p>'
+
+    >>> render(r"simple link no anchor with popup: [[ http://example.com popup]]")
+    '<p>simple link no anchor with popup: <a href="http://example.com" target="_blank">http://example.com</a></p>'
+
+    >>> render("auto-url: http://example.com")
+    '<p>auto-url: <a href="http://example.com">http://example.com</a></p>'
+
+    >>> render("auto-image: (http://example.com/image.jpeg)")
+    '<p>auto-image: (<img src="http://example.com/image.jpeg" controls />)</p>'
+
+    >>> render("qr: (qr:http://example.com/image.jpeg)")
+    '<p>qr: (<img style="width:100px" src="http://chart.apis.google.com/chart?cht=qr&chs=100x100&chl=http://example.com/image.jpeg&choe=UTF-8&chld=H" alt="QR Code" title="QR Code" />)</p>'
+
+    >>> render("embed: (embed:http://example.com/page)")
+    '<p>embed: (<iframe src="http://example.com/page" frameborder="0" allowfullscreen></iframe>)</p>'
+
+    >>> render("iframe: (iframe:http://example.com/page)")
+    '<p>iframe: (<iframe src="http://example.com/page" frameborder="0" allowfullscreen></iframe>)</p>'
+
+    >>> render("title1: [[test message [simple \[test\] title] http://example.com ]] test")
+    '<p>title1: <a href="http://example.com" title="simple [test] title">test message</a> test</p>'
+
+    >>> render("title2: \[\[[[test message [simple title] http://example.com popup]]\]]")
+    '<p>title2: [[<a href="http://example.com" title="simple title" target="_blank">test message</a>]]</p>'
+
+    >>> render("title3: [[ [link w/o anchor but with title] http://www.example.com ]]")
+    '<p>title3: <a href="http://www.example.com" title="link w/o anchor but with title">http://www.example.com</a></p>'
+
+    >>> render("title4: [[ [simple title] http://www.example.com popup]]")
+    '<p>title4: <a href="http://www.example.com" title="simple title" target="_blank">http://www.example.com</a></p>'
+
+    >>> render("title5: [[test message [simple title] http://example.com IMG]]")
+    '<p>title5: <img src="http://example.com" alt="test message" title="simple title" /></p>'
+
+    >>> render("title6: [[[test message w/o title] http://example.com IMG]]")
+    '<p>title6: <img src="http://example.com" alt="[test message w/o title]" /></p>'
+
+    >>> render("title7: [[[this is not a title] [this is a title] http://example.com IMG]]")
+    '<p>title7: <img src="http://example.com" alt="[this is not a title]" title="this is a title" /></p>'
+
+    >>> render("title8: [[test message [title] http://example.com center]]")
+    '<p>title8: <p style="text-align:center"><img src="http://example.com" alt="test message" title="title" /></p></p>'
+
+    >>> render("title9: [[test message [title] http://example.com left]]")
+    '<p>title9: <img src="http://example.com" alt="test message" title="title" style="float:left" /></p>'
+
+    >>> render("title10: [[test message [title] http://example.com right 100px]]")
+    '<p>title10: <img src="http://example.com" alt="test message" title="title" style="float:right;width:100px" /></p>'
+
+    >>> render("title11: [[test message [title] http://example.com center 200px]]")
+    '<p>title11: <p style="text-align:center"><img src="http://example.com" alt="test message" title="title" style="width:200px" /></p></p>'
+
+    >>> render(r"\\[[probe]]")
+    '<p>[[probe]]</p>'
+
+    >>> render(r"\\\\[[probe]]")
+    '<p>\\\\<span class="anchor" id="markmin_probe"></span></p>'
+
+    >>> render(r"\\\\\\[[probe]]")
+    '<p>\\\\[[probe]]</p>'
+
+    >>> render(r"\\\\\\\\[[probe]]")
+    '<p>\\\\\\\\<span class="anchor" id="markmin_probe"></span></p>'
+
+    >>> render(r"\\\\\\\\\[[probe]]")
+    '<p>\\\\\\\\[[probe]]</p>'
+
+    >>> render(r"\\\\\\\\\\\[[probe]]")
+    '<p>\\\\\\\\\\\\<span class="anchor" id="markmin_probe"></span></p>'
+
+    >>> render("``[[ [\\[[probe\]\\]] URL\\[x\\]]]``:red[dummy_params]")
+    '<span style="color: red"><a href="URL[x]" title="[[probe]]">URL[x]</a></span>'
+
+    >>> render("the \\**text**")
+    '<p>the **text**</p>'
+
+    >>> render("the \\``text``")
+    '<p>the ``text``</p>'
+
+    >>> render("the \\\\''text''")
+    "<p>the ''text''</p>"
+
+    >>> render("the [[link [**with** ``<b>title</b>``:red] http://www.example.com]]")
+    '<p>the <a href="http://www.example.com" title="**with** ``&lt;b&gt;title&lt;/b&gt;``:red">link</a></p>'
+
+    >>> render("the [[link \\[**without** ``<b>title</b>``:red\\] http://www.example.com]]")
+    '<p>the <a href="http://www.example.com">link [<strong>without</strong> <span style="color: red">&lt;b&gt;title&lt;/b&gt;</span>]</a></p>'
+
+    >>> render("aaa-META-``code``:text[]-LINK-[[link http://www.example.com]]-LINK-[[image http://www.picture.com img]]-end")
+    '<p>aaa-META-<code class="text">code</code>-LINK-<a href="http://www.example.com">link</a>-LINK-<img src="http://www.picture.com" alt="image" />-end</p>'
+
+    >>> render("[[<a>test</a> [<a>test2</a>] <a>text3</a>]]")
+    '<p><a href="&lt;a&gt;text3&lt;/a&gt;" title="&lt;a&gt;test2&lt;/a&gt;">&lt;a&gt;test&lt;/a&gt;</a></p>'
 
-    return text.translate(ttab_out)
+    >>> render("[[<a>test</a> [<a>test2</a>] <a>text3</a> IMG]]")
+    '<p><img src="&lt;a&gt;text3&lt;/a&gt;" alt="&lt;a&gt;test&lt;/a&gt;" title="&lt;a&gt;test2&lt;/a&gt;" /></p>'
+
+    >>> render("**bold** ''italic'' ~~strikeout~~")
+    '<p><strong>bold</strong> <em>italic</em> <del>strikeout</del></p>'
+
+    >>> render("this is ``a red on yellow text``:c[#FF0000:#FFFF00]")
+    '<p>this is <span style="color: #FF0000;background-color: #FFFF00;">a red on yellow text</span></p>'
+
+    >>> render("this is ``a text with yellow background``:c[:yellow]")
+    '<p>this is <span style="background-color: yellow;">a text with yellow background</span></p>'
+
+    >>> render("this is ``a colored text (RoyalBlue)``:color[rgb(65,105,225)]")
+    '<p>this is <span style="color: rgb(65,105,225);">a colored text (RoyalBlue)</span></p>'
+
+    >>> render("this is ``a green text``:color[green:]")
+    '<p>this is <span style="color: green;">a green text</span></p>'
+
+    >>> render("**@{probe:1}**", environment=dict(probe=lambda t:"test %s" % t))
+    '<p><strong>test 1</strong></p>'
+
+    >>> render("**@{probe:t=a}**", environment=dict(probe=lambda t:"test %s" % t, a=1))
+    '<p><strong>test 1</strong></p>'
+
+    >>> render('[[id1 [span **messag** in ''markmin''] ]] ... [[**link** to id [link\\\'s title] #mark1]]')
+    '<p><span class="anchor" id="markmin_id1">span <strong>messag</strong> in markmin</span> ... <a href="#markmin_mark1" title="link\\\'s title"><strong>link</strong> to id</a></p>'
+
+    >>> render('# Multiline[[NEWLINE]]\\n title\\nParagraph[[NEWLINE]]\\nwith breaks[[NEWLINE]]\\nin it')
+    '<h1>Multiline<br /> title</h1><p>Paragraph<br /> with breaks<br /> in it</p>'
+
+    >>> render("anchor with name 'NEWLINE': [[NEWLINE [ ] ]]")
+    '<p>anchor with name \\'NEWLINE\\': <span class="anchor" id="markmin_NEWLINE"></span></p>'
+
+    >>> render("anchor with name 'NEWLINE': [[NEWLINE [newline] ]]")
+    '<p>anchor with name \\'NEWLINE\\': <span class="anchor" id="markmin_NEWLINE">newline</span></p>'
+    """
+    return Renderer(
+        extra,
+        allowed,
+        sep,
+        URL,
+        environment,
+        latex,
+        autolinks,
+        protolinks,
+        class_prefix,
+        id_prefix,
+        pretty_print,
+        memo_size=0,
+    ).render(text)
 
 
 def markmin2html(
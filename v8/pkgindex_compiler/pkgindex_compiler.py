@@ -170,6 +170,13 @@ def parse_theme_info(post, pkg_dir, config):
     parent = os.path.join(pkg_dir, 'parent')
 
     data['chain'] = utils.get_theme_chain(theme, [os.path.dirname(pkg_dir), 'themes'])
+    for path in data['chain'][1:]:
+        # The chain changes when the parents change theirs
+        name = os.path.basename(path)
+        for meta_file in (os.path.join(path, name + '.theme'), os.path.join(path, 'parent')):
+            if os.path.exists(meta_file):
+                post.add_dependency(meta_file)
+                break
     data['chain'] = [os.path.basename(i) for i in reversed(data['chain'])]
 
     try:
@@ -300,6 +307,8 @@ class CompilePackageIndexEntries(PageCompiler):
     markdown_compiler = None
     pi_enabled = False
     supports_metadata = True
+    # Set by pkgindex_scan while scanning, see ScanCache there
+    metadata_cache = None
 
     def set_site(self, site):
         """Set site for the compiler."""
@@ -315,6 +324,12 @@ class CompilePackageIndexEntries(PageCompiler):
         if not self.pi_enabled:
             raise Exception("PKGINDEX_CONFIG not found")
 
+        if self.metadata_cache is not None:
+            return self.metadata_cache.get(post, lambda: self._read_metadata(post))
+        return self._read_metadata(post)
+
+    def _read_metadata(self, post):
+        """Read the metadata from a post, using the handlers of its directory."""
         pkg_dir = os.path.split(post.source_path)[0]
         top_dir = post.folder_relative
         metadata = {'slug': os.path.basename(pkg_dir)}
@@ -28,7 +28,11 @@
 
 from __future__ import unicode_literals
 
+import copy
+import functools
 import glob
+import hashlib
+import json
 import sys
 import os
 
@@ -38,6 +42,149 @@ from nikola.plugin_categories import PostScanner
 
 LOGGER = utils.get_logger('pkgindex_scan', utils.STDERR_HANDLER)
 
+# Bump this when the cached data changes
+SCAN_CACHE_FORMAT = 1
+
+
+def list_packages(topdir):
+    """Return the package directories in topdir."""
+    # Ignore non-directories
+    return [pkgdir for pkgdir in glob.glob(topdir + "/*") if os.path.isdir(pkgdir)]
+
+
+def _describe(obj):
+    """Describe config values that JSON can't store, such as handlers."""
+    if isinstance(obj, functools.partial):
+        return [_describe(obj.func), obj.args, obj.keywords]
+    if hasattr(obj, '__qualname__'):
+        return '{0}.{1}'.format(getattr(obj, '__module__', ''), obj.__qualname__)
+    if isinstance(obj, (range, set, frozenset)):
+        return sorted(obj)
+    return repr(obj)
+
+
+def _to_json(obj):
+    if isinstance(obj, range):
+        return list(obj)
+    raise TypeError('{0!r} cannot be cached'.format(obj))
+
+
+def _file_signature(path):
+    """Describe the state of a file: package descriptors are hashed, other files are compared by mtime and size."""
+    try:
+        if path.endswith(('.plugin', '.theme')):
+            with open(path, 'rb') as fh:
+                return hashlib.sha256(fh.read()).hexdigest()
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def _dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ScanCache(object):
+    """Package listings and metadata, cached on disk between builds.
+
+    A directory listing is reused while the mtime of the directory stays the
+    same.  The metadata of a package is reused while the mtime of its
+    directory and the files the handlers read (hashes of .plugin/.theme
+    files, mtimes and sizes of the others) stay the same.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = json.dumps([SCAN_CACHE_FORMAT, config], sort_keys=True, default=_describe)
+        self.dirs = {}
+        self.packages = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as fh:
+                data = json.load(fh)
+            if data['config'] == self.config:
+                self.dirs = data['dirs']
+                self.packages = data['packages']
+        except (IOError, ValueError, KeyError):
+            pass
+        self.used_dirs = set()
+        self.used_packages = set()
+        self.changed = False
+
+    def list_dir(self, topdir):
+        """Return the package directories in topdir."""
+        self.used_dirs.add(topdir)
+        mtime = _dir_mtime(topdir)
+        entry = self.dirs.get(topdir)
+        if entry is None or entry['mtime'] != mtime:
+            entry = self.dirs[topdir] = {'mtime': mtime, 'pkgdirs': list_packages(topdir)}
+            self.changed = True
+        return entry['pkgdirs']
+
+    def get(self, post, compute):
+        """Return the metadata of post, calling compute() if the cached metadata is outdated.
+
+        The dependencies compute() adds to post are recorded, and added again when
+        the metadata is taken from the cache.
+        """
+        name = post.source_path
+        self.used_packages.add(name)
+        pkg_dir = os.path.dirname(name)
+        entry = self.packages.get(name)
+        if (entry is not None and entry['folder'] == post.folder_relative and
+                entry['mtime'] == _dir_mtime(pkg_dir) and
+                all(_file_signature(dep) == signature for dep, signature in entry['deps'])):
+            for dep, signature in entry['deps']:
+                post.add_dependency(dep)
+            return copy.deepcopy(entry['metadata'])
+
+        deps = []
+        add_dependency = post.add_dependency
+
+        def record_dependency(dependency, add='both', lang=None):
+            deps.append((dependency, add, lang))
+            add_dependency(dependency, add, lang)
+
+        post.add_dependency = record_dependency
+        try:
+            metadata = compute()
+        finally:
+            del post.add_dependency
+
+        self.packages.pop(name, None)
+        if all(isinstance(dep, str) and add == 'both' and lang is None for dep, add, lang in deps):
+            try:
+                entry = {
+                    'folder': post.folder_relative,
+                    'mtime': _dir_mtime(pkg_dir),
+                    'deps': [[dep, _file_signature(dep)] for dep, add, lang in deps],
+                    'metadata': json.loads(json.dumps(metadata, default=_to_json)),
+                }
+                self.packages[name] = entry
+                # Return the same types the cache will
+                metadata = copy.deepcopy(entry['metadata'])
+            except TypeError:
+                pass
+        self.changed = True
+        return metadata
+
+    def save(self):
+        """Write the cache, dropping entries that were not used."""
+        for cache, used in ((self.dirs, self.used_dirs), (self.packages, self.used_packages)):
+            for name in list(cache):
+                if name not in used:
+                    del cache[name]
+                    self.changed = True
+        if not self.changed:
+            return
+        utils.makedirs(os.path.dirname(self.path))
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as fh:
+            json.dump({'config': self.config, 'dirs': self.dirs, 'packages': self.packages}, fh)
+        os.replace(self.path + '.tmp', self.path)
+
 
 class PackageIndexScanner(PostScanner):
     """Scanner for package indexes."""
@@ -52,56 +199,68 @@ class PackageIndexScanner(PostScanner):
         compiler = self.site.get_compiler('sample' + config['extension'])
         if not self.site.quiet:
             print("Scanning package index posts...", end='', file=sys.stderr)
+        if config.get('scan_cache', True):
+            cache = ScanCache(
+                os.path.join(self.site.config['CACHE_FOLDER'], 'pkgindex_scan.json'),
+                [config, self.site.config['PKGINDEX_DIRS'], self.site.config['PKGINDEX_HANDLERS']])
+            compiler.metadata_cache = cache
+            list_dir = cache.list_dir
+        else:
+            cache = None
+            list_dir = list_packages
         timeline = []
         self.site.pkgindex_entries = {}
         self.site.pkgindex_by_name = {}
         self.site.pkgindex_multiver = {}
-        for topdir, dirsettings in self.site.config['PKGINDEX_DIRS'].items():
-            destination, template_name = dirsettings
-            self.site.pkgindex_entries[topdir] = []
-            for pkgdir in glob.glob(topdir + "/*"):
-                if not os.path.isdir(pkgdir):
-                    # Ignore non-directories
-                    continue
-                post = Post(
-                    os.path.join(pkgdir, 'README.md'),
-                    self.site.config,
-                    destination,
-                    False,
-                    self.site.MESSAGES,
-                    template_name,
-                    compiler
-                )
-                try:
-                    post._is_two_file = True
-                except AttributeError:
-                    post.is_two_file = True
-                for d in post.meta.values():
-                    d['is_special_entry'] = False
-                timeline.append(post)
-                self.site.pkgindex_entries[topdir].append(post)
-                self._update_name_multiver(post)
-
-        if 'special_entries' in config:
-            for source_path, destination, template_name, topdir in config['special_entries']:
-                post = Post(
-                    source_path,
-                    self.site.config,
-                    destination,
-                    False,
-                    self.site.MESSAGES,
-                    template_name,
-                    compiler
-                )
-                try:
-                    post._is_two_file = True
-                except AttributeError:
-                    post.is_two_file = True
-                for d in post.meta.values():
-                    d['is_special_entry'] = True
-                timeline.append(post)
-                self.site.pkgindex_entries[topdir].append(post)
-                self._update_name_multiver(post)
+        try:
+            for topdir, dirsettings in self.site.config['PKGINDEX_DIRS'].items():
+                destination, template_name = dirsettings
+                self.site.pkgindex_entries[topdir] = []
+                for pkgdir in list_dir(topdir):
+                    post = Post(
+                        os.path.join(pkgdir, 'README.md'),
+                        self.site.config,
+                        destination,
+                        False,
+                        self.site.MESSAGES,
+                        template_name,
+                        compiler
+                    )
+                    try:
+                        post._is_two_file = True
+                    except AttributeError:
+                        post.is_two_file = True
+                    for d in post.meta.values():
+                        d['is_special_entry'] = False
+                    timeline.append(post)
+                    self.site.pkgindex_entries[topdir].append(post)
+                    self._update_name_multiver(post)
+
+            if 'special_entries' in config:
+                for source_path, destination, template_name, topdir in config['special_entries']:
+                    post = Post(
+                        source_path,
+                        self.site.config,
+                        destination,
+                        False,
+                        self.site.MESSAGES,
+                        template_name,
+                        compiler
+                    )
+                    try:
+                        post._is_two_file = True
+                    except AttributeError:
+                        post.is_two_file = True
+                    for d in post.meta.values():
+                        d['is_special_entry'] = True
+                    timeline.append(post)
+                    self.site.pkgindex_entries[topdir].append(post)
+                    self._update_name_multiver(post)
+        finally:
+            compiler.metadata_cache = None
+
+        if cache is not None:
+            cache.save()
 
         # But wait, we need to change tags on multiver stuff!
         # This is kinda... hacky...
@@ -28,9 +28,14 @@
 
 from __future__ import unicode_literals
 
+import hashlib
 import os
+import stat
+import struct
 import zipfile
+import zlib
 import json
+from concurrent.futures import ProcessPoolExecutor
 from nikola.plugin_categories import Task
 from nikola import utils
 
@@ -40,12 +45,141 @@ except ImportError:
     from urllib.parse import urljoin  # NOQA
 
 
-def make_zip(files, destination):
-    """Make a zip with files and save as destination."""
+# All members get the same timestamp (1980-01-01 00:00, the earliest one ZIP
+# can store), so that the same files always make the same ZIP.
+ZIP_DOS_TIME = 0
+ZIP_DOS_DATE = (1 << 5) | 1
+
+# Bump this when the ZIPs change for the same files.
+ZIP_FORMAT = 1
+
+
+def read_zip_members(path):
+    """Return the deflated members of an existing zip, as {arcname: (CRC, size, compressed data)}."""
+    members = {}
+    try:
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        with zipfile.ZipFile(path) as z:
+            infos = z.infolist()
+    except (IOError, zipfile.BadZipfile):
+        return members
+    for info in infos:
+        if info.compress_type != zipfile.ZIP_DEFLATED or info.flag_bits & 0x1:
+            continue
+        header = struct.unpack(zipfile.structFileHeader, data[info.header_offset:info.header_offset + zipfile.sizeFileHeader])
+        # The header ends with the lengths of the file name and extra field
+        start = info.header_offset + zipfile.sizeFileHeader + header[-2] + header[-1]
+        members[info.filename] = (info.CRC, info.file_size, data[start:start + info.compress_size])
+    return members
+
+
+def make_zip(files, destination, hashes=None):
+    """Make a zip with files and save as destination.
+
+    The zip is reproducible: members are sorted and have fixed timestamps and
+    permissions. hashes are the SHA-256 digests of the members of the existing
+    zip at destination, as returned by the call that made it; members whose
+    digest did not change are copied without compressing them again. Returns
+    the digests of the new members, as {arcname: digest}.
+    """
     utils.makedirs(os.path.dirname(destination))
-    with zipfile.ZipFile(destination, 'w', zipfile.ZIP_DEFLATED) as z:
-        for filename, arcname in files:
-            z.write(filename, arcname)
+    old_members = read_zip_members(destination) if hashes else {}
+    new_hashes = {}
+    output = []
+    central_directory = []
+    offset = 0
+    for filename, arcname in sorted(files, key=lambda f: f[1]):
+        arcname = arcname.replace(os.sep, '/')
+        with open(filename, 'rb') as fh:
+            content = fh.read()
+        crc = zlib.crc32(content) & 0xffffffff
+        digest = hashlib.sha256(content).hexdigest()
+        new_hashes[arcname] = digest
+        old = old_members.get(arcname)
+        if old is not None and hashes.get(arcname) == digest and old[:2] == (crc, len(content)):
+            compressed = old[2]
+        else:
+            compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+            compressed = compressor.compress(content) + compressor.flush()
+        name = arcname.encode('utf-8')
+        # Set the UTF-8 flag for non-ASCII names
+        flags = 0 if arcname.isascii() else 0x800
+        fields = (20, flags, zipfile.ZIP_DEFLATED, ZIP_DOS_TIME, ZIP_DOS_DATE, crc, len(compressed), len(content), len(name))
+        output += [struct.pack('<4s5H3LHH', b'PK\x03\x04', *fields, 0), name, compressed]
+        mode = 0o755 if os.stat(filename).st_mode & stat.S_IXUSR else 0o644
+        central_directory += [struct.pack(
+            '<4sH5H3L5HLL', b'PK\x01\x02', (3 << 8) | 20, *fields, 0, 0, 0, 0, (stat.S_IFREG | mode) << 16, offset
+        ), name]
+        offset += sum(len(part) for part in output[-3:])
+    central_directory = b''.join(central_directory)
+    count = len(files)
+    output.append(central_directory)
+    output.append(struct.pack('<4s4H2LH', b'PK\x05\x06', 0, 0, count, count, len(central_directory), offset, 0))
+    data = b''.join(output)
+
+    # Leave the file alone if nothing changed
+    try:
+        with open(destination, 'rb') as fh:
+            if fh.read() == data:
+                return new_hashes
+    except IOError:
+        pass
+    with open(destination + '.tmp', 'wb') as fh:
+        fh.write(data)
+    os.replace(destination + '.tmp', destination)
+    return new_hashes
+
+
+def make_zips(zips, manifest_path, processes=None):
+    """Make the zips that are missing or whose files changed.
+
+    zips is a list of (files, destination, signature). The signatures of the
+    zips made before and the digests of their members are kept in
+    manifest_path, as {destination: {'signature': ..., 'members': ...}}.
+    """
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as fh:
+            manifest = json.load(fh)
+    except (IOError, ValueError):
+        manifest = {}
+    # Entries of older versions were only the signature
+    manifest = {destination: entry for destination, entry in manifest.items() if isinstance(entry, dict)}
+    outdated = [
+        (files, destination) for files, destination, signature in zips
+        if manifest.get(destination, {}).get('signature') != signature or not os.path.exists(destination)
+    ]
+    hashes = {destination: manifest.get(destination, {}).get('members') for files, destination in outdated}
+    if len(outdated) > 1 and processes != 1:
+        with ProcessPoolExecutor(processes) as executor:
+            futures = [(destination, executor.submit(make_zip, files, destination, hashes[destination])) for files, destination in outdated]
+            for destination, future in futures:
+                hashes[destination] = future.result()
+    else:
+        for files, destination in outdated:
+            hashes[destination] = make_zip(files, destination, hashes[destination])
+
+    manifest = {
+        destination: {
+            'signature': signature,
+            'members': hashes[destination] if destination in hashes else manifest[destination]['members'],
+        }
+        for files, destination, signature in zips
+    }
+    utils.makedirs(os.path.dirname(manifest_path))
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as fh:
+        json.dump(manifest, fh, sort_keys=True, indent=4)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def zip_signature(files):
+    """Return a digest of the files to zip, their names and stats."""
+    stats = []
+    for filename, arcname in files:
+        st = os.stat(filename)
+        stats.append((filename, arcname, st.st_mtime_ns, st.st_size, st.st_mode))
+    data = json.dumps([ZIP_FORMAT, sorted(stats)])
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
 
 
 def write_json(data, destination):
@@ -74,6 +208,7 @@ class PackageIndexZip(Task):
 
         zip_json = {}
         zip_deps = {}
+        zips = []
         for dir in self.site.pkgindex_entries:
             utils.makedirs(os.path.join(
                 self.kw['output_folder'],
@@ -103,24 +238,29 @@ class PackageIndexZip(Task):
                 # Prefix to slice out from names
                 d = len(directory) - len(pkg_name)
                 zip_files = []
-                file_dep = []
-                # Get list of dependencies and files to zip
+                # Get list of files to zip
                 for root, dirs, files in os.walk(directory):
                     for file in files:
                         if file.endswith(('.pyc', '.DS_Store')) or file == '.git':
                             continue
                         zip_files.append((os.path.join(root, file),
                                           os.path.join(root[d:], file)))
-                        file_dep.append(os.path.join(root, file))
-                yield utils.apply_filters({
-                    'basename': self.name,
-                    'name': destination,
-                    'file_dep': file_dep,
-                    'targets': [destination],
-                    'actions': [(make_zip, (zip_files, destination))],
-                    'clean': True,
-                    'uptodate': [utils.config_changed(self.kw, 'pkgindex_zip:' + destination)],
-                }, self.kw['filters'])
+                zips.append((zip_files, destination, zip_signature(zip_files)))
+
+        # All zips are made by one task, so that the outdated ones can be made in parallel
+        if zips:
+            manifest_path = os.path.join(self.site.config['CACHE_FOLDER'], 'pkgindex_zip.json')
+            yield utils.apply_filters({
+                'basename': self.name,
+                'name': 'zips',
+                'targets': [destination for files, destination, signature in zips],
+                'actions': [(make_zips, (zips, manifest_path, self.kw['pkgindex_config'].get('zip_processes')))],
+                'clean': True,
+                'uptodate': [utils.config_changed({
+                    'kw': self.kw,
+                    'zips': {destination: signature for files, destination, signature in zips},
+                }, 'pkgindex_zip:zips')],
+            }, self.kw['filters'])
 
         # Generate JSON file of {slug: path_to_zip}
         for dir, data in zip_json.items():
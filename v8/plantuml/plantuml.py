@@ -1,9 +1,15 @@
+import atexit
 import os
+import re
+import selectors
 import subprocess
+import threading
+import time
+import uuid
 from itertools import chain
 from logging import DEBUG
 from pathlib import Path
-from typing import Optional, Sequence, Tuple
+from typing import Dict, Optional, Sequence, Tuple
 
 from nikola import utils
 from nikola.log import get_logger
@@ -21,6 +27,10 @@ DEFAULT_PLANTUML_FILES = (
 
 DEFAULT_PLANTUML_CONTINUE_AFTER_FAILURE = False
 
+DEFAULT_PLANTUML_PERSISTENT = False
+
+DEFAULT_PLANTUML_PERSISTENT_TIMEOUT = 60
+
 
 # TODO when 3.5 support is dropped
 # - Use capture_output arg in subprocess.run()
@@ -99,19 +109,33 @@ class PlantUmlManager:
     def __init__(self, site) -> None:
         self.continue_after_failure = site.config.get('PLANTUML_CONTINUE_AFTER_FAILURE', DEFAULT_PLANTUML_CONTINUE_AFTER_FAILURE)
         self.exec = site.config.get('PLANTUML_EXEC', DEFAULT_PLANTUML_EXEC)
+        self.persistent = site.config.get('PLANTUML_PERSISTENT', DEFAULT_PLANTUML_PERSISTENT) and os.name == 'posix'
+        self.persistent_timeout = site.config.get('PLANTUML_PERSISTENT_TIMEOUT', DEFAULT_PLANTUML_PERSISTENT_TIMEOUT)
         self.logger = get_logger('plantuml_manager')
         if site.config.get('PLANTUML_DEBUG', DEFAULT_PLANTUML_DEBUG):
             self.logger.level = DEBUG
+        self._processes: Dict[Tuple[bytes, ...], "PlantUmlProcess"] = {}
+        self._lock = threading.Lock()
+        if self.persistent:
+            atexit.register(self.close)
 
-    def render(self, source: bytes, args: Sequence[str]) -> Tuple[bytes, Optional[str]]:
-        """Returns (output, error)"""
-
+    def _command(self, args: Sequence[str]):
         def process_arg(arg):
             return arg \
                 .replace('%site_path%', os.getcwd()) \
                 .encode('utf8')
 
-        command = list(map(process_arg, chain(self.exec, args, ['-pipe', '-stdrpt'])))
+        return list(map(process_arg, chain(self.exec, args, ['-pipe', '-stdrpt'])))
+
+    def render(self, source: bytes, args: Sequence[str]) -> Tuple[bytes, Optional[str]]:
+        """Returns (output, error)"""
+
+        if self.persistent:
+            result = self._render_persistent(source, args)
+            if result is not None:
+                return result
+
+        command = self._command(args)
 
         self.logger.debug('render() exec: %s\n%s', command, source)
 
@@ -126,3 +150,141 @@ class PlantUmlManager:
             details = str(result.stderr)
 
         return result.stdout, "PlantUML error (return code {}): {}".format(result.returncode, details)
+
+    def _render_persistent(self, source: bytes, args: Sequence[str]) -> Optional[Tuple[bytes, Optional[str]]]:
+        """Render with a long-lived PlantUML process, returns None if the diagram must be rendered by a new process"""
+
+        starts = _DIAGRAM_START_RE.findall(source)
+        if len(starts) > 1:
+            return None  # Several diagrams give several outputs, only the per-call mode knows how to return them
+        if not starts:
+            # This is what PlantUML does in pipe mode, but it would otherwise wait for more input
+            source = b'@startuml\n' + source.rstrip(b'\r\n') + b'\n@enduml'
+
+        args = list(args)
+        if '-filename' in args:
+            if _FILENAME_RE.search(source):
+                # -filename is needed for %filename() and for resolving relative includes, but it is fixed for the
+                # life of the process, so a process would only render a single file
+                return None
+            # Let diagrams from different files share one process
+            i = args.index('-filename')
+            del args[i:i + 2]
+        command = tuple(self._command(args))
+
+        with self._lock:
+            process = self._processes.get(command)
+            try:
+                if process is None:
+                    process = PlantUmlProcess(command, self.persistent_timeout, self.logger)
+                    self._processes[command] = process
+                self.logger.debug('render() persistent: %s\n%s', command, source)
+                return process.render(source)
+            except Exception as e:  # noqa
+                self.logger.warning('Persistent PlantUML process failed, starting PlantUML for every diagram from now on: %s', e)
+                self.persistent = False
+                self._close_processes()
+                return None
+
+    def _close_processes(self) -> None:
+        for process in self._processes.values():
+            process.close()
+        self._processes.clear()
+
+    def close(self) -> None:
+        """Stop the long-lived PlantUML processes"""
+        with self._lock:
+            self._close_processes()
+
+
+_DIAGRAM_START_RE = re.compile(br'^[ \t]*@start', re.MULTILINE)
+
+# Sources that depend on -filename
+_FILENAME_RE = re.compile(br'%filename|^[ \t]*!(include|import)', re.MULTILINE)
+
+# Lines on stderr that are not errors, e.g. "Picked up JAVA_TOOL_OPTIONS: ..." from the JVM or font warnings
+_STDERR_NOISE_RE = re.compile(br'^\s*$|^Picked up |warning', re.IGNORECASE)
+
+# How long stderr must stay quiet before an error report is taken as complete
+_STDERR_QUIET_SECONDS = 0.1
+
+
+class PlantUmlProcess:
+    """A PlantUML process in pipe mode that renders one diagram after the other"""
+
+    def __init__(self, command: Sequence[bytes], timeout: float, logger) -> None:
+        self.delimiter = '___NIKOLA_PLANTUML_{}___'.format(uuid.uuid4().hex).encode('ascii')
+        self.timeout = timeout
+        self.logger = logger
+        self.process = subprocess.Popen(
+            list(command) + [b'-pipedelimitor', self.delimiter],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        os.set_blocking(self.process.stdout.fileno(), False)
+        os.set_blocking(self.process.stderr.fileno(), False)
+
+    def render(self, source: bytes) -> Tuple[bytes, Optional[str]]:
+        """Returns (output, error), raises an exception if the process does not behave"""
+
+        # Anything left on stderr (e.g. JVM start-up messages) does not belong to this diagram
+        stale = self._read_stderr(0)
+        if stale:
+            self.logger.debug('PlantUML stderr: %s', bytes(stale))
+
+        self.process.stdin.write(source + b'\n')
+        self.process.stdin.flush()
+
+        stdout, stderr = bytearray(), bytearray()
+        end_marker = self.delimiter + b'\n'
+        deadline = time.monotonic() + self.timeout
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stdout, selectors.EVENT_READ, stdout)
+            selector.register(self.process.stderr, selectors.EVENT_READ, stderr)
+            while not stdout.endswith(end_marker) and not stdout.endswith(self.delimiter + b'\r\n'):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Exception('no output after {} seconds'.format(self.timeout))
+                for key, _ in selector.select(remaining):
+                    data = os.read(key.fd, 65536)
+                    if not data:
+                        raise Exception('PlantUML exited with return code {}'.format(self.process.wait()))
+                    key.data.extend(data)
+
+        # PlantUML starts its error report on stderr before it writes the delimiter to stdout, wait for the rest of it
+        stderr.extend(self._read_stderr(0))
+        if stderr:
+            stderr.extend(self._read_stderr(_STDERR_QUIET_SECONDS))
+
+        output = bytes(stdout[:stdout.rindex(self.delimiter)])
+        errors = [line for line in bytes(stderr).splitlines() if not _STDERR_NOISE_RE.search(line)]
+        if not errors:
+            if stderr:
+                self.logger.debug('PlantUML stderr: %s', bytes(stderr))
+            return output, None
+
+        try:
+            details = str(b'\n'.join(errors), encoding='utf8').rstrip()
+        except Exception:  # noqa
+            details = str(b'\n'.join(errors))
+
+        return output, "PlantUML error: {}".format(details)
+
+    def _read_stderr(self, quiet: float) -> bytearray:
+        """Read stderr until nothing arrived for quiet seconds (0 reads what is already there)"""
+        data = bytearray()
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.process.stderr, selectors.EVENT_READ)
+            while selector.select(quiet):
+                chunk = os.read(self.process.stderr.fileno(), 65536)
+                if not chunk:
+                    break
+                data.extend(chunk)
+        return data
+
+    def close(self) -> None:
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:  # noqa
+            self.process.kill()
+            self.process.wait()
@@ -1,5 +1,9 @@
+import hashlib
+import json
+import os
 import re
-from typing import List, Optional
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
 
 from markdown.extensions import Extension
 from markdown.extensions.attr_list import get_attrs
@@ -11,6 +15,10 @@ from nikola.utils import LocaleBorg, req_missing, slugify
 
 DEFAULT_PLANTUML_MARKDOWN_ARGS = []
 
+DEFAULT_PLANTUML_MARKDOWN_CACHE = True
+
+INCLUDE_RE = re.compile(r'^\s*!include(?:_many|_once)?\s+(\S+)', re.MULTILINE)
+
 
 class PlantUmlMarkdownProcessor(FencedBlockPreprocessor):
     def __init__(self, md, config, site, logger):
@@ -20,6 +28,9 @@ class PlantUmlMarkdownProcessor(FencedBlockPreprocessor):
         self._plantuml_markdown_args = list(site.config.get('PLANTUML_MARKDOWN_ARGS', DEFAULT_PLANTUML_MARKDOWN_ARGS))
         self._prefix: List[str] = []
         self._site: Nikola = site
+        self._cache_path: Optional[Path] = None
+        if site.config.get('PLANTUML_MARKDOWN_CACHE', DEFAULT_PLANTUML_MARKDOWN_CACHE):
+            self._cache_path = Path(site.config['CACHE_FOLDER']) / 'plantuml_markdown'
 
     @property
     def plantuml_manager(self):
@@ -38,6 +49,38 @@ class PlantUmlMarkdownProcessor(FencedBlockPreprocessor):
     def reset(self):
         self._prefix = []
 
+    def render(self, source: bytes, args: Sequence[str]) -> Tuple[bytes, Optional[str]]:
+        """Like PlantUmlManager.render() but successful output is cached"""
+        if not self._cache_path:
+            return self.plantuml_manager.render(source, args)
+
+        cache_file = self._cache_path / (self._cache_key(source, args) + '.svg')
+        try:
+            return cache_file.read_bytes(), None
+        except OSError:
+            pass
+
+        output, error = self.plantuml_manager.render(source, args)
+        if not error:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix('.tmp')
+            tmp_file.write_bytes(output)
+            os.replace(str(tmp_file), str(cache_file))
+        return output, error
+
+    def _cache_key(self, source: bytes, args: Sequence[str]) -> str:
+        """Digest of everything the output depends on: PlantUML, its args, the source and the included files"""
+        includes = [a[2:] for a in args if a.startswith('-I') and '*' not in a and '?' not in a]
+        includes.extend(INCLUDE_RE.findall('\n'.join([source.decode('utf8')] + [a[2:] for a in args if a.startswith('-c')])))
+        mtimes = []
+        for include in sorted(set(includes)):
+            try:
+                mtimes.append([include, os.stat(include).st_mtime_ns])
+            except OSError:
+                mtimes.append([include, None])
+        key = json.dumps([self.plantuml_manager.exec, list(args), source.decode('utf8'), mtimes])
+        return hashlib.sha256(key.encode('utf8')).hexdigest()
+
     def run(self, lines):
         def replace(match):
             lang, _id, classes, config = None, '', [], {}
@@ -67,7 +110,7 @@ class PlantUmlMarkdownProcessor(FencedBlockPreprocessor):
                 return div_start() + rendered + ['</div>']
 
             def svg():
-                rendered_bytes, error = self.plantuml_manager.render(
+                rendered_bytes, error = self.render(
                     match.group('code').encode('utf8'),
                     self._plantuml_markdown_args + self._prefix + ['-tsvg']
                 )
@@ -7,6 +7,8 @@ from nikola import metadata_extractors
 import blinker
 import hashlib
 import io
+import json
+import nikola
 import os
 
 __all__ = []
@@ -22,7 +24,6 @@ class Comment(object):
     parent_id = None
 
     # set by creator
-    content = ''  # should be a properly escaped HTML fragment
     author = None
     author_email = None  # should not be published by default
     author_url = None
@@ -50,6 +51,31 @@ class Comment(object):
         self._config = site.config
         self.id = id
         self.parent_id = parent_id
+        self._content = ''
+        self._content_key = None
+        self._compile = None
+
+    @property
+    def content(self):
+        """Return the content, a properly escaped HTML fragment."""
+        if self._compile is not None:
+            self._content = self._compile()
+            self._compile = None
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+        self._content_key = None
+        self._compile = None
+
+    def set_lazy_content(self, key, compile):
+        """Set the content to the result of compile(), which is only called when the content is used.
+
+        key must change whenever the result of compile() would.
+        """
+        self._content_key = key
+        self._compile = compile
 
     def set_utc_date(self, date_utc):
         """Set the date (in UTC). Automatically updates the localized date."""
@@ -62,13 +88,69 @@ class Comment(object):
 
     def hash_values(self):
         """Return tuple of values whose hash to consider for computing the hash of this comment."""
-        return (self.id, self.parent_id, self.content, self.author, self.author_url, self.date_utc)
+        content = self.content if self._content_key is None else self._content_key
+        return (self.id, self.parent_id, content, self.author, self.author_url, self.date_utc)
 
     def __repr__(self):
         """Returns string representation for comment."""
         return '<Comment: {0} for {1}; indent: {2}>'.format(self.id, self._owner, self.indent_levels)
 
 
+class ParsedCommentCache(object):
+    """Metadata and content of comment files, cached on disk between builds.
+
+    Entries are keyed by file name, and only used while the mtime and size
+    of the file stay the same.
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.entries = {}
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data['config'] == config:
+                self.entries = data['entries']
+        except (IOError, ValueError, KeyError):
+            pass
+        self.used = set()
+        self.changed = False
+
+    def get(self, filename, compute):
+        """Return metadata dict and content of filename, calling compute() if the file changed."""
+        self.used.add(filename)
+        stat = os.stat(filename)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        entry = self.entries.get(filename)
+        if entry is None or entry['signature'] != signature:
+            meta, content = compute()
+            self.entries.pop(filename, None)
+            self.changed = True
+            try:
+                entry = {'signature': signature, 'meta': json.loads(json.dumps(meta)), 'content': content}
+            except TypeError:
+                # Metadata which cannot be stored is read again next time
+                return meta, content
+            self.entries[filename] = entry
+        return dict(entry['meta']), entry['content']
+
+    def save(self):
+        """Write the cache, dropping entries that were not used."""
+        for filename in list(self.entries):
+            if filename not in self.used:
+                del self.entries[filename]
+                self.changed = True
+        if not self.changed:
+            return
+        utils.makedirs(os.path.dirname(self.path))
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'config': self.config, 'entries': self.entries}, ensure_ascii=False))
+        os.replace(tmp_path, self.path)
+        self.changed = False
+
+
 class StaticComments(SignalHandler):
     """Add static comments to posts."""
 
@@ -95,6 +177,36 @@ class StaticComments(SignalHandler):
                 _LOGGER.error("Page compiler plugin '{0}' provides no compile_string or compile_to_string function (comment {1})!".format(compiler_name, filename))
                 exit(1)
 
+    def _content_key(self, compiler_name, content, filename):
+        """Return the key of the compiled content in the cache."""
+        compiler = self.site.compilers.get(compiler_name)
+        key = json.dumps([
+            nikola.__version__,
+            compiler_name,
+            sorted(str(dep) for dep in getattr(compiler, 'config_dependencies', [])),
+            filename,
+            content,
+        ])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _compile_content_cached(self, compiler_name, content, filename, key):
+        """Compile comment content, or take it from the cache."""
+        if not self._cache_folder:
+            return self._compile_content(compiler_name, content, filename)
+        path = os.path.join(self._cache_folder, key + '.html')
+        try:
+            with io.open(path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except IOError:
+            pass
+        result = self._compile_content(compiler_name, content, filename)
+        utils.makedirs(self._cache_folder)
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with io.open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(result)
+        os.replace(tmp_path, path)
+        return result
+
     def _parse_comment(self, filename):
         """Read a comment from a file, and return metadata dict and content."""
         with io.open(filename, "r", encoding="utf-8-sig") as f:
@@ -132,7 +244,10 @@ class StaticComments(SignalHandler):
 
     def _read_comment(self, filename, owner, id):
         """Read a comment from a file."""
-        meta, content = self._parse_comment(filename)
+        if self._parse_cache is not None:
+            meta, content = self._parse_cache.get(filename, lambda: self._parse_comment(filename))
+        else:
+            meta, content = self._parse_comment(filename)
         # create comment object
         comment = Comment(self.site, owner, id)
         # parse headers
@@ -171,32 +286,49 @@ class StaticComments(SignalHandler):
         if compiler_name is None:
             _LOGGER.warn("Comment file '{0}' doesn't specify compiler! Using default 'wordpress'.".format(filename))
             compiler_name = 'wordpress'
-        # compile content
-        comment.content = self._compile_content(compiler_name, content, filename)
+        if compiler_name != 'html' and compiler_name not in self.site.compilers:
+            _LOGGER.error("Cannot find page compiler '{0}' for comment {1}!".format(compiler_name, filename))
+            exit(1)
+        # compile content when it is used, which is only when the post is rendered again
+        if compiler_name == 'html':
+            comment.content = content
+        else:
+            key = self._content_key(compiler_name, content, filename)
+            comment.set_lazy_content(key, lambda: self._compile_content_cached(compiler_name, content, filename, key))
         return comment
 
+    def _index_comments(self, path):
+        """Return the comment files in a directory, as a dict mapping post file names to (filename, comment ID) lists."""
+        index = self._comment_index.get(path)
+        if index is not None:
+            return index
+        index = {}
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            entries = []
+        for entry in entries:
+            if not entry.name.endswith('.wpcomment') or entry.is_dir():
+                continue
+            file, dot, id = entry.name[:-len('.wpcomment')].rpartition('.')
+            if dot and file:
+                index.setdefault(file, []).append((entry.name, id))
+        self._comment_index[path] = index
+        return index
+
     def _scan_comments(self, path, file, owner):
         """Scan comments for post."""
         comments = {}
-        for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
-            if dirpath != path:
-                continue
-            for filename in filenames:
-                if not filename.startswith(file + '.'):
-                    continue
-                rest = filename[len(file):].split('.')
-                if len(rest) != 3:
-                    continue
-                if rest[0] != '' or rest[2] != 'wpcomment':
-                    continue
-                try:
-                    comment = self._read_comment(os.path.join(dirpath, filename), owner, rest[1])
-                    if comment is not None:
-                        # _LOGGER.info("Found comment '{0}' with ID {1}".format(os.path.join(dirpath, filename), comment.id))
-                        comments[comment.id] = comment
-                except ValueError as e:
-                    _LOGGER.warn("Exception '{1}' while reading file '{0}'!".format(os.path.join(dirpath, filename), e))
-                    pass
+        for filename, id in self._index_comments(path).get(file, []):
+            filename = os.path.join(path, filename)
+            try:
+                comment = self._read_comment(filename, owner, id)
+                if comment is not None:
+                    # _LOGGER.info("Found comment '{0}' with ID {1}".format(filename, comment.id))
+                    comments[comment.id] = comment
+            except ValueError as e:
+                _LOGGER.warn("Exception '{1}' while reading file '{0}'!".format(filename, e))
+                pass
         return sorted(list(comments.values()), key=lambda c: c.date_utc)
 
     def _hash_post_comments(self, post):
@@ -250,11 +382,29 @@ class StaticComments(SignalHandler):
     def _process_posts_and_pages(self, site):
         """Add comments to all posts."""
         if site is self.site:
+            # Every directory is listed once per scan
+            self._comment_index = {}
+            if self._cache_folder:
+                self._parse_cache = ParsedCommentCache(os.path.join(self._cache_folder, 'comments.json'), self._parse_cache_config())
             for post in site.timeline:
                 self._process_post_object(post)
+            if self._parse_cache is not None:
+                self._parse_cache.save()
+            self._parse_cache = None
+            self._comment_index = {}
+
+    def _parse_cache_config(self):
+        """Describe what parsing comment files depends on."""
+        return [nikola.__version__, sorted(extractor.name for extractor in self.site.metadata_extractors_by['name'].values())]
 
     def set_site(self, site):
         """Set Nikola site object."""
         super(StaticComments, self).set_site(site)
+        self._comment_index = {}
+        self._parse_cache = None
+        if site.config.get('STATIC_COMMENTS_CACHE', True):
+            self._cache_folder = os.path.join(site.config['CACHE_FOLDER'], 'static_comments')
+        else:
+            self._cache_folder = None
         site._GLOBAL_CONTEXT['site_has_static_comments'] = True
         blinker.signal("scanned").connect(self._process_posts_and_pages)
@@ -26,6 +26,11 @@
 
 import requests
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urljoin, urlsplit
 
 from blinker import signal
 from lxml import html
@@ -33,6 +38,18 @@ from lxml import html
 from nikola.utils import get_logger, STDERR_HANDLER
 from nikola.plugin_categories import SignalHandler
 
+# How many links are processed at the same time
+DEFAULT_WEBMENTIONS_THREADS = 8
+
+# How many requests may be made to the same host at the same time
+DEFAULT_WEBMENTIONS_PER_HOST = 2
+
+# How long (in seconds) discovered endpoints, or the lack of one, are remembered
+DEFAULT_WEBMENTIONS_ENDPOINT_TTL = 86400
+
+# The state key the discovered endpoints are kept in
+ENDPOINTS_KEY = "webmention-endpoints"
+
 
 class WebMentions(SignalHandler):
     name = "webmentions"
@@ -45,6 +62,15 @@ class WebMentions(SignalHandler):
     def set_site(self, site):
         self.site = site
         self.logger = get_logger(self.name, STDERR_HANDLER)
+        self.threads = site.config.get("WEBMENTIONS_THREADS", DEFAULT_WEBMENTIONS_THREADS)
+        self.per_host = site.config.get("WEBMENTIONS_PER_HOST", DEFAULT_WEBMENTIONS_PER_HOST)
+        self.endpoint_ttl = site.config.get("WEBMENTIONS_ENDPOINT_TTL", DEFAULT_WEBMENTIONS_ENDPOINT_TTL)
+
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._discovery_locks = {}
+        self._host_semaphores = {}
+        self._local = threading.local()
 
         # Bind to the signal
         ready = signal("deployed")
@@ -64,6 +90,12 @@ class WebMentions(SignalHandler):
 
         """
 
+        self.endpoints = self.load_endpoints()
+
+        # Links to send mentions for, as (state key, our url, linked url)
+        jobs = []
+        observed = {}
+
         # Iterate over each post listed in "deployed"
         for post in event["deployed"]:
             title = post.title()
@@ -89,36 +121,81 @@ class WebMentions(SignalHandler):
             if not observed_links:
                 observed_links = []
 
-            # Extract links from within the rendered page
-            links = self.extract_links(text)
-
-            # Set up a requests session so that HTTP keep-alives can be used where possible
-            # this reduces connection overhead etc
-            session = requests.session()
-
-            # Set the user-agent for all requests in this session
-            session.headers.update({"User-Agent": "Nikola SSG Webmention plugin"})
+            observed[key] = observed_links
 
-            # Send mentions for each
-            for dest in links:
+            # Extract links from within the rendered page
+            for dest in self.extract_links(text):
 
                 # See whether a webmention's already been sent for this page and url
                 # means we won't reping links every time a post is updated
-                if dest in observed_links:
+                if dest not in observed_links:
+                    jobs.append((key, link, dest))
+
+        # Send mentions for all links at once, send_webmention() keeps the number
+        # of requests to a single host at bay
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [
+                (key, dest, executor.submit(self.send_webmention, link, dest, None))
+                for key, link, dest in jobs
+            ]
+            for key, dest, future in futures:
+                try:
+                    sent, has_mentions = future.result()
+                except requests.RequestException as e:
+                    self.logger.warning("Failed to send WebMention for {0}: {1}".format(dest, e))
                     continue
 
-                sent, has_mentions = self.send_webmention(link, dest, session)
-
                 # We want to cache two categories of link
                 #
                 # Has webmentions, sent successfully
                 # Does not have webmentions
 
                 if sent or not has_mentions:
-                    observed_links.append(dest)
+                    observed[key].append(dest)
 
-            # Now that all links have been processed, save the state
+        # Now that all links have been processed, save the state
+        for key, observed_links in observed.items():
             self.site.state.set(key, observed_links)
+        self.save_endpoints()
+
+    def load_endpoints(self):
+        """Return the endpoints discovered by earlier deploys that did not expire"""
+        now = time.time()
+        return {
+            dest: entry
+            for dest, entry in (self.site.state.get(ENDPOINTS_KEY) or {}).items()
+            if now - entry["time"] < self.endpoint_ttl
+        }
+
+    def save_endpoints(self):
+        """Store the discovered endpoints in the site state, unless they are not remembered"""
+        if self.endpoint_ttl <= 0:
+            return
+        self.site.state.set(ENDPOINTS_KEY, self.endpoints)
+
+    def get_session(self):
+        """Return the requests session of the current thread
+
+        Sessions let HTTP keep-alives be used where possible, this reduces connection overhead etc
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.session()
+
+            # Set the user-agent for all requests in this session
+            session.headers.update({"User-Agent": "Nikola SSG Webmention plugin"})
+        return session
+
+    @contextmanager
+    def host_limit(self, url):
+        """Wait until less than WEBMENTIONS_PER_HOST requests are made to the host of url"""
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host)
+        with semaphore:
+            yield
 
     def extract_links(self, post_text):
         """Receive a HTML post, iterate through it looking for links out and extract the relevant URLs
@@ -141,7 +218,7 @@ class WebMentions(SignalHandler):
                 xpath = "//{0}[@{1}]".format(element, attrib)
                 for match in tree.xpath(xpath):
                     # Remove URL fragments
-                    u = match.get("href").split("#")[0]
+                    u = match.get(attrib).split("#")[0]
                     urls.append(u)
 
         # Make the list unique
@@ -159,7 +236,10 @@ class WebMentions(SignalHandler):
 
         If either is found (header takes precedence) then send a webmention to
         the specified endpoint
+
+        session defaults to the session of the current thread
         """
+        session = session or self.get_session()
 
         # don't ping absolute links to own domain
         if dest.startswith(self.site.config["SITE_URL"]):
@@ -170,7 +250,7 @@ class WebMentions(SignalHandler):
             return False, False
 
         # Check for a webmention endpoint
-        ep = self.get_webmention_endpoint(dest, session)
+        ep = self.find_webmention_endpoint(dest, session)
 
         if not ep:
             return False, False
@@ -184,13 +264,40 @@ class WebMentions(SignalHandler):
         data = {"source": ownlink, "target": dest}
 
         self.logger.info("Sending WebMention to {0} for {1}".format(ep, dest))
-        r = session.post(ep, data=data)
+        with self.host_limit(ep):
+            r = session.post(ep, data=data)
         if r.status_code not in [200, 201, 202, 204]:
             self.logger.info("Received {0}".format(r.status_code))
             return False, True
 
         return True, True
 
+    def find_webmention_endpoint(self, dest, session):
+        """Return the webmention endpoint of dest, or False if it has none
+
+        The result of get_webmention_endpoint() is remembered (in the site state) for
+        WEBMENTIONS_ENDPOINT_TTL seconds, so links to the same page from several posts,
+        or in later deploys, don't discover it again.
+        """
+        with self._lock:
+            lock = self._discovery_locks.get(dest)
+            if lock is None:
+                lock = self._discovery_locks[dest] = threading.Lock()
+
+        # Only one thread discovers the endpoint of dest, the others wait for it
+        with lock:
+            entry = self.endpoints.get(dest)
+            if entry and time.time() - entry["time"] < self.endpoint_ttl:
+                return entry["endpoint"]
+
+            with self.host_limit(dest):
+                ep = self.get_webmention_endpoint(dest, session)
+
+            # Endpoints may be relative to the page
+            ep = urljoin(dest, ep) if ep else False
+            self.endpoints[dest] = {"endpoint": ep, "time": time.time()}
+            return ep
+
     def get_webmention_endpoint(self, dest, session):
         """Place a request to the linked target and
         look for information about webmentions